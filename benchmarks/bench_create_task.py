@@ -0,0 +1,99 @@
+"""Benchmark: create_task latency for media albums
+
+Runs create_task against a stand-in bucket with fixed per-request latency
+and finite upload bandwidth, and compares it with the previous serial flow
+(upload each file, then write the task, then each index marker) for albums
+of 1, 5 and 10 photos.
+
+Run with: ENVIRONMENT=development python -m benchmarks.bench_create_task
+"""
+import asyncio
+import time
+
+from src.models.task import Task, TelegramUser, MediaItem, MediaType
+from src.services.task_service import TaskService
+
+REQUEST_LATENCY = 0.03       # seconds per GCS request
+UPLOAD_BANDWIDTH = 20e6      # bytes per second per upload
+PHOTO_BYTES = 400_000
+ALBUM_SIZES = (1, 5, 10)
+RUNS = 5
+
+
+class LatencyGCS:
+    """Just enough of GCSClient, with simulated request latency"""
+    
+    def __init__(self):
+        self.objects = {}
+        self.uid = 0
+    
+    async def get_next_uid(self) -> str:
+        await asyncio.sleep(REQUEST_LATENCY)
+        self.uid += 1
+        return f"SJ{self.uid:04d}"
+    
+    async def upload_media(self, file_data: bytes, path: str, content_type: str) -> bool:
+        await asyncio.sleep(REQUEST_LATENCY + len(file_data) / UPLOAD_BANDWIDTH)
+        self.objects[path] = file_data
+        return True
+    
+    async def write_json(self, path, data, if_generation_match=None) -> bool:
+        await asyncio.sleep(REQUEST_LATENCY)
+        self.objects[path] = data
+        return True
+    
+    async def read_json_with_generation(self, path):
+        await asyncio.sleep(REQUEST_LATENCY)
+        return self.objects.get(path), 1 if path in self.objects else 0
+    
+    async def create_index_marker(self, path: str) -> bool:
+        await asyncio.sleep(REQUEST_LATENCY)
+        self.objects[path] = b""
+        return True
+
+
+async def create_task_serial(service: TaskService, title: str, created_by: TelegramUser, media_files):
+    """The create flow before pipelining, for comparison"""
+    uid = await service.gcs.get_next_uid()
+    task = Task(uid=uid, title=title, description="", created_by=created_by)
+    for info in media_files:
+        path = f"media/{uid}/{info['filename']}"
+        if await service.gcs.upload_media(info['data'], path, info['content_type']):
+            task.media.append(MediaItem(type=MediaType(info['type']), path=path, metadata={}))
+    await service.gcs.write_json(f"tasks/{uid}.json", task.to_dict(), if_generation_match=0)
+    for path in service._task_index_paths(task):
+        await service.gcs.create_index_marker(path)
+    await service.counters.record_change(None, service._counter_state(task))
+    return task
+
+
+async def measure(create, album_size: int) -> float:
+    service = TaskService(LatencyGCS())
+    album = [
+        {"filename": f"{i}.jpg", "data": b"x" * PHOTO_BYTES, "content_type": "image/jpeg", "type": "photo"}
+        for i in range(album_size)
+    ]
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await create(service, album)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+async def main():
+    user = TelegramUser(telegram_id=1, name="Bench")
+    flows = {
+        "serial": lambda service, album: create_task_serial(service, "Album", user, album),
+        "pipelined": lambda service, album: service.create_task("Album", "", user, media_files=album),
+    }
+    for album_size in ALBUM_SIZES:
+        results = {name: await measure(create, album_size) for name, create in flows.items()}
+        print(
+            f"album of {album_size:>2}: serial {results['serial'] * 1000:6.0f} ms, "
+            f"pipelined {results['pipelined'] * 1000:6.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
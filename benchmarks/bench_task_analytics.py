@@ -0,0 +1,92 @@
+"""Benchmark: status-duration analytics over a large task set
+
+Builds flattened histories for TASKS tasks and times the vectorized
+summary against a straightforward per-entry Python loop computing the
+same per-status durations and cycle times.
+
+Run with: ENVIRONMENT=development python -m benchmarks.bench_task_analytics
+"""
+import random
+import statistics
+import time
+
+import numpy as np
+
+from src.models.task import TaskStatus, Priority
+from src.services.task_analytics import summarize, STATUS_CODES, PRIORITY_CODES, STATUSES
+
+TASKS = 100_000
+HOUR = 3600.0
+FLOW = [TaskStatus.IN_PROGRESS, TaskStatus.ON_HOLD, TaskStatus.IN_PROGRESS, TaskStatus.DONE]
+
+
+def build_rows(count: int):
+    rng = random.Random(1)
+    rows = []
+    for i in range(count):
+        steps = FLOW[:rng.randint(0, len(FLOW))]
+        t = rng.uniform(0, 1000) * HOUR
+        statuses, times = [STATUS_CODES[TaskStatus.NEW]], [t]
+        for status in steps:
+            t += rng.uniform(0.1, 48) * HOUR
+            statuses.append(STATUS_CODES[status])
+            times.append(t)
+        rows.append((
+            np.array(statuses, dtype=np.int8),
+            np.array(times),
+            PRIORITY_CODES[list(Priority)[i % 4]],
+            (100 + i % 50,)
+        ))
+    return rows
+
+
+def summarize_loop(rows, now: float):
+    """Per-entry reference implementation of the same aggregates"""
+    per_status = {}
+    groups = {}
+    on_hold_code = STATUS_CODES[TaskStatus.ON_HOLD]
+    for statuses, times, priority, assignees in rows:
+        spent = {}
+        cycle = None
+        for i in range(len(statuses)):
+            status = int(statuses[i])
+            if i + 1 < len(statuses):
+                end = times[i + 1]
+            elif STATUSES[status] in (TaskStatus.DONE, TaskStatus.CANCELED):
+                end = times[i]
+            else:
+                end = now
+            spent[status] = spent.get(status, 0) + end - times[i]
+            if STATUSES[status] == TaskStatus.DONE and cycle is None:
+                cycle = times[i] - times[0]
+        for status, seconds in spent.items():
+            per_status.setdefault(status, []).append(seconds)
+        for key in [("all",), ("priority", priority)] + [("assignee", a) for a in assignees]:
+            cycles, holds = groups.setdefault(key, ([], []))
+            if cycle is not None:
+                cycles.append(cycle)
+            if on_hold_code in spent:
+                holds.append(spent[on_hold_code])
+    
+    def stats(values):
+        if len(values) < 2:
+            return None
+        return statistics.fmean(values), statistics.quantiles(values, n=20)
+    
+    return (
+        {status: stats(values) for status, values in per_status.items()},
+        {key: (stats(cycles), stats(holds)) for key, (cycles, holds) in groups.items()}
+    )
+
+
+def main():
+    rows = build_rows(TASKS)
+    now = 2000 * HOUR
+    for name, fn in (("loop", summarize_loop), ("vectorized", summarize)):
+        started = time.perf_counter()
+        fn(rows, now)
+        print(f"{name:>10}: {(time.perf_counter() - started) * 1000:8.1f} ms for {TASKS:,} tasks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Microbenchmark: Task decoding on list/search style access
+
+Compares decoding every section of a large task (the old eager behaviour)
+with the lazy view, for the access pattern used by list and search paths
+(uid/title/status plus to_dict of the untouched document).
+
+Run with: python -m benchmarks.bench_task_decode
+"""
+import timeit
+from datetime import datetime, timezone
+
+from src.models.task import Task, TaskStatus, TelegramUser, MediaItem, MediaType
+
+
+def build_task_dict(notes: int = 200, history: int = 100, media: int = 10) -> dict:
+    author = TelegramUser(telegram_id=1, name="Author", username="author")
+    task = Task(uid="SJ0001", title="Large task", description="x" * 500, created_by=author)
+    for i in range(notes):
+        task.add_note(f"note {i} " + "y" * 100, author)
+    statuses = [TaskStatus.IN_PROGRESS, TaskStatus.ON_HOLD]
+    for i in range(history):
+        task.change_status(statuses[i % 2], author, reason="bench")
+    for i in range(media):
+        task.media.append(MediaItem(
+            type=MediaType.PHOTO,
+            path=f"media/SJ0001/{i}.jpg",
+            metadata={"filename": f"{i}.jpg", "size": 1024},
+            delete_after=datetime.now(timezone.utc)
+        ))
+    return task.to_dict()
+
+
+def decode_eager(data: dict):
+    task = Task.from_dict(data)
+    # Touch every section, as the eager from_dict used to
+    task.created_by, task.assignees, task.notes, task.media
+    task.status_history, task.created_at, task.updated_at
+    return task.uid, task.title, task.status, task.to_dict()
+
+
+def decode_lazy(data: dict):
+    task = Task.from_dict(data)
+    return task.uid, task.title, task.status, task.to_dict()
+
+
+def main():
+    data = build_task_dict()
+    runs = 200
+    for name, fn in (("eager", decode_eager), ("lazy", decode_lazy)):
+        seconds = min(timeit.repeat(lambda: fn(data), number=runs, repeat=5))
+        print(f"{name:>5}: {seconds / runs * 1e6:9.1f} us per task")
+
+
+if __name__ == "__main__":
+    main()
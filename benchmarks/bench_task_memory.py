@@ -0,0 +1,65 @@
+"""Memory benchmark: bytes per cached task
+
+Decodes a batch of stored task documents the way a cache would hold them
+(every section decoded) and reports the traced allocation per task.
+The raw documents are built before tracing starts, so only the decoded
+objects are counted.
+
+Run with: python -m benchmarks.bench_task_memory
+"""
+import gc
+import json
+import tracemalloc
+
+from src.models.task import Task, TaskStatus, TelegramUser, MediaItem, MediaType
+
+TASKS = 1000
+CREW = [TelegramUser(telegram_id=100 + i, name=f"Worker {i}", username=f"worker{i}") for i in range(8)]
+
+
+def build_task_dict(i: int) -> dict:
+    task = Task(uid=f"SJ{i:04d}", title=f"Task {i}", description="Fix the thing", created_by=CREW[i % 8])
+    for a in range(3):
+        task.add_assignee(CREW[(i + a) % 8])
+    for n in range(10):
+        task.add_note(f"note {n}", CREW[(i + n) % 8])
+    statuses = [TaskStatus.IN_PROGRESS, TaskStatus.ON_HOLD]
+    for h in range(6):
+        task.change_status(statuses[h % 2], CREW[(i + h) % 8], reason="bench")
+    for m in range(2):
+        task.media.append(MediaItem(
+            type=MediaType.PHOTO,
+            path=f"media/SJ{i:04d}/{m}.jpg",
+            metadata={"filename": f"{m}.jpg", "size": 1024}
+        ))
+    # Round-trip through JSON so no objects are shared with the builders
+    return json.loads(json.dumps(task.to_dict()))
+
+
+def decode_all(documents):
+    tasks = []
+    for data in documents:
+        task = Task.from_dict(data)
+        task.created_by, task.assignees, task.notes, task.media
+        task.status_history, task.created_at, task.updated_at
+        task._raw = {}
+        tasks.append(task)
+    return tasks
+
+
+def main():
+    documents = [build_task_dict(i) for i in range(TASKS)]
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    cache = decode_all(documents)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{len(cache)} decoded tasks: {total / len(cache):,.0f} bytes per cached task")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Storage benchmark: task document size with embedded users vs references
+
+Builds history-heavy tasks (full inline notes and status history, several
+assignees) and compares the stored JSON size of the default format with
+the TASK_USER_REFS format, where every user is kept as {"telegramId"}.
+Spilled segments are left out; their entries shrink the same way.
+
+Run with: python -m benchmarks.bench_task_user_refs
+"""
+import json
+
+from src.config import settings
+from src.models.task import Task, TaskStatus, TelegramUser, compact_user_refs
+
+TASKS = 200
+CREW = [
+    TelegramUser(telegram_id=100000000 + i, name=f"Maintenance Worker {i}", username=f"maint_worker_{i}")
+    for i in range(8)
+]
+
+
+def build_task_dict(i: int) -> dict:
+    task = Task(uid=f"SJ{i:04d}", title=f"Task {i}", description="Replace the pump seal", created_by=CREW[i % 8])
+    for a in range(3):
+        task.add_assignee(CREW[(i + a) % 8])
+    for n in range(settings.TASK_INLINE_ENTRIES + settings.TASK_SEGMENT_SIZE - 1):
+        task.add_note(f"note {n}", CREW[(i + n) % 8])
+    statuses = [TaskStatus.IN_PROGRESS, TaskStatus.ON_HOLD]
+    for h in range(settings.TASK_INLINE_ENTRIES + settings.TASK_SEGMENT_SIZE - 1):
+        task.change_status(statuses[h % 2], CREW[(i + h) % 8], reason="waiting for parts")
+    return task.to_dict()
+
+
+def stored_size(document: dict) -> int:
+    return len(json.dumps(document, default=str).encode())
+
+
+def main():
+    documents = [build_task_dict(i) for i in range(TASKS)]
+
+    embedded = sum(stored_size(document) for document in documents)
+    references = sum(stored_size(compact_user_refs(document)) for document in documents)
+
+    print(f"{TASKS} history-heavy tasks, {len(documents[0]['notes'])} notes "
+          f"and {len(documents[0]['statusHistory'])} history entries inline")
+    print(f"embedded users:  {embedded / TASKS:,.0f} bytes per task")
+    print(f"user references: {references / TASKS:,.0f} bytes per task "
+          f"({1 - references / embedded:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
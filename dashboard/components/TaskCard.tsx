@@ -129,10 +129,10 @@ export function TaskCard({ task, user, onUpdate }: TaskCardProps) {
                 <span>{task.media.length}</span>
               </div>
             )}
-            {task.notes.length > 0 && (
+            {(task.notesCount ?? task.notes.length) > 0 && (
               <div className="flex items-center">
                 <MessageSquare className="w-3 h-3 mr-1" />
-                <span>{task.notes.length}</span>
+                <span>{task.notesCount ?? task.notes.length}</span>
               </div>
             )}
           </div>
@@ -1,6 +1,6 @@
 'use client'
 
-import { useState } from 'react'
+import { useEffect, useState } from 'react'
 import { format } from 'date-fns'
 import { 
   X, 
@@ -32,6 +32,18 @@ export function TaskDetailModal({ task, user, onClose, onUpdate }: TaskDetailMod
     priority: task.priority
   })
   const [newNote, setNewNote] = useState('')
+  const [notes, setNotes] = useState(task.notes)
+  const notesCount = task.notesCount ?? task.notes.length
+
+  // Older notes are spilled out of the task document; load the full list
+  useEffect(() => {
+    setNotes(task.notes)
+    if (notesCount <= task.notes.length) return
+
+    apiService.getTaskNotes(task.uid)
+      .then(result => setNotes(result.notes))
+      .catch(error => console.error('Failed to load notes:', error))
+  }, [task.uid, task.notes, notesCount])
 
   const isAdmin = user.role === 'admin'
 
@@ -303,7 +315,7 @@ export function TaskDetailModal({ task, user, onClose, onUpdate }: TaskDetailMod
           <div>
             <div className="flex items-center justify-between mb-2">
               <h3 className="text-sm font-medium text-gray-700">
-                Notes ({task.notes.length})
+                Notes ({notesCount})
               </h3>
             </div>
             
@@ -330,10 +342,10 @@ export function TaskDetailModal({ task, user, onClose, onUpdate }: TaskDetailMod
             
             {/* Notes List */}
             <div className="space-y-3">
-              {task.notes.length === 0 ? (
+              {notes.length === 0 ? (
                 <div className="text-gray-500 text-sm">No notes yet</div>
               ) : (
-                task.notes.map(note => (
+                notes.map(note => (
                   <div key={note.id} className="border border-gray-200 rounded-lg p-3">
                     <div className="flex items-center justify-between mb-2">
                       <div className="flex items-center space-x-2">
@@ -44,6 +44,9 @@ export interface Task {
     changedAt: string
     reason?: string
   }>
+  // Totals including notes and history entries spilled out of the task document
+  notesCount?: number
+  statusHistoryCount?: number
   onHoldReason?: string
   timestamps: {
     createdAt: string
@@ -110,6 +113,10 @@ class ApiService {
     return this.request<Task>(`/tasks/${uid}`)
   }
 
+  async getTaskNotes(uid: string): Promise<{ notes: Task['notes']; total: number }> {
+    return this.request<{ notes: Task['notes']; total: number }>(`/tasks/${uid}/notes`)
+  }
+
   async updateTask(uid: string, updates: Partial<Task>): Promise<Task> {
     return this.request<Task>(`/tasks/${uid}`, {
       method: 'PATCH',
@@ -138,6 +145,25 @@ class ApiService {
     })
   }
 
+  async bulkUpdateTasks(request: {
+    uids: string[]
+    operation: 'set_status' | 'set_priority' | 'assign' | 'unassign' | 'set_assignees'
+    status?: string
+    reason?: string
+    priority?: string
+    assignee_ids?: number[]
+  }): Promise<{
+    operation: string
+    succeeded: number
+    failed: number
+    results: { uid: string; ok: boolean; error: string | null }[]
+  }> {
+    return this.request('/tasks:bulk', {
+      method: 'POST',
+      body: JSON.stringify(request),
+    })
+  }
+
   // User endpoints
   async getUsers(): Promise<User[]> {
     return this.request<User[]>('/users')
@@ -174,6 +200,19 @@ class ApiService {
     return response.blob()
   }
 
+  async exportTasks(params?: Record<string, string>): Promise<Blob> {
+    const query = params ? `?${new URLSearchParams(params)}` : ''
+    const response = await fetch(`${this.baseUrl}/api/tasks/export${query}`, {
+      headers: authService.getAuthHeaders(),
+    })
+
+    if (!response.ok) {
+      throw new Error('Export failed')
+    }
+
+    return response.blob()
+  }
+
   // Media endpoints
   getMediaUrl(uid: string, filename: string): string {
     const token = authService.getToken()
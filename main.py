@@ -10,9 +10,12 @@ from telegram import Update
 from telegram.ext import Application
 
 from src.bot.handlers import setup_bot_handlers
+from src.bot.update_dedup import UpdateDeduplicator
 from src.api.routes import router as api_router
 from src.auth.middleware import jwt_middleware
 from src.config import settings
+from src.services.task_service import TaskService
+from src.services.user_cache import UserCache
 from src.storage.gcs_client import GCSClient
 
 logging.basicConfig(
@@ -33,9 +36,20 @@ async def lifespan(app: FastAPI):
     gcs_client = GCSClient(settings.BUCKET_NAME)
     app.state.gcs_client = gcs_client
     
+    # Shared task service so API and bot mutations of a task coalesce
+    task_service = TaskService(gcs_client)
+    app.state.task_service = task_service
+    
+    # User documents cached for the bot and API alike
+    user_cache = UserCache()
+    app.state.user_cache = user_cache
+    
+    # Telegram redelivers slow updates; process each update_id once
+    app.state.update_dedup = UpdateDeduplicator(gcs_client)
+    
     # Initialize Telegram bot
     bot_app = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
-    setup_bot_handlers(bot_app, gcs_client)
+    setup_bot_handlers(bot_app, gcs_client, task_service, user_cache)
     
     try:
         await bot_app.initialize()
@@ -80,13 +94,25 @@ async def telegram_webhook(request: Request):
     """Handle Telegram webhook updates"""
     try:
         body = await request.json()
-        logger.info(f"Received webhook: {body.get('update_id', 'unknown')}")
+        update_id = body.get('update_id')
+        logger.info(f"Received webhook: {update_id if update_id is not None else 'unknown'}")
+        
+        update_dedup = request.app.state.update_dedup
+        if update_id is not None and not await update_dedup.claim(update_id):
+            # Already handled (or in progress); acknowledge so Telegram stops retrying
+            return {"ok": True, "duplicate": True}
         
         update = Update.de_json(body, bot_app.bot)
         if not update:
             raise HTTPException(status_code=400, detail="Invalid update")
-            
-        await bot_app.process_update(update)
+        
+        try:
+            await bot_app.process_update(update)
+        except Exception:
+            # Let Telegram's redelivery retry the update
+            if update_id is not None:
+                await update_dedup.release(update_id)
+            raise
         return {"ok": True}
         
     except Exception as e:
@@ -48,6 +48,9 @@ export interface Task {
     changedAt: string
     reason?: string
   }>
+  // Totals including notes and history entries spilled out of the task document
+  notesCount?: number
+  statusHistoryCount?: number
   onHoldReason?: string
   timestamps: {
     createdAt: string
@@ -33,7 +33,8 @@ export function TaskDetail({ task, onBack }: TaskDetailProps) {
   const loadFullTask = async () => {
     try {
       setLoading(true)
-      const taskData = await ApiService.getTask(task.uid)
+      // full=true includes notes and history spilled out of the task document
+      const taskData = await ApiService.getTask(task.uid, true)
       setFullTask(taskData)
     } catch (error) {
       console.error('Failed to load full task:', error)
@@ -222,7 +223,7 @@ export function TaskDetail({ task, onBack }: TaskDetailProps) {
         {/* Notes */}
         <div>
           <h3 className="text-sm font-medium mb-2" style={{ color: 'var(--tg-theme-text-color, #000000)' }}>
-            Notes ({fullTask.notes.length})
+            Notes ({fullTask.notesCount ?? fullTask.notes.length})
           </h3>
           
           {fullTask.notes.length === 0 ? (
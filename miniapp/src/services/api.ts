@@ -9,6 +9,8 @@ export interface Task {
   notes: any[]
   media: any[]
   statusHistory: any[]
+  notesCount?: number
+  statusHistoryCount?: number
   onHoldReason?: string
   timestamps: {
     createdAt: string
@@ -60,8 +62,8 @@ export class ApiService {
     return this.request<{ tasks: Task[]; total: number }>(endpoint)
   }
 
-  static async getTask(uid: string): Promise<Task> {
-    return this.request<Task>(`/tasks/${uid}`)
+  static async getTask(uid: string, full = false): Promise<Task> {
+    return this.request<Task>(`/tasks/${uid}${full ? '?full=true' : ''}`)
   }
 
   static getMediaUrl(uid: string, filename: string): string {
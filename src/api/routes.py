@@ -1,15 +1,17 @@
 import secrets
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Request, HTTPException, Depends, Query, File, UploadFile, Response
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, File, UploadFile
 from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from src.auth.middleware import require_admin, get_current_user
 from src.auth.jwt_handler import jwt_handler
 from src.services.task_service import TaskService
 from src.services.user_service import UserService
+from src.services.user_import import ImportTooLarge, iter_lines
+from src.services.user_refs import UserRefResolver
 from src.models.task import TaskStatus, Priority, TelegramUser
 from src.models.user import UserRole
 from src.config import settings
@@ -21,6 +23,8 @@ router = APIRouter()
 class TaskListResponse(BaseModel):
     tasks: List[Dict[str, Any]]
     total: int
+    next_cursor: Optional[str] = None
+    plan: Optional[Dict[str, Any]] = None
 
 class StatusUpdateRequest(BaseModel):
     status: TaskStatus
@@ -33,6 +37,14 @@ class AssigneeRequest(BaseModel):
 class NoteRequest(BaseModel):
     content: str
 
+class BulkTaskRequest(BaseModel):
+    uids: List[str] = Field(..., min_length=1, max_length=500)
+    operation: str  # set_status, set_priority, assign, unassign or set_assignees
+    status: Optional[TaskStatus] = None
+    reason: Optional[str] = None
+    priority: Optional[Priority] = None
+    assignee_ids: Optional[List[int]] = None
+
 class UserUpdateRequest(BaseModel):
     name: Optional[str] = None
     username: Optional[str] = None
@@ -44,10 +56,13 @@ class LoginRequest(BaseModel):
 
 # Dependency to get services
 async def get_task_service(request: Request) -> TaskService:
-    return TaskService(request.app.state.gcs_client)
+    return request.app.state.task_service
 
 async def get_user_service(request: Request) -> UserService:
-    return UserService(request.app.state.gcs_client)
+    return UserService(request.app.state.gcs_client, request.app.state.user_cache)
+
+async def get_user_refs(user_service: UserService = Depends(get_user_service)) -> UserRefResolver:
+    return UserRefResolver(user_service)
 
 # Auth endpoints
 @router.post("/auth/login")
@@ -128,59 +143,187 @@ async def verify_magic_link(
 @router.get("/tasks")
 async def list_tasks(
     request: Request,
-    status: Optional[TaskStatus] = Query(None),
+    status: Optional[List[TaskStatus]] = Query(None),
     assignee_id: Optional[int] = Query(None),
+    priority: Optional[Priority] = Query(None),
+    created_by: Optional[int] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
     search: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
     limit: int = Query(100, le=1000),
     task_service: TaskService = Depends(get_task_service),
+    user_refs: UserRefResolver = Depends(get_user_refs),
     current_user: Dict = Depends(get_current_user)
 ):
-    """List tasks with filters"""
+    """List tasks matching all given filters (plan shows how they were resolved)"""
     try:
-        task_uids = []
-        
-        if status:
-            task_uids = await task_service.list_tasks_by_status(status, limit)
-        elif assignee_id:
-            task_uids = await task_service.list_tasks_by_assignee(assignee_id, limit)
-        elif search:
-            task_uids = await task_service.search_tasks(search, limit)
-        else:
+        filters_given = any(
+            value is not None
+            for value in (status, assignee_id, priority, created_by, created_from, created_to, search)
+        )
+        if not filters_given:
             # Get all new tasks by default
-            task_uids = await task_service.list_tasks_by_status(TaskStatus.NEW, limit)
-        
-        # Fetch task details
-        tasks = []
-        for uid in task_uids:
-            task = await task_service.get_task(uid)
-            if task:
-                tasks.append(task.to_dict())
+            status = [TaskStatus.NEW]
+        
+        result = await task_service.query_tasks(
+            statuses=status,
+            assignee_id=assignee_id,
+            priority=priority,
+            created_by=created_by,
+            created_from=created_from,
+            created_to=created_to,
+            text=search,
+            limit=limit,
+            cursor=cursor
+        )
         
-        return TaskListResponse(tasks=tasks, total=len(tasks))
+        # One user lookup for the whole page
+        tasks = await user_refs.resolve([task.to_dict() for task in result["tasks"]])
+        return TaskListResponse(
+            tasks=tasks,
+            total=len(tasks),
+            next_cursor=result["next_cursor"],
+            plan=result["plan"]
+        )
         
     except Exception as e:
         logger.error(f"Failed to list tasks: {e}")
         raise HTTPException(status_code=500, detail="Failed to list tasks")
 
+@router.get("/stats")
+async def get_task_stats(
+    days: int = Query(14, ge=1, le=90),
+    task_service: TaskService = Depends(get_task_service),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Task counts by status/priority/assignee and daily created/closed rollups"""
+    try:
+        return await task_service.get_task_stats(days=days)
+        
+    except Exception as e:
+        logger.error(f"Failed to get task stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get task stats")
+
+@router.get("/analytics/tasks")
+async def get_task_analytics(
+    task_service: TaskService = Depends(get_task_service),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Time in each status, cycle time and on-hold durations per assignee and priority"""
+    try:
+        return await task_service.get_task_analytics()
+        
+    except Exception as e:
+        logger.error(f"Failed to get task analytics: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get task analytics")
+
+@router.get("/tasks/export")
+async def export_tasks(
+    request: Request,
+    status: Optional[List[TaskStatus]] = Query(None),
+    assignee_id: Optional[int] = Query(None),
+    priority: Optional[Priority] = Query(None),
+    created_by: Optional[int] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    search: Optional[str] = Query(None),
+    task_service: TaskService = Depends(get_task_service),
+    user_refs: UserRefResolver = Depends(get_user_refs),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Stream every task matching the filters as CSV (no filters: all tasks, archived included)"""
+    chunks = task_service.stream_tasks_csv(
+        user_refs=user_refs,
+        statuses=status,
+        assignee_id=assignee_id,
+        priority=priority,
+        created_by=created_by,
+        created_from=created_from,
+        created_to=created_to,
+        text=search
+    )
+    filename = f"tasks_export_{datetime.now(timezone.utc).date().isoformat()}.csv"
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @router.get("/tasks/{uid}")
 async def get_task(
     uid: str,
     request: Request,
+    full: bool = Query(False),
     task_service: TaskService = Depends(get_task_service),
+    user_refs: UserRefResolver = Depends(get_user_refs),
     current_user: Dict = Depends(get_current_user)
 ):
-    """Get task by UID"""
+    """Get task by UID (latest notes/history inline; full=true loads all)"""
     try:
         task = await task_service.get_task(uid)
         if not task:
             raise HTTPException(status_code=404, detail="Task not found")
         
-        return task.to_dict()
+        task_dict = task.to_dict()
+        if full:
+            task_dict["notes"] = [n.to_dict() for n in await task_service.load_task_notes(task)]
+            task_dict["statusHistory"] = [h.to_dict() for h in await task_service.load_task_history(task)]
+        
+        return await user_refs.resolve_one(task_dict)
         
     except Exception as e:
         logger.error(f"Failed to get task {uid}: {e}")
         raise HTTPException(status_code=500, detail="Failed to get task")
 
+@router.get("/tasks/{uid}/notes")
+async def get_task_notes(
+    uid: str,
+    request: Request,
+    task_service: TaskService = Depends(get_task_service),
+    user_refs: UserRefResolver = Depends(get_user_refs),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get all notes of a task"""
+    try:
+        task = await task_service.get_task(uid)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        
+        notes = await task_service.load_task_notes(task)
+        return await user_refs.resolve_one({"notes": [n.to_dict() for n in notes], "total": task.notes_count})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get notes for task {uid}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get notes")
+
+@router.get("/tasks/{uid}/history")
+async def get_task_history(
+    uid: str,
+    request: Request,
+    task_service: TaskService = Depends(get_task_service),
+    user_refs: UserRefResolver = Depends(get_user_refs),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get the full status history of a task"""
+    try:
+        task = await task_service.get_task(uid)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        
+        history = await task_service.load_task_history(task)
+        return await user_refs.resolve_one(
+            {"statusHistory": [h.to_dict() for h in history], "total": task.status_history_count}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get history for task {uid}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get history")
+
 @router.patch("/tasks/{uid}")
 async def update_task(
     uid: str,
@@ -188,39 +331,113 @@ async def update_task(
     request: Request,
     task_service: TaskService = Depends(get_task_service),
     admin_user: Dict = Depends(require_admin),
-    user_service: UserService = Depends(get_user_service)
+    user_service: UserService = Depends(get_user_service),
+    user_refs: UserRefResolver = Depends(get_user_refs)
 ):
     """Update task (admin only)"""
     try:
-        task = await task_service.get_task(uid)
-        if not task:
+        if not await task_service.get_task(uid):
             raise HTTPException(status_code=404, detail="Task not found")
         
         # Update allowed fields
-        if "title" in updates:
-            task.title = updates["title"]
-        if "description" in updates:
-            task.description = updates["description"]
-        if "priority" in updates:
-            task.priority = Priority(updates["priority"])
-        
-        success = await task_service.update_task(task)
-        if not success:
+        def apply(task):
+            if "title" in updates:
+                task.title = updates["title"]
+            if "description" in updates:
+                task.description = updates["description"]
+            if "priority" in updates:
+                task.priority = Priority(updates["priority"])
+        
+        task = await task_service.mutate_task(uid, apply)
+        if not task:
             raise HTTPException(status_code=500, detail="Failed to update task")
         
-        # Log admin action
+        # Log admin action (resending the stored values writes nothing)
+        if task.changes:
+            await user_service.log_admin_action(
+                admin_user["telegram_id"],
+                "update_task",
+                uid,
+                {"updates": updates}
+            )
+        
+        return await user_refs.resolve_one(task.to_dict())
+        
+    except Exception as e:
+        logger.error(f"Failed to update task {uid}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update task")
+
+@router.post("/tasks:bulk")
+async def bulk_update_tasks(
+    bulk_req: BulkTaskRequest,
+    request: Request,
+    task_service: TaskService = Depends(get_task_service),
+    admin_user: Dict = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Apply one operation to many tasks, with per-UID results (admin only)"""
+    try:
+        admin_telegram_user = TelegramUser(
+            telegram_id=admin_user["telegram_id"],
+            name=admin_user["name"],
+            username=admin_user.get("username")
+        )
+        
+        # Resolve assignees once for the whole batch
+        assignees = None
+        if bulk_req.operation in ("assign", "set_assignees") and bulk_req.assignee_ids is not None:
+            users, missing = await user_service.get_users(bulk_req.assignee_ids)
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Assignee users not found: {missing}")
+            assignees = [
+                TelegramUser(telegram_id=u.telegram_id, name=u.name, username=u.username)
+                for u in users.values()
+            ]
+        
+        try:
+            results = await task_service.bulk_update_tasks(
+                bulk_req.uids,
+                bulk_req.operation,
+                admin_telegram_user,
+                status=bulk_req.status,
+                reason=bulk_req.reason,
+                priority=bulk_req.priority,
+                assignees=assignees,
+                assignee_ids=bulk_req.assignee_ids
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        succeeded = [uid for uid, error in results.items() if error is None]
+        failed = {uid: error for uid, error in results.items() if error is not None}
+        
+        # One audit entry for the whole batch
         await user_service.log_admin_action(
             admin_user["telegram_id"],
-            "update_task",
-            uid,
-            {"updates": updates}
+            f"bulk_{bulk_req.operation}",
+            f"{len(results)} tasks",
+            {
+                "uids": list(results),
+                "status": bulk_req.status.value if bulk_req.status else None,
+                "reason": bulk_req.reason,
+                "priority": bulk_req.priority.value if bulk_req.priority else None,
+                "assignee_ids": bulk_req.assignee_ids,
+                "failed": failed
+            }
         )
         
-        return task.to_dict()
+        return {
+            "operation": bulk_req.operation,
+            "succeeded": len(succeeded),
+            "failed": len(failed),
+            "results": [{"uid": uid, "ok": error is None, "error": error} for uid, error in results.items()]
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Failed to update task {uid}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to update task")
+        logger.error(f"Bulk {bulk_req.operation} failed: {e}")
+        raise HTTPException(status_code=500, detail="Bulk update failed")
 
 @router.post("/tasks/{uid}/status")
 async def change_task_status(
@@ -429,6 +646,31 @@ async def list_users(
         logger.error(f"Failed to list users: {e}")
         raise HTTPException(status_code=500, detail="Failed to list users")
 
+@router.get("/users/search")
+async def search_users(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    admin_user: Dict = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Autocomplete users by name, word of name or @username prefix (admin only)"""
+    try:
+        users = await user_service.search_users(q, limit)
+        return [
+            {
+                "telegram_id": user.telegram_id,
+                "name": user.name,
+                "username": user.username,
+                "active": user.active
+            }
+            for user in users
+        ]
+        
+    except Exception as e:
+        logger.error(f"Failed to search users for {q!r}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search users")
+
 @router.patch("/users/{telegram_id}")
 async def update_user(
     telegram_id: int,
@@ -439,7 +681,7 @@ async def update_user(
 ):
     """Update user (admin only)"""
     try:
-        user = await user_service.get_user(telegram_id)
+        user = await user_service.get_user(telegram_id, fresh=True)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -453,17 +695,19 @@ async def update_user(
         if updates.active is not None:
             user.active = updates.active
         
+        changes = user.changed_fields() - {"lastSeenAt"}
         success = await user_service.update_user(user)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to update user")
         
-        # Log admin action
-        await user_service.log_admin_action(
-            admin_user["telegram_id"],
-            "update_user",
-            str(telegram_id),
-            {"updates": updates.dict(exclude_none=True)}
-        )
+        # Log admin action (resending the stored values writes nothing)
+        if changes:
+            await user_service.log_admin_action(
+                admin_user["telegram_id"],
+                "update_user",
+                str(telegram_id),
+                {"updates": updates.dict(exclude_none=True)}
+            )
         
         return user.to_dict()
         
@@ -501,25 +745,52 @@ async def create_user_stub(
         logger.error(f"Failed to create user: {e}")
         raise HTTPException(status_code=500, detail="Failed to create user")
 
-@router.get("/users/export")
-async def export_users(
+@router.post("/users:import")
+async def import_users(
     request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
     admin_user: Dict = Depends(require_admin),
     user_service: UserService = Depends(get_user_service)
 ):
-    """Export users to CSV (admin only)"""
+    """Create users from a CSV or JSON lines body (admin only)
+    
+    The format comes from ?format= or the Content-Type. Existing users are
+    left untouched; the response and the audit entry have a status for
+    every row. Inputs over USER_IMPORT_MAX_ROWS are rejected as a whole.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = format or ("csv" if "csv" in content_type else "jsonl")
+    
     try:
-        csv_content = await user_service.export_users_csv()
-        
-        return Response(
-            content=csv_content,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=users.csv"}
-        )
-        
+        result = await user_service.import_users(iter_lines(request.stream()), fmt)
+    except ImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to export users: {e}")
-        raise HTTPException(status_code=500, detail="Failed to export users")
+        logger.error(f"Failed to import users: {e}")
+        raise HTTPException(status_code=500, detail="Failed to import users")
+    
+    await user_service.log_admin_action(
+        admin_user["telegram_id"],
+        "import_users",
+        f"{result['counts'].get('created', 0)} users",
+        {"format": fmt, "counts": result["counts"], "rows": result["rows"]}
+    )
+    return result
+
+@router.get("/users/export")
+async def export_users(
+    request: Request,
+    role: Optional[UserRole] = Query(None),
+    active: Optional[bool] = Query(None),
+    admin_user: Dict = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Stream users as CSV (admin only)"""
+    return StreamingResponse(
+        user_service.stream_users_csv(role=role, active=active),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=users.csv"}
+    )
 
 # Cron endpoint
 @router.get("/cron/media-retention")
@@ -531,15 +802,29 @@ async def media_retention_job(
     try:
         result = await task_service.delete_expired_media()
         return {
-            "message": "Media retention job completed",
-            "deleted_files": result["deleted_files"],
-            "checked_tasks": result["checked_tasks"]
+            "message": "Media retention job completed" if result["completed"]
+                       else "Media retention job stopped at time budget; will resume next run",
+            **result
         }
         
     except Exception as e:
         logger.error(f"Media retention job failed: {e}")
         raise HTTPException(status_code=500, detail="Media retention job failed")
 
+@router.get("/cron/archive-tasks")
+async def archive_tasks_job(
+    request: Request,
+    task_service: TaskService = Depends(get_task_service)
+):
+    """Archive tasks closed more than ARCHIVE_AFTER_DAYS ago (protected by X-CRON-KEY header)"""
+    try:
+        result = await task_service.archive_closed_tasks()
+        return {"message": "Task archive job completed", **result}
+        
+    except Exception as e:
+        logger.error(f"Task archive job failed: {e}")
+        raise HTTPException(status_code=500, detail="Task archive job failed")
+
 # Mini App endpoints
 @router.post("/miniapp/validate")
 async def validate_miniapp_data(
@@ -623,10 +908,10 @@ async def promote_user_to_admin(
     """Promote a user to admin role (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        user_service = UserService(gcs_client)
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
         # Check if user exists
-        user = await user_service.get_user(promote_req.telegram_id)
+        user = await user_service.get_user(promote_req.telegram_id, fresh=True)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -670,7 +955,7 @@ async def get_all_users(
     """Get all users (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        user_service = UserService(gcs_client)
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
         users = await user_service.get_all_users()
         
@@ -706,13 +991,25 @@ async def block_unblock_user(
     """Block or unblock a user (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        user_service = UserService(gcs_client)
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
         # Check if user exists
-        user = await user_service.get_user(block_req.telegram_id)
+        user = await user_service.get_user(block_req.telegram_id, fresh=True)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
+        if user.active != block_req.blocked:
+            # Already in the requested state: no write and no audit entry
+            return {
+                "message": f"User {user.name} is already {'blocked' if block_req.blocked else 'active'}",
+                "user": {
+                    "telegram_id": user.telegram_id,
+                    "name": user.name,
+                    "username": user.username,
+                    "active": user.active
+                }
+            }
+        
         # Update user active status
         if block_req.blocked:
             success = await user_service.deactivate_user(block_req.telegram_id)
@@ -760,10 +1057,10 @@ async def demote_user_from_admin(
     """Demote an admin to regular user (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        user_service = UserService(gcs_client)
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
         # Check if user exists
-        user = await user_service.get_user(demote_req.telegram_id)
+        user = await user_service.get_user(demote_req.telegram_id, fresh=True)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -799,6 +1096,109 @@ async def demote_user_from_admin(
         logger.error(f"Failed to demote user {demote_req.telegram_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to demote user")
 
+@router.get("/audit")
+async def query_audit_log(
+    request: Request,
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    admin_id: Optional[int] = Query(None),
+    action: Optional[str] = Query(None),
+    target: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    admin_user: Dict = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Audit entries newest first; the range defaults to the last AUDIT_DEFAULT_DAYS days (admin only)"""
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=settings.AUDIT_DEFAULT_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    
+    try:
+        return await user_service.audit.query(
+            date_from,
+            date_to,
+            admin_telegram_id=admin_id,
+            action=action,
+            target=target,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    except Exception as e:
+        logger.error(f"Failed to query audit log: {e}")
+        raise HTTPException(status_code=500, detail="Failed to query audit log")
+
+@router.get("/admin/metrics")
+async def get_metrics(
+    request: Request,
+    admin_user: Dict = Depends(require_admin)
+):
+    """Process-local operational counters (admin only)"""
+    return {"webhook_updates": dict(request.app.state.update_dedup.stats)}
+
+@router.post("/admin/migrate/task-segments")
+async def migrate_task_segments(
+    request: Request,
+    admin_user: Dict = Depends(require_admin)
+):
+    """Move inline notes/history of existing tasks into segments (admin only)"""
+    try:
+        task_service = request.app.state.task_service
+        result = await task_service.migrate_task_segments()
+        return {"message": "Task segment migration completed", **result}
+        
+    except Exception as e:
+        logger.error(f"Task segment migration failed: {e}")
+        raise HTTPException(status_code=500, detail="Task segment migration failed")
+
+@router.post("/admin/backfill/task-indices")
+async def backfill_task_indices(
+    request: Request,
+    admin_user: Dict = Depends(require_admin)
+):
+    """Build priority, creator and creation-day indices for existing tasks (admin only)"""
+    try:
+        task_service = request.app.state.task_service
+        result = await task_service.backfill_task_indices()
+        return {"message": "Task index backfill completed", **result}
+        
+    except Exception as e:
+        logger.error(f"Task index backfill failed: {e}")
+        raise HTTPException(status_code=500, detail="Task index backfill failed")
+
+@router.post("/admin/reconcile/task-counters")
+async def reconcile_task_counters(
+    request: Request,
+    admin_user: Dict = Depends(require_admin)
+):
+    """Recompute task counters and daily rollups from the indices (admin only)"""
+    try:
+        task_service = request.app.state.task_service
+        result = await task_service.reconcile_task_counters()
+        return {"message": "Task counter reconciliation completed", **result}
+        
+    except Exception as e:
+        logger.error(f"Task counter reconciliation failed: {e}")
+        raise HTTPException(status_code=500, detail="Task counter reconciliation failed")
+
+@router.post("/admin/reconcile/users")
+async def reconcile_user_indexes(
+    request: Request,
+    admin_user: Dict = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
+):
+    """Rebuild the user roster and role index from the user documents (admin only)"""
+    try:
+        result = await user_service.rebuild_user_indexes()
+        return {"message": "User index rebuild completed", **result}
+        
+    except Exception as e:
+        logger.error(f"User index rebuild failed: {e}")
+        raise HTTPException(status_code=500, detail="User index rebuild failed")
+
 @router.delete("/tasks/{uid}")
 async def delete_task(
     uid: str,
@@ -808,8 +1208,8 @@ async def delete_task(
     """Delete a task and all its media files (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        task_service = TaskService(gcs_client)
-        user_service = UserService(gcs_client)
+        task_service = request.app.state.task_service
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
         # Get task to check if it exists and get media files
         task = await task_service.get_task(uid)
@@ -861,69 +1261,75 @@ async def update_task(
     uid: str,
     update_req: TaskUpdateRequest,
     request: Request,
-    admin_user: Dict = Depends(require_admin)
+    admin_user: Dict = Depends(require_admin),
+    user_refs: UserRefResolver = Depends(get_user_refs)
 ):
     """Update a task (admin only)"""
     try:
         gcs_client = request.app.state.gcs_client
-        task_service = TaskService(gcs_client)
-        user_service = UserService(gcs_client)
+        task_service = request.app.state.task_service
+        user_service = UserService(gcs_client, request.app.state.user_cache)
         
-        # Get existing task
-        task = await task_service.get_task(uid)
-        if not task:
+        # Check task exists
+        if not await task_service.get_task(uid):
             raise HTTPException(status_code=404, detail="Task not found")
         
-        # Update fields if provided
-        if update_req.title is not None:
-            task.title = update_req.title
-        
-        if update_req.description is not None:
-            task.description = update_req.description
+        # Resolve assignees before the write so the mutation stays synchronous
+        new_assignees = None
+        if update_req.assignee_ids is not None:
+            users, missing = await user_service.get_users(update_req.assignee_ids)
+            if missing:
+                logger.warning(f"Ignoring unknown assignees for task {uid}: {missing}")
+            new_assignees = [
+                TelegramUser(telegram_id=u.telegram_id, name=u.name, username=u.username)
+                for u in users.values()
+            ]
         
-        if update_req.priority is not None:
-            task.priority = update_req.priority
+        admin_telegram_user = TelegramUser(
+            telegram_id=admin_user["telegram_id"],
+            name=admin_user["name"],
+            username=admin_user["username"]
+        )
         
-        # Handle assignee updates
-        if update_req.assignee_ids is not None:
-            new_assignees = []
-            for telegram_id in update_req.assignee_ids:
-                user_obj = await user_service.get_user(telegram_id)
-                if user_obj:
-                    new_assignees.append(TelegramUser(
-                        telegram_id=user_obj.telegram_id,
-                        name=user_obj.name,
-                        username=user_obj.username
-                    ))
-            task.assignees = new_assignees
-        
-        # Handle status change
-        if update_req.status is not None and update_req.status != task.status:
-            admin_telegram_user = TelegramUser(
-                telegram_id=admin_user["telegram_id"],
-                name=admin_user["name"],
-                username=admin_user["username"]
-            )
-            task.change_status(update_req.status, admin_telegram_user)
+        # Update fields if provided
+        def apply(task):
+            if update_req.title is not None:
+                task.title = update_req.title
+            
+            if update_req.description is not None:
+                task.description = update_req.description
+            
+            if update_req.priority is not None:
+                task.priority = update_req.priority
+            
+            if new_assignees is not None:
+                task.assignees = list(new_assignees)
+            
+            # Handle status change
+            if update_req.status is not None and update_req.status != task.status:
+                task.change_status(update_req.status, admin_telegram_user)
         
         # Save updated task
-        success = await task_service.update_task(task)
-        if not success:
+        task = await task_service.mutate_task(uid, apply)
+        if not task:
             raise HTTPException(status_code=500, detail="Failed to update task")
         
-        # Log admin action
-        await user_service.log_admin_action(
-            admin_user["telegram_id"],
-            "update_task",
-            uid,
-            {
-                "title": update_req.title,
-                "status": update_req.status.value if update_req.status else None,
-                "priority": update_req.priority.value if update_req.priority else None
-            }
-        )
+        # Log admin action (resending the stored values writes nothing)
+        if task.changes:
+            await user_service.log_admin_action(
+                admin_user["telegram_id"],
+                "update_task",
+                uid,
+                {
+                    "title": update_req.title,
+                    "status": update_req.status.value if update_req.status else None,
+                    "priority": update_req.priority.value if update_req.priority else None,
+                    "changed": sorted(task.changes)
+                }
+            )
         
-        return {"message": "Task updated successfully", "task": task.to_dict()}
+        task_dict = await user_refs.resolve_one(task.to_dict())
+        return {"message": "Task updated successfully", "task": task_dict}
         
     except HTTPException:
         raise
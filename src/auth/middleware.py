@@ -16,7 +16,14 @@ PUBLIC_ROUTES = {
     "/webhook/telegram",
     "/api/auth/login",
     "/api/auth/magic-link",
-    "/cron/media-retention"
+    "/cron/media-retention",
+    "/cron/archive-tasks"
+}
+
+# Public routes that are protected by the X-CRON-KEY header instead
+CRON_ROUTES = {
+    "/cron/media-retention",
+    "/cron/archive-tasks"
 }
 
 # Routes that start with these prefixes are public
@@ -79,7 +86,7 @@ async def jwt_middleware(request: Request, call_next):
     # Skip auth for public routes
     if is_public_route(path):
         # Special case for cron endpoint
-        if path == "/cron/media-retention":
+        if path in CRON_ROUTES:
             if not check_cron_auth(request):
                 return JSONResponse(
                     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -3,7 +3,7 @@ import logging
 import mimetypes
 from datetime import datetime
 from io import BytesIO
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, User as TelegramUserObj
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from telegram.constants import ParseMode
@@ -11,6 +11,8 @@ from telegram.constants import ParseMode
 from src.storage.gcs_client import GCSClient
 from src.services.task_service import TaskService
 from src.services.user_service import UserService
+from src.services.user_cache import UserCache
+from src.services.user_refs import UserRefResolver
 from src.models.task import Task, TaskStatus, TelegramUser, MediaType
 from src.models.user import UserRole
 from src.config import settings
@@ -18,10 +20,16 @@ from src.config import settings
 logger = logging.getLogger(__name__)
 
 class BotHandlers:
-    def __init__(self, gcs_client: GCSClient):
+    def __init__(
+        self,
+        gcs_client: GCSClient,
+        task_service: Optional[TaskService] = None,
+        user_cache: Optional[UserCache] = None
+    ):
         self.gcs_client = gcs_client
-        self.task_service = TaskService(gcs_client)
-        self.user_service = UserService(gcs_client)
+        self.task_service = task_service or TaskService(gcs_client)
+        self.user_service = UserService(gcs_client, user_cache)
+        self.user_refs = UserRefResolver(self.user_service)
         self.media_groups = {}  # Store media groups temporarily
     
     async def get_or_create_user(self, telegram_user: TelegramUserObj) -> TelegramUser:
@@ -302,48 +310,50 @@ class BotHandlers:
             args = context.args
             if len(args) < 2:
                 await update.message.reply_text(
-                    "Usage: `/assign <UID> <@username or telegram_id>`",
+                    "Usage: `/assign <UID> <@username or telegram_id> ...`",
                     parse_mode=ParseMode.MARKDOWN
                 )
                 return
             
             uid = args[0]
-            assignee_identifier = args[1]
             
-            # Try to parse as telegram ID or username
-            assignee_id = None
-            if assignee_identifier.startswith('@'):
-                # Username - we'd need to lookup by username
-                # For now, ask for telegram ID
-                await update.message.reply_text(
-                    "Please use Telegram ID instead of username for now."
-                )
+            # Resolve @usernames through the username index
+            usernames = [identifier for identifier in args[1:] if identifier.startswith('@')]
+            found_by_name = await asyncio.gather(*(self.user_service.find_by_username(u) for u in usernames))
+            unknown = [u for u, found in zip(usernames, found_by_name) if not found]
+            if unknown:
+                await update.message.reply_text(f"❌ User not found: {', '.join(unknown)}")
                 return
-            else:
-                try:
-                    assignee_id = int(assignee_identifier)
-                except ValueError:
-                    await update.message.reply_text("Invalid Telegram ID format.")
-                    return
+            by_username = dict(zip(usernames, found_by_name))
             
-            # Get assignee user
-            assignee_user_obj = await self.user_service.get_user(assignee_id)
-            if not assignee_user_obj:
-                await update.message.reply_text("❌ User not found.")
+            try:
+                assignee_ids = [
+                    by_username[identifier].telegram_id if identifier in by_username else int(identifier)
+                    for identifier in args[1:]
+                ]
+            except ValueError:
+                await update.message.reply_text("Invalid Telegram ID format.")
                 return
             
-            assignee = TelegramUser(
-                telegram_id=assignee_user_obj.telegram_id,
-                name=assignee_user_obj.name,
-                username=assignee_user_obj.username
-            )
+            # Get assignee users in one lookup
+            users, missing = await self.user_service.get_users(assignee_ids)
+            if missing:
+                await update.message.reply_text(
+                    f"❌ User not found: {', '.join(str(telegram_id) for telegram_id in missing)}"
+                )
+                return
             
-            # Assign task
-            success = await self.task_service.assign_task(uid, assignee)
+            assignees = [
+                TelegramUser(telegram_id=u.telegram_id, name=u.name, username=u.username)
+                for u in users.values()
+            ]
             
-            if success:
+            # Assign task; concurrent assignments coalesce into one write
+            results = await asyncio.gather(*(self.task_service.assign_task(uid, a) for a in assignees))
+            
+            if all(results):
                 await update.message.reply_text(
-                    f"✅ Task `{uid}` assigned to {assignee.name}",
+                    f"✅ Task `{uid}` assigned to {', '.join(a.name for a in assignees)}",
                     parse_mode=ParseMode.MARKDOWN
                 )
             else:
@@ -382,7 +392,7 @@ class BotHandlers:
             response_text += f"⚡ *Priority:* {task.priority.value.title()}\\n"
             
             if task.assignees:
-                assignee_names = [a.name for a in task.assignees]
+                assignee_names = [a.name for a in await self.user_refs.resolve_users(task.assignees)]
                 response_text += f"👥 *Assignees:* {', '.join(assignee_names)}\\n"
             
             if task.on_hold_reason:
@@ -394,8 +404,8 @@ class BotHandlers:
             if task.media:
                 response_text += f"📎 *Media:* {len(task.media)} file(s)\\n"
             
-            if task.notes:
-                response_text += f"💬 *Notes:* {len(task.notes)} note(s)\\n"
+            if task.notes_count:
+                response_text += f"💬 *Notes:* {task.notes_count} note(s)\\n"
             
             keyboard = self.create_task_keyboard(task.uid, is_admin)
             
@@ -532,7 +542,7 @@ class BotHandlers:
             
             if await self.is_admin(user.telegram_id):
                 welcome_text += f"⚡ *Admin Commands:*\\n"
-                welcome_text += f"👥 `/assign <UID> <telegram_id>` - assign tasks\\n"
+                welcome_text += f"👥 `/assign <UID> <@username or id> ...` - assign tasks\\n"
                 welcome_text += f"🌐 Dashboard: {settings.APP_BASE_URL}\\n"
             
             await update.message.reply_text(
@@ -545,9 +555,14 @@ class BotHandlers:
             await update.message.reply_text("Welcome to the Maintenance Task System!")
 
 
-def setup_bot_handlers(app: Application, gcs_client: GCSClient):
+def setup_bot_handlers(
+    app: Application,
+    gcs_client: GCSClient,
+    task_service: Optional[TaskService] = None,
+    user_cache: Optional[UserCache] = None
+):
     """Setup all bot handlers"""
-    handlers = BotHandlers(gcs_client)
+    handlers = BotHandlers(gcs_client, task_service, user_cache)
     
     # Command handlers
     app.add_handler(CommandHandler("start", handlers.handle_start_command))
@@ -0,0 +1,67 @@
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional, Set
+from src.config import settings
+from src.storage.gcs_client import GCSClient
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Drops redelivered Telegram updates by update_id
+    
+    Recently seen IDs are remembered in memory; the first instance to see an
+    update also creates a marker object under webhook/updates/, so a
+    redelivery that lands on another instance is recognised as well. The
+    markers only need to outlive Telegram's redelivery window and are removed
+    by a bucket lifecycle rule.
+    """
+    
+    def __init__(self, gcs_client: GCSClient, window: Optional[int] = None):
+        self.gcs = gcs_client
+        self.window = window or settings.WEBHOOK_DEDUP_WINDOW
+        self._recent: Deque[int] = deque()
+        self._recent_ids: Set[int] = set()
+        self.stats: Dict[str, int] = {"processed": 0, "duplicates": 0, "shared_duplicates": 0}
+    
+    def _marker_path(self, update_id: int) -> str:
+        return f"webhook/updates/{update_id}"
+    
+    def _remember(self, update_id: int):
+        self._recent.append(update_id)
+        self._recent_ids.add(update_id)
+        while len(self._recent) > self.window:
+            self._recent_ids.discard(self._recent.popleft())
+    
+    async def claim(self, update_id: int) -> bool:
+        """Return True if this update should be processed, False for a duplicate"""
+        if update_id in self._recent_ids:
+            self.stats["duplicates"] += 1
+            logger.info(f"Suppressed duplicate update {update_id}")
+            return False
+        
+        # Remember before the marker write so concurrent redeliveries to this
+        # instance are caught without waiting on GCS
+        self._remember(update_id)
+        
+        created = await self.gcs.create_if_absent(
+            self._marker_path(update_id),
+            {"updateId": update_id, "claimedAt": datetime.now(timezone.utc).isoformat()}
+        )
+        if created is False:
+            self.stats["duplicates"] += 1
+            self.stats["shared_duplicates"] += 1
+            logger.info(f"Suppressed duplicate update {update_id} seen by another instance")
+            return False
+        
+        # On a marker write error process anyway rather than drop the update
+        self.stats["processed"] += 1
+        return True
+    
+    async def release(self, update_id: int):
+        """Forget a claimed update whose processing failed, so a redelivery is handled"""
+        if update_id in self._recent_ids:
+            self._recent_ids.discard(update_id)
+            self._recent.remove(update_id)
+        await self.gcs.delete_object(self._marker_path(update_id))
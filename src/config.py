@@ -21,6 +21,53 @@ class Settings:
     # Cron Configuration
     CRON_KEY: str = os.getenv("CRON_KEY", "change-me-in-production")
     
+    # Task Write Conflict Retries
+    TASK_MUTATION_MAX_ATTEMPTS: int = int(os.getenv("TASK_MUTATION_MAX_ATTEMPTS", "10"))
+    TASK_MUTATION_BACKOFF_MS: int = int(os.getenv("TASK_MUTATION_BACKOFF_MS", "25"))
+    TASK_COALESCE_WINDOW_MS: int = int(os.getenv("TASK_COALESCE_WINDOW_MS", "10"))
+    BULK_MAX_CONCURRENCY: int = int(os.getenv("BULK_MAX_CONCURRENCY", "10"))
+    
+    # Task Notes/History Segments
+    TASK_INLINE_ENTRIES: int = int(os.getenv("TASK_INLINE_ENTRIES", "10"))
+    TASK_SEGMENT_SIZE: int = int(os.getenv("TASK_SEGMENT_SIZE", "25"))
+    # Store users in task documents as {"telegramId"} references only
+    TASK_USER_REFS: bool = os.getenv("TASK_USER_REFS", "false").lower() == "true"
+    
+    # Task Counters
+    TASK_COUNTER_SHARDS: int = int(os.getenv("TASK_COUNTER_SHARDS", "4"))
+    TASK_ROLLUP_RETENTION_DAYS: int = int(os.getenv("TASK_ROLLUP_RETENTION_DAYS", "90"))
+    
+    # Task Analytics
+    ANALYTICS_REFRESH_SEC: float = float(os.getenv("ANALYTICS_REFRESH_SEC", "300"))
+    ANALYTICS_MAX_CONCURRENCY: int = int(os.getenv("ANALYTICS_MAX_CONCURRENCY", "16"))
+    
+    # CSV Exports
+    EXPORT_MAX_CONCURRENCY: int = int(os.getenv("EXPORT_MAX_CONCURRENCY", "16"))
+    
+    # Audit Queries
+    AUDIT_MAX_CONCURRENCY: int = int(os.getenv("AUDIT_MAX_CONCURRENCY", "16"))
+    AUDIT_DEFAULT_DAYS: int = int(os.getenv("AUDIT_DEFAULT_DAYS", "7"))
+    
+    # User Cache
+    USER_CACHE_TTL_SEC: float = float(os.getenv("USER_CACHE_TTL_SEC", "60"))
+    USER_LAST_SEEN_FLUSH_SEC: float = float(os.getenv("USER_LAST_SEEN_FLUSH_SEC", "300"))
+    USER_ROSTER_SHARDS: int = int(os.getenv("USER_ROSTER_SHARDS", "4"))
+    USER_IMPORT_MAX_ROWS: int = int(os.getenv("USER_IMPORT_MAX_ROWS", "5000"))
+    
+    # Webhook Deduplication
+    WEBHOOK_DEDUP_WINDOW: int = int(os.getenv("WEBHOOK_DEDUP_WINDOW", "2048"))
+    
+    # Media Uploads
+    MEDIA_UPLOAD_MAX_INFLIGHT_BYTES: int = int(os.getenv("MEDIA_UPLOAD_MAX_INFLIGHT_BYTES", str(32 * 1024 * 1024)))
+    
+    # Task Archive
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+    ARCHIVE_MAX_CONCURRENCY: int = int(os.getenv("ARCHIVE_MAX_CONCURRENCY", "8"))
+    
+    # Media Retention Job Configuration
+    RETENTION_MAX_CONCURRENCY: int = int(os.getenv("RETENTION_MAX_CONCURRENCY", "8"))
+    RETENTION_TIME_BUDGET_SEC: float = float(os.getenv("RETENTION_TIME_BUDGET_SEC", "240"))
+    
     # Optional Basic Auth Fallback
     ADMIN_USER: Optional[str] = os.getenv("ADMIN_USER")
     ADMIN_PASS: Optional[str] = os.getenv("ADMIN_PASS")
@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Any
+from functools import lru_cache
+from typing import List, Dict, FrozenSet, Optional, Any, Set
 from enum import Enum
+import sys
 import uuid
 
 class TaskStatus(str, Enum):
@@ -29,12 +31,24 @@ class UserRole(str, Enum):
     ADMIN = "admin"
 
 class TelegramUser:
-    def __init__(self, telegram_id: int, name: str, username: Optional[str] = None):
+    # Decoded instances are interned and shared between notes, history
+    # entries and assignees, so treat them as immutable
+    __slots__ = ("telegram_id", "name", "username")
+    
+    def __init__(self, telegram_id: int, name: Optional[str], username: Optional[str] = None):
         self.telegram_id = telegram_id
+        # None for a reference stored as {"telegramId"} only; resolve it
+        # through UserRefResolver before showing it
         self.name = name
         self.username = username
     
+    @property
+    def is_ref(self) -> bool:
+        return self.name is None
+    
     def to_dict(self) -> Dict:
+        if self.is_ref:
+            return {"telegramId": self.telegram_id}
         return {
             "telegramId": self.telegram_id,
             "name": self.name,
@@ -43,13 +57,20 @@ class TelegramUser:
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'TelegramUser':
-        return cls(
-            telegram_id=data["telegramId"],
-            name=data["name"],
-            username=data.get("username")
-        )
+        return _interned_telegram_user(data["telegramId"], data.get("name"), data.get("username"))
+
+@lru_cache(maxsize=4096)
+def _interned_telegram_user(telegram_id: int, name: Optional[str], username: Optional[str]) -> TelegramUser:
+    """One shared TelegramUser per identity seen during decode"""
+    return TelegramUser(
+        telegram_id=telegram_id,
+        name=sys.intern(name) if name is not None else None,
+        username=sys.intern(username) if username else username
+    )
 
 class MediaItem:
+    __slots__ = ("type", "path", "metadata", "delete_after")
+    
     def __init__(
         self, 
         type: MediaType, 
@@ -84,6 +105,8 @@ class MediaItem:
         )
 
 class TaskNote:
+    __slots__ = ("id", "content", "author", "created_at", "media")
+    
     def __init__(
         self, 
         id: str, 
@@ -122,6 +145,8 @@ class TaskNote:
         )
 
 class StatusHistoryEntry:
+    __slots__ = ("from_status", "to_status", "changed_by", "changed_at", "reason")
+    
     def __init__(
         self, 
         from_status: Optional[TaskStatus], 
@@ -159,7 +184,82 @@ class StatusHistoryEntry:
             reason=data.get("reason")
         )
 
+# Keys of note and history entries that hold a user
+ENTRY_USER_KEYS = ("author", "changedBy")
+
+def _user_ref(user: Optional[Dict]) -> Optional[Dict]:
+    return {"telegramId": user["telegramId"]} if user else user
+
+def _compact_entry(entry: Dict) -> Dict:
+    return {**entry, **{key: _user_ref(entry[key]) for key in ENTRY_USER_KEYS if entry.get(key)}}
+
+def compact_user_refs(document: Dict) -> Dict:
+    """Copy of a task or segment document with every user reduced to its telegramId
+    
+    Names and usernames are dropped from createdBy, assignees and the
+    authors of notes and history entries; UserRefResolver adds them back
+    from the user cache or roster when the document is served.
+    """
+    compact = dict(document)
+    if "createdBy" in compact:
+        compact["createdBy"] = _user_ref(compact["createdBy"])
+    if "assignees" in compact:
+        compact["assignees"] = [_user_ref(user) for user in compact["assignees"]]
+    for key in ("notes", "statusHistory", "entries"):
+        if key in compact:
+            compact[key] = [_compact_entry(entry) for entry in compact[key]]
+    return compact
+
+# Marks a lazily decoded Task attribute that has not been read yet
+_UNDECODED = object()
+
+def _parse_timestamp(data: Dict, key: str) -> datetime:
+    timestamps = data.get("timestamps", {})
+    return datetime.fromisoformat(timestamps.get(key, datetime.now(timezone.utc).isoformat()))
+
+class _LazyField:
+    """Task attribute decoded from the raw document on first access"""
+    
+    def __init__(self, decode):
+        self.decode = decode
+    
+    def __set_name__(self, owner, name):
+        self.slot = f"_{name}"
+    
+    def __get__(self, task, owner=None):
+        if task is None:
+            return self
+        value = getattr(task, self.slot)
+        if value is _UNDECODED:
+            value = self.decode(task._raw)
+            setattr(task, self.slot, value)
+        return value
+    
+    def __set__(self, task, value):
+        setattr(task, self.slot, value)
+
 class Task:
+    __slots__ = (
+        "_raw", "uid", "title", "description", "status", "priority", "on_hold_reason",
+        "notes_count", "status_history_count",
+        "_created_by", "_assignees", "_notes", "_media", "_status_history",
+        "_created_at", "_updated_at", "_changes",
+    )
+    
+    # Nested collections and timestamps are decoded only when read, so
+    # list/search paths that touch uid, title and status stay cheap
+    created_by = _LazyField(
+        lambda d: TelegramUser.from_dict(d["createdBy"]) if d.get("createdBy") else None
+    )
+    assignees = _LazyField(lambda d: [TelegramUser.from_dict(a) for a in d.get("assignees", [])])
+    notes = _LazyField(lambda d: [TaskNote.from_dict(n) for n in d.get("notes", [])])
+    media = _LazyField(lambda d: [MediaItem.from_dict(m) for m in d.get("media", [])])
+    status_history = _LazyField(
+        lambda d: [StatusHistoryEntry.from_dict(h) for h in d.get("statusHistory", [])]
+    )
+    created_at = _LazyField(lambda d: _parse_timestamp(d, "createdAt"))
+    updated_at = _LazyField(lambda d: _parse_timestamp(d, "updatedAt"))
+    
     def __init__(
         self,
         uid: str,
@@ -174,8 +274,12 @@ class Task:
         status_history: Optional[List[StatusHistoryEntry]] = None,
         on_hold_reason: Optional[str] = None,
         created_at: Optional[datetime] = None,
-        updated_at: Optional[datetime] = None
+        updated_at: Optional[datetime] = None,
+        notes_count: Optional[int] = None,
+        status_history_count: Optional[int] = None
     ):
+        self._raw: Dict = {}
+        self._changes: FrozenSet[str] = frozenset()
         self.uid = uid
         self.title = title
         self.description = description
@@ -186,6 +290,12 @@ class Task:
         self.notes = notes or []
         self.media = media or []
         self.status_history = status_history or []
+        # Older notes and history entries live in segment objects; the
+        # lists above hold only the latest entries, the counts the totals
+        self.notes_count = notes_count if notes_count is not None else len(self.notes)
+        self.status_history_count = (
+            status_history_count if status_history_count is not None else len(self.status_history)
+        )
         self.on_hold_reason = on_hold_reason
         self.created_at = created_at or datetime.now(timezone.utc)
         self.updated_at = updated_at or datetime.now(timezone.utc)
@@ -199,6 +309,7 @@ class Task:
             media=media
         )
         self.notes.append(note)
+        self.notes_count += 1
         self.updated_at = datetime.now(timezone.utc)
         return note
     
@@ -220,6 +331,7 @@ class Task:
         )
         
         self.status_history.append(history_entry)
+        self.status_history_count += 1
         self.status = new_status
         self.updated_at = datetime.now(timezone.utc)
         
@@ -237,52 +349,115 @@ class Task:
         self.assignees = [a for a in self.assignees if a.telegram_id != telegram_id]
         self.updated_at = datetime.now(timezone.utc)
     
+    def _is_decoded(self, name: str) -> bool:
+        return getattr(self, f"_{name}") is not _UNDECODED
+    
+    def _inline_length(self, name: str, raw_key: str) -> int:
+        """Length of an inline list without decoding it"""
+        if self._is_decoded(name):
+            return len(getattr(self, name))
+        return len(self._raw.get(raw_key, []))
+    
+    @property
+    def notes_offset(self) -> int:
+        """Absolute index of the first inline note"""
+        return self.notes_count - self._inline_length("notes", "notes")
+    
+    @property
+    def status_history_offset(self) -> int:
+        """Absolute index of the first inline status history entry"""
+        return self.status_history_count - self._inline_length("status_history", "statusHistory")
+    
+    def _encode_list(self, name: str, raw_key: str) -> List[Dict]:
+        """Encode a list section, passing it through untouched if never decoded"""
+        if not self._is_decoded(name):
+            return self._raw.get(raw_key, [])
+        return [item.to_dict() for item in getattr(self, name)]
+    
+    def _encode_timestamp(self, name: str, raw_key: str) -> str:
+        raw_value = self._raw.get("timestamps", {}).get(raw_key)
+        if not self._is_decoded(name) and raw_value:
+            return raw_value
+        return getattr(self, name).isoformat()
+    
+    def changed_fields(self, user_refs: bool = False) -> Set[str]:
+        """Document keys whose values differ from the loaded document
+        
+        Timestamps are bookkeeping and not compared. Sections that were never
+        decoded are passed through and cost nothing to check. A task that was
+        not loaded from storage reports every key. With user_refs users are
+        compared by telegram_id only, since that is all the stored document
+        keeps of them.
+        """
+        document, raw = self.to_dict(), self._raw
+        if user_refs:
+            document, raw = compact_user_refs(document), compact_user_refs(raw)
+        return {
+            key for key, value in document.items()
+            if key != "timestamps" and (key not in raw or raw[key] != value)
+        }
+    
+    def mark_saved(self, document: Dict, changes: Set[str]):
+        """Record that document was written; changed_fields restarts from it"""
+        self._raw = document
+        self._changes = frozenset(changes)
+    
+    @property
+    def changes(self) -> FrozenSet[str]:
+        """Fields written by the last save through TaskService (empty for a no-op)"""
+        return self._changes
+    
     def to_dict(self) -> Dict:
+        if self._is_decoded("created_by"):
+            created_by = self.created_by.to_dict() if self.created_by else None
+        else:
+            created_by = self._raw.get("createdBy")
+        
         return {
             "uid": self.uid,
             "title": self.title,
             "description": self.description,
             "status": self.status.value,
             "priority": self.priority.value,
-            "createdBy": self.created_by.to_dict() if self.created_by else None,
-            "assignees": [a.to_dict() for a in self.assignees],
-            "notes": [n.to_dict() for n in self.notes],
-            "media": [m.to_dict() for m in self.media],
-            "statusHistory": [h.to_dict() for h in self.status_history],
+            "createdBy": created_by,
+            "assignees": self._encode_list("assignees", "assignees"),
+            "notes": self._encode_list("notes", "notes"),
+            "notesCount": self.notes_count,
+            "media": self._encode_list("media", "media"),
+            "statusHistory": self._encode_list("status_history", "statusHistory"),
+            "statusHistoryCount": self.status_history_count,
             "onHoldReason": self.on_hold_reason,
             "timestamps": {
-                "createdAt": self.created_at.isoformat(),
-                "updatedAt": self.updated_at.isoformat()
+                "createdAt": self._encode_timestamp("created_at", "createdAt"),
+                "updatedAt": self._encode_timestamp("updated_at", "updatedAt")
             }
         }
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Task':
-        created_by = None
-        if data.get("createdBy"):
-            created_by = TelegramUser.from_dict(data["createdBy"])
+        """Build a task view over a stored document
         
-        assignees = [TelegramUser.from_dict(a) for a in data.get("assignees", [])]
-        notes = [TaskNote.from_dict(n) for n in data.get("notes", [])]
-        media = [MediaItem.from_dict(m) for m in data.get("media", [])]
-        status_history = [StatusHistoryEntry.from_dict(h) for h in data.get("statusHistory", [])]
+        Scalar fields are read immediately; nested collections and timestamps
+        are decoded from the document the first time they are accessed.
+        """
+        task = cls.__new__(cls)
+        task._raw = data
+        task._changes = frozenset()
+        task.uid = data["uid"]
+        task.title = data["title"]
+        task.description = data["description"]
+        task.status = TaskStatus(data["status"])
+        task.priority = Priority(data.get("priority", "medium"))
+        task.on_hold_reason = data.get("onHoldReason")
         
-        timestamps = data.get("timestamps", {})
-        created_at = datetime.fromisoformat(timestamps.get("createdAt", datetime.now(timezone.utc).isoformat()))
-        updated_at = datetime.fromisoformat(timestamps.get("updatedAt", datetime.now(timezone.utc).isoformat()))
+        for name in ("created_by", "assignees", "notes", "media",
+                     "status_history", "created_at", "updated_at"):
+            setattr(task, f"_{name}", _UNDECODED)
         
-        return cls(
-            uid=data["uid"],
-            title=data["title"],
-            description=data["description"],
-            status=TaskStatus(data["status"]),
-            priority=Priority(data.get("priority", "medium")),
-            created_by=created_by,
-            assignees=assignees,
-            notes=notes,
-            media=media,
-            status_history=status_history,
-            on_hold_reason=data.get("onHoldReason"),
-            created_at=created_at,
-            updated_at=updated_at
-        )
\ No newline at end of file
+        notes_count = data.get("notesCount")
+        task.notes_count = notes_count if notes_count is not None else len(data.get("notes", []))
+        history_count = data.get("statusHistoryCount")
+        task.status_history_count = (
+            history_count if history_count is not None else len(data.get("statusHistory", []))
+        )
+        return task
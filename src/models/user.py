@@ -1,8 +1,10 @@
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Set
 from src.models.task import UserRole
 
 class User:
+    __slots__ = ("telegram_id", "name", "username", "role", "active", "last_seen_at", "created_at", "_saved")
+    
     def __init__(
         self,
         telegram_id: int,
@@ -20,6 +22,8 @@ class User:
         self.active = active
         self.last_seen_at = last_seen_at or datetime.now(timezone.utc)
         self.created_at = created_at or datetime.now(timezone.utc)
+        # Document as last read or written; None until then
+        self._saved: Optional[Dict] = None
     
     def update_last_seen(self):
         self.last_seen_at = datetime.now(timezone.utc)
@@ -27,6 +31,21 @@ class User:
     def is_admin(self) -> bool:
         return self.role == UserRole.ADMIN
     
+    def changed_fields(self) -> Set[str]:
+        """Document keys that differ from the last read or written document"""
+        document = self.to_dict()
+        if self._saved is None:
+            return set(document)
+        return {key for key, value in document.items() if self._saved.get(key) != value}
+    
+    def stored_value(self, key: str) -> Any:
+        """Value of a document key as last read or written (None if never stored)"""
+        return (self._saved or {}).get(key)
+    
+    def mark_saved(self, document: Optional[Dict] = None):
+        """Record the stored state; changed_fields restarts from it"""
+        self._saved = document if document is not None else self.to_dict()
+    
     def to_dict(self) -> Dict:
         return {
             "telegramId": self.telegram_id,
@@ -48,7 +67,7 @@ class User:
         if data.get("createdAt"):
             created_at = datetime.fromisoformat(data["createdAt"])
         
-        return cls(
+        user = cls(
             telegram_id=data["telegramId"],
             name=data["name"],
             username=data.get("username"),
@@ -56,4 +75,6 @@ class User:
             active=data.get("active", True),
             last_seen_at=last_seen_at,
             created_at=created_at
-        )
\ No newline at end of file
+        )
+        user._saved = data
+        return user
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+from src.config import settings
+from src.storage.gcs_client import GCSClient
+
+logger = logging.getLogger(__name__)
+
+# Targets that are worth indexing: task UIDs and user ids
+TARGET_KEY = re.compile(r'^[A-Za-z0-9_-]+$')
+# "{object path}|{position}" as returned in next_cursor
+CURSOR = re.compile(r'^(audit/(\d{4}/\d{2}/\d{2})/[^/|]+\.jsonl)\|(\d+)$')
+
+
+def audit_targets(target: str, details: Optional[Dict]) -> Set[str]:
+    """Index keys an audit entry is found under
+    
+    "SJ0001/photo.jpg" is filed under SJ0001, and a bulk entry under each
+    of the task UIDs in its details.
+    """
+    keys = {target.split('/', 1)[0]} if target else set()
+    keys.update(str(uid) for uid in (details or {}).get("uids") or [])
+    return {key for key in keys if TARGET_KEY.match(key)}
+
+
+class AuditLog:
+    """Admin audit trail with a per-day target index
+    
+    audit/YYYY/MM/DD/HHMMSS_{admin}.jsonl                      the entries
+    index/audit/target/{target}/YYYY/MM/DD/HHMMSS_{admin}.jsonl empty markers
+    
+    Queries list only the day prefixes inside the requested range, newest
+    day first, and stop as soon as a page is full. With a target filter they
+    list that target's markers instead of whole days; the admin filter is
+    applied to object names before anything is downloaded.
+    """
+    
+    def __init__(self, gcs_client: GCSClient):
+        self.gcs = gcs_client
+    
+    def _day_path(self, day: date) -> str:
+        return day.strftime("%Y/%m/%d")
+    
+    async def record(self, admin_telegram_id: int, action: str, target: str, details: Dict) -> bool:
+        """Append an audit entry and file it under its targets"""
+        now = datetime.now(timezone.utc)
+        name = f"{now.strftime('%H%M%S')}_{admin_telegram_id}.jsonl"
+        day = self._day_path(now.date())
+        
+        entry = {
+            "timestamp": now.isoformat(),
+            "adminTelegramId": admin_telegram_id,
+            "action": action,
+            "target": target,
+            "details": details
+        }
+        
+        if not await self.gcs.append_jsonl(f"audit/{day}/{name}", entry):
+            return False
+        await asyncio.gather(*(
+            self.gcs.create_index_marker(f"index/audit/target/{key}/{day}/{name}")
+            for key in audit_targets(target, details)
+        ))
+        return True
+    
+    async def _list_day(self, day: date, admin_telegram_id: Optional[int], target: Optional[str]) -> List[str]:
+        day_path = self._day_path(day)
+        if target is not None:
+            prefix = f"index/audit/target/{target}/{day_path}/"
+        else:
+            prefix = f"audit/{day_path}/"
+        
+        names = [path[len(prefix):] for path in await self.gcs.list_objects(prefix)]
+        if admin_telegram_id is not None:
+            names = [name for name in names if name.endswith(f"_{admin_telegram_id}.jsonl")]
+        return [f"audit/{day_path}/{name}" for name in names if name.endswith(".jsonl")]
+    
+    async def query(
+        self,
+        date_from: date,
+        date_to: date,
+        admin_telegram_id: Optional[int] = None,
+        action: Optional[str] = None,
+        target: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Audit entries in the date range matching all filters, newest first
+        
+        The cursor is "{object path}|{position}" of the next entry to return.
+        Returns {"entries": [...], "next_cursor": str | None, "objects_fetched": n}.
+        Raises ValueError for a malformed cursor.
+        """
+        cursor_path, cursor_position = None, 0
+        if cursor:
+            match = CURSOR.match(cursor)
+            if not match:
+                raise ValueError(f"Invalid audit cursor {cursor!r}")
+            cursor_path, cursor_position = match.group(1), int(match.group(3))
+            cursor_day = datetime.strptime(match.group(2), "%Y/%m/%d").date()
+            date_to = min(date_to, cursor_day)
+        
+        days = [date_to - timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+        concurrency = settings.AUDIT_MAX_CONCURRENCY
+        
+        def matches(entry: Dict) -> bool:
+            return (
+                (action is None or entry.get("action") == action)
+                and (target is None or target in audit_targets(entry.get("target", ""), entry.get("details")))
+            )
+        
+        entries: List[Dict] = []
+        fetched = 0
+        for start in range(0, len(days), concurrency):
+            listings = await asyncio.gather(
+                *(self._list_day(day, admin_telegram_id, target) for day in days[start:start + concurrency])
+            )
+            paths = sorted((path for listing in listings for path in listing), reverse=True)
+            if cursor_path:
+                paths = [path for path in paths if path <= cursor_path]
+            
+            for offset in range(0, len(paths), concurrency):
+                window = paths[offset:offset + concurrency]
+                documents = await asyncio.gather(*(self.gcs.read_jsonl(path) for path in window))
+                fetched += len(window)
+                
+                for path, lines in zip(window, documents):
+                    # Lines are appended oldest first
+                    lines = list(reversed(lines or []))
+                    first = cursor_position if path == cursor_path else 0
+                    for position in range(first, len(lines)):
+                        if not matches(lines[position]):
+                            continue
+                        entries.append(lines[position])
+                        if len(entries) >= limit:
+                            return {
+                                "entries": entries,
+                                "next_cursor": f"{path}|{position + 1}",
+                                "objects_fetched": fetched
+                            }
+        
+        return {"entries": entries, "next_cursor": None, "objects_fetched": fetched}
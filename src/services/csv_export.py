@@ -0,0 +1,64 @@
+import csv
+import io
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Sequence
+from src.models.task import Task, TelegramUser
+from src.models.user import User
+
+# Rows are buffered until this many characters, then sent as one chunk
+CHUNK_CHARS = 64 * 1024
+
+USER_CSV_HEADER = ["telegramId", "name", "username", "role", "active", "lastSeenAt", "createdAt"]
+TASK_CSV_HEADER = [
+    "uid", "title", "description", "status", "priority", "createdAt", "updatedAt",
+    "createdBy", "assignees", "mediaCount"
+]
+
+
+def user_csv_row(user: User) -> List:
+    return [
+        user.telegram_id,
+        user.name,
+        user.username or "",
+        user.role.value,
+        user.active,
+        user.last_seen_at.isoformat() if user.last_seen_at else "",
+        user.created_at.isoformat()
+    ]
+
+
+def _display_name(user: TelegramUser, users: Dict[int, TelegramUser]) -> str:
+    user = users.get(user.telegram_id, user)
+    return user.name if user.name is not None else str(user.telegram_id)
+
+
+def task_csv_row(task: Task, users: Optional[Dict[int, TelegramUser]] = None) -> List:
+    """One export row; users resolves users stored as references"""
+    users = users or {}
+    return [
+        task.uid,
+        task.title,
+        task.description,
+        task.status.value,
+        task.priority.value,
+        task.created_at.isoformat(),
+        task.updated_at.isoformat(),
+        _display_name(task.created_by, users) if task.created_by else "",
+        ";".join(_display_name(assignee, users) for assignee in task.assignees),
+        len(task.media)
+    ]
+
+
+async def stream_csv(header: Sequence[str], rows: AsyncIterable[Sequence]) -> AsyncIterator[str]:
+    """Encode rows with the csv module and yield the text in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    
+    async for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_CHARS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import time
+from itertools import chain
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from src.config import settings
+from src.models.task import Task, TaskStatus, Priority, StatusHistoryEntry
+
+logger = logging.getLogger(__name__)
+
+STATUSES = list(TaskStatus)
+PRIORITIES = list(Priority)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+PRIORITY_CODES = {priority: code for code, priority in enumerate(PRIORITIES)}
+# Time stops accumulating once a task reaches one of these
+TERMINAL_CODES = np.array([STATUS_CODES[TaskStatus.DONE], STATUS_CODES[TaskStatus.CANCELED]])
+OPEN_STATUSES = [s for s in STATUSES if s not in (TaskStatus.DONE, TaskStatus.CANCELED)]
+PERCENTILES = (50, 90, 95)
+
+# Flattened history of one task: status codes and entry times (epoch seconds,
+# starting with NEW at creation), priority code and assignee ids
+TaskRow = Tuple[np.ndarray, np.ndarray, int, Tuple[int, ...]]
+# Rows saved after each refresh, so a restarted process starts from them
+SNAPSHOT_PATH = "index/analytics/rows.json"
+
+
+def build_row(task: Task, history: List[StatusHistoryEntry]) -> TaskRow:
+    """Flatten a task and its full status history into a TaskRow"""
+    statuses = np.empty(len(history) + 1, dtype=np.int8)
+    times = np.empty(len(history) + 1, dtype=np.float64)
+    statuses[0] = STATUS_CODES[TaskStatus.NEW]
+    times[0] = task.created_at.timestamp()
+    for i, entry in enumerate(history, start=1):
+        statuses[i] = STATUS_CODES[entry.to_status]
+        times[i] = entry.changed_at.timestamp()
+    assignees = tuple(a.telegram_id for a in task.assignees)
+    return statuses, times, PRIORITY_CODES[task.priority], assignees
+
+
+def encode_row(row: TaskRow) -> List:
+    statuses, times, priority, assignees = row
+    return [statuses.tolist(), times.tolist(), priority, list(assignees)]
+
+
+def decode_row(data: List) -> TaskRow:
+    statuses, times, priority, assignees = data
+    return np.array(statuses, dtype=np.int8), np.array(times, dtype=np.float64), priority, tuple(assignees)
+
+
+def _grouped_stats(groups: np.ndarray, values: np.ndarray, n_groups: int) -> List[Optional[Dict]]:
+    """Count, mean and percentiles (in hours) of values per group code
+    
+    NaN values are ignored. Percentiles use linear interpolation, as
+    np.percentile does, computed for all groups at once on values sorted by
+    (group, value).
+    """
+    keep = ~np.isnan(values)
+    groups, values = groups[keep], values[keep] / 3600
+    # Sort by (group, value) with one argsort on a combined key
+    span = values.max() + 1 if len(values) else 1
+    order = np.argsort(groups * span + values)
+    groups, values = groups[order], values[order]
+    
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    
+    stats = {"mean_hours": sums / np.maximum(counts, 1)}
+    for q in PERCENTILES:
+        position = starts + (np.maximum(counts, 1) - 1) * (q / 100)
+        if len(values):
+            lo = np.minimum(np.floor(position).astype(np.int64), len(values) - 1)
+            hi = np.minimum(np.ceil(position).astype(np.int64), len(values) - 1)
+            stats[f"p{q}_hours"] = values[lo] + (values[hi] - values[lo]) * (position - lo)
+        else:
+            stats[f"p{q}_hours"] = np.zeros(n_groups)
+    
+    return [
+        {"count": int(counts[g]), **{key: round(float(column[g]), 2) for key, column in stats.items()}}
+        if counts[g] else None
+        for g in range(n_groups)
+    ]
+
+
+def summarize(rows: Iterable[TaskRow], now: float) -> Dict:
+    """Aggregate flattened task histories with vectorized operations"""
+    rows = list(rows)
+    status_columns, time_columns, priority_codes, assignee_tuples = zip(*rows) if rows else ((), (), (), ())
+    n = len(status_columns)
+    n_statuses = len(STATUSES)
+    
+    lengths = np.fromiter(map(len, status_columns), dtype=np.int64, count=n)
+    statuses = np.concatenate(status_columns).astype(np.int64) if n else np.empty(0, dtype=np.int64)
+    times = np.concatenate(time_columns) if n else np.empty(0)
+    task_index = np.repeat(np.arange(n), lengths)
+    priorities = np.fromiter(priority_codes, dtype=np.int64, count=n)
+    
+    # Each entry lasts until the next one of the same task; the current
+    # status of an open task lasts until now
+    last = np.ones(len(times), dtype=bool)
+    last[:-1] = task_index[1:] != task_index[:-1]
+    next_times = np.empty_like(times)
+    next_times[:-1] = times[1:]
+    terminal = np.isin(statuses, TERMINAL_CODES)
+    ends = np.where(last, np.where(terminal, times, now), next_times)
+    durations = np.maximum(ends - times, 0)
+    
+    cell = task_index * n_statuses + statuses
+    time_in_status = np.bincount(cell, weights=durations, minlength=n * n_statuses).reshape(n, n_statuses)
+    visited = np.bincount(cell, minlength=n * n_statuses).reshape(n, n_statuses) > 0
+    
+    # Cycle time: creation to the first time a task reached DONE
+    created = times[np.cumsum(lengths) - lengths] if n else np.empty(0)
+    done_entries = np.flatnonzero(statuses == STATUS_CODES[TaskStatus.DONE])
+    done_tasks, first_done = np.unique(task_index[done_entries], return_index=True)
+    cycle = np.full(n, np.nan)
+    cycle[done_tasks] = times[done_entries[first_done]] - created[done_tasks]
+    
+    on_hold_code = STATUS_CODES[TaskStatus.ON_HOLD]
+    on_hold = np.where(visited[:, on_hold_code], time_in_status[:, on_hold_code], np.nan)
+    
+    visited_tasks, visited_statuses = np.nonzero(visited)
+    status_stats = _grouped_stats(visited_statuses, time_in_status[visited_tasks, visited_statuses], n_statuses)
+    
+    everything = np.zeros(n, dtype=np.int64)
+    cycle_stats = _grouped_stats(everything, cycle, 1)[0]
+    on_hold_stats = _grouped_stats(everything, on_hold, 1)[0]
+    
+    priority_cycle = _grouped_stats(priorities, cycle, len(PRIORITIES))
+    priority_on_hold = _grouped_stats(priorities, on_hold, len(PRIORITIES))
+    priority_counts = np.bincount(priorities, minlength=len(PRIORITIES))
+    
+    # One (task, assignee) pair per assignment
+    assignee_counts = np.fromiter(map(len, assignee_tuples), dtype=np.int64, count=n)
+    pair_tasks = np.repeat(np.arange(n), assignee_counts)
+    pair_ids = np.fromiter(chain.from_iterable(assignee_tuples), dtype=np.int64, count=int(assignee_counts.sum()))
+    assignee_ids, pair_codes = np.unique(pair_ids, return_inverse=True)
+    assignee_cycle = _grouped_stats(pair_codes, cycle[pair_tasks], len(assignee_ids))
+    assignee_on_hold = _grouped_stats(pair_codes, on_hold[pair_tasks], len(assignee_ids))
+    assignee_tasks = np.bincount(pair_codes, minlength=len(assignee_ids))
+    
+    return {
+        "tasks": n,
+        "time_in_status": {
+            status.value: status_stats[code] for code, status in enumerate(STATUSES) if status_stats[code]
+        },
+        "cycle_time": cycle_stats,
+        "on_hold": on_hold_stats,
+        "by_priority": {
+            priority.value: {
+                "tasks": int(priority_counts[code]),
+                "cycle_time": priority_cycle[code],
+                "on_hold": priority_on_hold[code]
+            }
+            for code, priority in enumerate(PRIORITIES) if priority_counts[code]
+        },
+        "by_assignee": {
+            str(telegram_id): {
+                "tasks": int(assignee_tasks[code]),
+                "cycle_time": assignee_cycle[code],
+                "on_hold": assignee_on_hold[code]
+            }
+            for code, telegram_id in enumerate(assignee_ids.tolist())
+        }
+    }
+
+
+class TaskAnalytics:
+    """Cycle-time and status-duration analytics over all task histories
+    
+    Keeps one flattened TaskRow per task in memory. Rows are updated from
+    TaskService mutation hooks and the summary is recomputed only when rows
+    changed. Every ANALYTICS_REFRESH_SEC a background refresh also picks up
+    tasks changed by other instances: new and deleted task objects, and every
+    task that is currently open (closed tasks only change by being
+    reopened). Requests keep answering from the cached rows meanwhile.
+    
+    The rows are saved to SNAPSHOT_PATH after each refresh, so a new process
+    starts from one read and refreshes from there. Only the very first build,
+    with no snapshot yet, reads every task within a request.
+    """
+    
+    def __init__(self, task_service):
+        self.task_service = task_service
+        self.gcs = task_service.gcs
+        self._rows: Dict[str, TaskRow] = {}
+        self._stale: Set[str] = set()
+        self._summary: Optional[Dict] = None
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._saved_rows: Optional[Dict[str, List]] = None
+        self._lock = asyncio.Lock()
+    
+    def observe(self, task: Task):
+        """Update the cached row of a task that was just written"""
+        if not self._loaded:
+            return
+        
+        if task.status_history_offset == 0:
+            self._rows[task.uid] = build_row(task, task.status_history)
+            self._summary = None
+            return
+        
+        # Older entries live in segments; reuse the cached prefix if we have it
+        cached = self._rows.get(task.uid)
+        if cached is None or len(cached[0]) < task.status_history_offset + 1:
+            self._stale.add(task.uid)
+            return
+        
+        inline = build_row(task, task.status_history)
+        prefix = task.status_history_offset + 1
+        self._rows[task.uid] = (
+            np.concatenate([cached[0][:prefix], inline[0][1:]]),
+            np.concatenate([cached[1][:prefix], inline[1][1:]]),
+            inline[2],
+            inline[3]
+        )
+        self._summary = None
+    
+    def forget(self, uid: str):
+        """Drop a deleted task"""
+        if self._rows.pop(uid, None) is not None:
+            self._summary = None
+        self._stale.discard(uid)
+    
+    async def get_summary(self) -> Dict:
+        """Return the cached summary, refreshing rows first when due"""
+        async with self._lock:
+            if not self._loaded:
+                await self._load_snapshot()
+            if not self._loaded:
+                await self._refresh()
+            elif self._stale:
+                await self._load_rows(list(self._stale))
+            
+            if time.monotonic() - self._refreshed_at >= settings.ANALYTICS_REFRESH_SEC and not self._refreshing:
+                self._refreshing = asyncio.create_task(self._refresh_in_background())
+            
+            if self._summary is None:
+                started = time.perf_counter()
+                summary = summarize(self._rows.values(), datetime.now(timezone.utc).timestamp())
+                summary["computed_in_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                summary["generated_at"] = datetime.now(timezone.utc).isoformat()
+                self._summary = summary
+            
+            return self._summary
+    
+    async def _load_snapshot(self):
+        """Start from the saved rows; the next get_summary refreshes them"""
+        try:
+            snapshot = await self.gcs.read_json(SNAPSHOT_PATH)
+            if not snapshot:
+                return
+            self._saved_rows = snapshot.get("rows", {})
+            self._rows = {uid: decode_row(row) for uid, row in self._saved_rows.items()}
+            self._summary = None
+            self._loaded = True
+            logger.info(f"Loaded analytics rows for {len(self._rows)} tasks from the snapshot")
+        except Exception as e:
+            logger.warning(f"Failed to load analytics snapshot: {e}")
+    
+    async def _refresh_in_background(self):
+        try:
+            await self._refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh analytics rows: {e}")
+        finally:
+            self._refreshing = None
+    
+    async def _refresh(self):
+        """Load new and open tasks, drop deleted ones and save the rows"""
+        # Archived tasks leave tasks/ but keep their creation-day marker
+        paths, created_markers = await asyncio.gather(
+            self.gcs.list_objects("tasks/"),
+            self.gcs.list_objects("index/created/")
+        )
+        uids = {path[len("tasks/"):-len(".json")] for path in paths if path.endswith(".json")}
+        uids |= {marker.split('/')[-1] for marker in created_markers}
+        
+        for uid in set(self._rows) - uids:
+            self.forget(uid)
+        
+        to_load = (uids - set(self._rows)) | self._stale
+        if self._loaded:
+            open_markers = await asyncio.gather(
+                *(self.gcs.list_objects(f"index/status/{status.value}/") for status in OPEN_STATUSES)
+            )
+            to_load |= {marker.split('/')[-1] for markers in open_markers for marker in markers} & uids
+        
+        await self._load_rows(list(to_load))
+        self._loaded = True
+        self._refreshed_at = time.monotonic()
+        logger.info(f"Refreshed analytics rows for {len(to_load)} of {len(uids)} tasks")
+        
+        rows = {uid: encode_row(row) for uid, row in self._rows.items()}
+        if rows == self._saved_rows:
+            return
+        if await self.gcs.write_json(SNAPSHOT_PATH, {"rows": rows}):
+            self._saved_rows = rows
+        else:
+            logger.warning("Failed to save analytics snapshot")
+    
+    async def _load_rows(self, uids: List[str]):
+        semaphore = asyncio.Semaphore(settings.ANALYTICS_MAX_CONCURRENCY)
+        
+        async def load(uid: str):
+            async with semaphore:
+                try:
+                    task = await self.task_service.get_task(uid)
+                    if not task:
+                        self.forget(uid)
+                        return
+                    history = await self.task_service.load_task_history(task)
+                    self._rows[uid] = build_row(task, history)
+                    self._stale.discard(uid)
+                    self._summary = None
+                except Exception as e:
+                    logger.warning(f"Failed to load analytics row for task {uid}: {e}")
+        
+        await asyncio.gather(*(load(uid) for uid in uids))
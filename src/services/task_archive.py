@@ -0,0 +1,126 @@
+import asyncio
+import gzip
+import json
+import logging
+import random
+import re
+from typing import Dict, List, Optional, Set
+from src.config import settings
+from src.storage.gcs_client import GCSClient
+
+logger = logging.getLogger(__name__)
+
+# Archived UIDs per offset index shard
+INDEX_SHARD_SIZE = 1000
+
+
+class TaskArchive:
+    """Cold storage for closed tasks in compressed, append-only monthly packs
+    
+    archive/packs/YYYY/MM/part-NNN.jsonl.gz  concatenated gzip members, one
+                                             task document per member
+    archive/index/NNNNN.json                 {uid: [pack, offset, length]}
+    
+    Each member is a complete gzip stream, so one task can be read back with
+    a ranged GET of its bytes while the whole pack still decompresses as a
+    JSON lines file. Packs only ever grow; a re-archived task gets a new
+    member and its index entry is repointed.
+    """
+    
+    def __init__(self, gcs_client: GCSClient):
+        self.gcs = gcs_client
+    
+    def _index_path(self, uid: str) -> str:
+        digits = re.sub(r'\D', '', uid)
+        shard = int(digits) // INDEX_SHARD_SIZE if digits else 0
+        return f"archive/index/{shard:05d}.json"
+    
+    def _pack_path(self, month: str, part: int) -> str:
+        return f"archive/packs/{month}/part-{part:03d}.jsonl.gz"
+    
+    async def read_task(self, uid: str) -> Optional[Dict]:
+        """Read one archived task document, or None if it is not archived"""
+        try:
+            index = await self.gcs.read_json(self._index_path(uid))
+            if not index or uid not in index:
+                return None
+            
+            pack, offset, length = index[uid]
+            member = await self.gcs.read_range(pack, offset, length)
+            if member is None:
+                return None
+            return json.loads(gzip.decompress(member))
+        except Exception as e:
+            logger.error(f"Failed to read archived task {uid}: {e}")
+            return None
+    
+    async def list_uids(self) -> Set[str]:
+        """UIDs of every archived task, one read per index shard"""
+        paths = await self.gcs.list_objects("archive/index/")
+        shards = await asyncio.gather(*(self.gcs.read_json(path) for path in paths if path.endswith(".json")))
+        return {uid for shard in shards for uid in (shard or {})}
+    
+    async def append(self, month: str, documents: List[Dict]) -> Dict[str, List]:
+        """Append task documents to the month's pack
+        
+        month is "YYYY/MM". Returns {uid: [pack, offset, length]} for the
+        documents written, or {} if the append failed.
+        """
+        members = [
+            gzip.compress((json.dumps(doc, separators=(',', ':'), default=str) + "\n").encode())
+            for doc in documents
+        ]
+        
+        parts = await self.gcs.list_objects(f"archive/packs/{month}/")
+        part = len([p for p in parts if p.endswith('.jsonl.gz')])
+        pack = self._pack_path(month, max(part - 1, 0))
+        
+        offset = await self.gcs.append_bytes(pack, b"".join(members))
+        if offset is None:
+            # Concurrent writer or full composite object: start the next part
+            pack = self._pack_path(month, part)
+            offset = await self.gcs.append_bytes(pack, b"".join(members))
+            if offset is None:
+                logger.error(f"Failed to append {len(members)} task(s) to archive month {month}")
+                return {}
+        
+        locations = {}
+        for doc, member in zip(documents, members):
+            locations[doc["uid"]] = [pack, offset, len(member)]
+            offset += len(member)
+        return locations
+    
+    async def update_index(self, locations: Dict[str, Optional[List]]) -> bool:
+        """Set (or with None, remove) index entries, one write per shard"""
+        by_shard: Dict[str, Dict[str, Optional[List]]] = {}
+        for uid, location in locations.items():
+            by_shard.setdefault(self._index_path(uid), {})[uid] = location
+        
+        results = await asyncio.gather(
+            *(self._update_index_shard(path, entries) for path, entries in by_shard.items())
+        )
+        return all(results)
+    
+    async def _update_index_shard(self, path: str, entries: Dict[str, Optional[List]]) -> bool:
+        for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+            index, generation = await self.gcs.read_json_with_generation(path)
+            index = index or {}
+            for uid, location in entries.items():
+                if location is None:
+                    index.pop(uid, None)
+                else:
+                    index[uid] = location
+            
+            if await self.gcs.write_json(path, index, if_generation_match=generation):
+                return True
+            await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        
+        logger.error(f"Failed to update archive index {path}")
+        return False
+    
+    async def remove(self, uid: str) -> bool:
+        """Forget an archived task; its pack bytes are left in place"""
+        index = await self.gcs.read_json(self._index_path(uid))
+        if not index or uid not in index:
+            return False
+        return await self.update_index({uid: None})
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Set, Tuple
+from src.config import settings
+from src.storage.gcs_client import GCSClient
+from src.models.task import TaskStatus, Priority
+
+logger = logging.getLogger(__name__)
+
+# (status, priority, assignee ids) of a task, as seen by the counters
+TaskCounterState = Tuple[TaskStatus, Priority, Set[int]]
+
+CLOSED_STATUSES = {TaskStatus.DONE, TaskStatus.CANCELED}
+
+class TaskCounters:
+    """Sharded per-status/assignee/priority counts and daily rollups
+    
+    Each shard document holds partial counts:
+    {"status": {...}, "assignee": {...}, "priority": {...},
+     "daily": {"YYYY-MM-DD": {"created": n, "closed": n}}}
+    Increments go to a random shard with a generation-matched write, so
+    concurrent writers rarely collide; totals are the sum of all shards.
+    """
+    
+    def __init__(self, gcs_client: GCSClient):
+        self.gcs = gcs_client
+        # Deltas recorded within the coalescing window, flushed as one write
+        self._pending: Optional[Dict[str, Dict]] = None
+        self._flushed: Optional[asyncio.Future] = None
+    
+    def _shard_path(self, shard: int) -> str:
+        return f"counters/tasks/shard-{shard:02d}.json"
+    
+    @staticmethod
+    def change_delta(
+        before: Optional[TaskCounterState],
+        after: Optional[TaskCounterState]
+    ) -> Dict[str, Dict]:
+        """Counter delta for a task going from one state to another
+        
+        before=None is a newly created task, after=None a deleted one.
+        """
+        delta: Dict[str, Dict] = {"status": {}, "assignee": {}, "priority": {}, "daily": {}}
+        
+        def bump(group: str, key: str, amount: int):
+            delta[group][key] = delta[group].get(key, 0) + amount
+        
+        if before:
+            status, priority, assignee_ids = before
+            bump("status", status.value, -1)
+            bump("priority", priority.value, -1)
+            for telegram_id in assignee_ids:
+                bump("assignee", str(telegram_id), -1)
+        
+        if after:
+            status, priority, assignee_ids = after
+            bump("status", status.value, 1)
+            bump("priority", priority.value, 1)
+            for telegram_id in assignee_ids:
+                bump("assignee", str(telegram_id), 1)
+        
+        today = datetime.now(timezone.utc).date().isoformat()
+        if before is None and after is not None:
+            delta["daily"][today] = {"created": 1}
+        elif before and after and after[0] in CLOSED_STATUSES and before[0] not in CLOSED_STATUSES:
+            delta["daily"][today] = {"closed": 1}
+        
+        # Drop groups and keys that cancel out
+        for group in ("status", "assignee", "priority"):
+            delta[group] = {k: v for k, v in delta[group].items() if v}
+        return {group: values for group, values in delta.items() if values}
+    
+    async def record_change(
+        self,
+        before: Optional[TaskCounterState],
+        after: Optional[TaskCounterState]
+    ) -> bool:
+        """Apply the counter delta for a task state change
+        
+        Changes recorded within TASK_COALESCE_WINDOW_MS of each other are
+        summed and written to a shard together, so bulk updates cost one
+        counter write instead of one per task.
+        """
+        delta = self.change_delta(before, after)
+        if not delta:
+            return True
+        
+        if self._pending is None:
+            self._pending = {}
+            self._flushed = asyncio.get_running_loop().create_future()
+            asyncio.create_task(self._flush())
+        
+        self._add(self._pending, delta)
+        return await asyncio.shield(self._flushed)
+    
+    async def _flush(self):
+        await asyncio.sleep(settings.TASK_COALESCE_WINDOW_MS / 1000)
+        delta, flushed = self._pending, self._flushed
+        self._pending, self._flushed = None, None
+        
+        delta = {group: values for group, values in delta.items() if values}
+        flushed.set_result(await self.apply(delta) if delta else True)
+    
+    async def apply(self, delta: Dict[str, Dict]) -> bool:
+        """Add a delta to a random shard, retrying on write conflicts"""
+        for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+            path = self._shard_path(random.randrange(settings.TASK_COUNTER_SHARDS))
+            try:
+                shard, generation = await self.gcs.read_json_with_generation(path)
+                shard = self._add(shard or {}, delta)
+                if await self.gcs.write_json(path, shard, if_generation_match=generation):
+                    return True
+            except Exception as e:
+                logger.warning(f"Counter update on {path} failed: {e}")
+            
+            # Another writer got there first; try again, likely on another shard
+            await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        
+        logger.error(f"Failed to apply counter delta {delta}")
+        return False
+    
+    def _add(self, shard: Dict, delta: Dict[str, Dict]) -> Dict:
+        for group in ("status", "assignee", "priority"):
+            counts = shard.setdefault(group, {})
+            for key, amount in delta.get(group, {}).items():
+                counts[key] = counts.get(key, 0) + amount
+                if counts[key] == 0:
+                    del counts[key]
+        
+        daily = shard.setdefault("daily", {})
+        for day, values in delta.get("daily", {}).items():
+            day_counts = daily.setdefault(day, {})
+            for key, amount in values.items():
+                day_counts[key] = day_counts.get(key, 0) + amount
+        
+        # Keep shard documents bounded
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=settings.TASK_ROLLUP_RETENTION_DAYS)).isoformat()
+        for day in [d for d in daily if d < cutoff]:
+            del daily[day]
+        
+        return shard
+    
+    async def read(self) -> Dict[str, Dict]:
+        """Sum all shards (read in parallel)"""
+        shards = await asyncio.gather(
+            *(self.gcs.read_json(self._shard_path(i)) for i in range(settings.TASK_COUNTER_SHARDS))
+        )
+        totals: Dict[str, Dict] = {"status": {}, "assignee": {}, "priority": {}, "daily": {}}
+        for shard in shards:
+            if shard:
+                self._add(totals, shard)
+        return totals
+    
+    async def reconcile(self) -> Dict[str, Dict]:
+        """Recompute counts from the index markers and reset the shards
+        
+        Status, assignee and priority counts and daily created counts are
+        rebuilt from the indexes; daily closed counts cannot be derived from
+        them and are carried over from the current shards.
+        """
+        current = await self.read()
+        
+        status_markers, assignee_markers, priority_markers, created_markers = await asyncio.gather(
+            self.gcs.list_objects("index/status/"),
+            self.gcs.list_objects("index/assignee/"),
+            self.gcs.list_objects("index/priority/"),
+            self.gcs.list_objects("index/created/"),
+        )
+        
+        def count_by_key(markers, key_position: int) -> Dict[str, int]:
+            counts: Dict[str, int] = {}
+            for marker in markers:
+                key = marker.split('/')[key_position]
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+        
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=settings.TASK_ROLLUP_RETENTION_DAYS)).isoformat()
+        daily: Dict[str, Dict[str, int]] = {}
+        for day, values in current["daily"].items():
+            if values.get("closed"):
+                daily[day] = {"closed": values["closed"]}
+        for marker in created_markers:
+            # index/created/YYYY/MM/DD/<uid>
+            _, _, year, month, day, _ = marker.split('/')
+            day_key = f"{year}-{month}-{day}"
+            if day_key >= cutoff:
+                daily.setdefault(day_key, {})
+                daily[day_key]["created"] = daily[day_key].get("created", 0) + 1
+        
+        totals = {
+            "status": count_by_key(status_markers, 2),
+            "assignee": count_by_key(assignee_markers, 2),
+            "priority": count_by_key(priority_markers, 2),
+            "daily": daily,
+        }
+        
+        await self.gcs.write_json(self._shard_path(0), totals)
+        for i in range(1, settings.TASK_COUNTER_SHARDS):
+            await self.gcs.write_json(self._shard_path(i), {})
+        
+        logger.info("Reconciled task counters from indexes")
+        return totals
@@ -1,15 +1,44 @@
+import asyncio
 import logging
-from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Dict, Any
+import random
+import time
+from collections import deque
+from datetime import date, datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+from src.config import settings
 from src.storage.gcs_client import GCSClient
-from src.models.task import Task, TaskStatus, TelegramUser
+from src.models.task import (
+    Task, TaskStatus, Priority, TelegramUser, MediaItem, MediaType, TaskNote, StatusHistoryEntry, compact_user_refs
+)
 from src.models.user import User
+from src.services.task_counters import TaskCounters, TaskCounterState
+from src.services.task_analytics import TaskAnalytics
+from src.services.task_archive import TaskArchive
+from src.services.upload_budget import UploadBudget
+from src.services.csv_export import TASK_CSV_HEADER, stream_csv, task_csv_row
+from src.services.user_refs import UserRefResolver
 
 logger = logging.getLogger(__name__)
 
+# Document fields that index markers and counters are derived from
+INDEXED_FIELDS = {"status", "priority", "assignees"}
+# Fields that feed the analytics rows
+ANALYTICS_FIELDS = {"statusHistory", "statusHistoryCount", "priority", "assignees"}
+
 class TaskService:
     def __init__(self, gcs_client: GCSClient):
         self.gcs = gcs_client
+        # Per-task mutation queues; share one TaskService per process so
+        # bursts from the bot and the API coalesce into one write
+        self._pending_mutations: Dict[str, List[Tuple[Callable[[Task], Optional[bool]], asyncio.Future]]] = {}
+        self._mutation_workers: Dict[str, asyncio.Task] = {}
+        # Last seen entry count per index prefix, used by the query planner
+        self._index_cardinality: Dict[str, int] = {}
+        self.counters = TaskCounters(gcs_client)
+        self.analytics = TaskAnalytics(self)
+        self.archive = TaskArchive(gcs_client)
+        # Shared by all uploads of this process
+        self._upload_budget = UploadBudget(settings.MEDIA_UPLOAD_MAX_INFLIGHT_BYTES)
     
     async def create_task(
         self, 
@@ -18,7 +47,13 @@ class TaskService:
         created_by: TelegramUser,
         media_files: Optional[List[Dict[str, Any]]] = None
     ) -> Task:
-        """Create a new task with sequential UID"""
+        """Create a new task with sequential UID
+        
+        Media files upload concurrently (bounded by the shared upload byte
+        budget), and the index markers are written alongside the task
+        document. If the document write fails, the uploaded media and markers
+        are removed again.
+        """
         try:
             # Generate sequential UID
             uid = await self.gcs.get_next_uid()
@@ -33,46 +68,70 @@ class TaskService:
             
             # Handle media files
             if media_files:
-                for media_info in media_files:
-                    media_path = f"media/{uid}/{media_info['filename']}"
-                    success = await self.gcs.upload_media(
-                        media_info['data'],
-                        media_path,
-                        media_info['content_type']
-                    )
-                    
-                    if success:
-                        from src.models.task import MediaItem, MediaType
-                        media_item = MediaItem(
-                            type=MediaType(media_info['type']),
-                            path=media_path,
-                            metadata={
-                                'filename': media_info['filename'],
-                                'size': len(media_info['data']),
-                                'content_type': media_info['content_type']
-                            }
-                        )
-                        task.media.append(media_item)
+                media_items = await asyncio.gather(
+                    *(self._upload_media_file(f"media/{uid}/{info['filename']}", info) for info in media_files)
+                )
+                task.media = [item for item in media_items if item]
             
-            # Save task
+            # Save task and create index markers together
             task_path = f"tasks/{uid}.json"
-            await self.gcs.write_json(task_path, task.to_dict())
+            saved, _ = await asyncio.gather(
+                self.gcs.write_json(task_path, self._stored_document(task.to_dict()), if_generation_match=0),
+                self._create_task_indices(task)
+            )
+            if not saved:
+                await asyncio.gather(
+                    *(self.gcs.delete_index_marker(path) for path in self._task_index_paths(task)),
+                    *(self.gcs.delete_object(item.path) for item in task.media)
+                )
+                raise Exception(f"Failed to save task {uid}")
             
-            # Create index markers
-            await self._create_task_indices(task)
+            await self.counters.record_change(None, self._counter_state(task))
+            self.analytics.observe(task)
             
             logger.info(f"Created task {uid}")
             return task
-            
+        
         except Exception as e:
             logger.error(f"Failed to create task: {e}")
             raise
     
+    def _stored_document(self, document: Dict) -> Dict:
+        """The form a task or segment document is written in
+        
+        With TASK_USER_REFS users are stored as {"telegramId"} references;
+        the Task keeps the full document, so only storage changes.
+        """
+        if settings.TASK_USER_REFS:
+            return compact_user_refs(document)
+        return document
+    
+    async def _upload_media_file(self, media_path: str, media_info: Dict[str, Any]) -> Optional[MediaItem]:
+        """Upload one media file within the upload byte budget"""
+        async with self._upload_budget.reserve(len(media_info['data'])):
+            success = await self.gcs.upload_media(
+                media_info['data'],
+                media_path,
+                media_info['content_type']
+            )
+        
+        if not success:
+            return None
+        
+        return MediaItem(
+            type=MediaType(media_info['type']),
+            path=media_path,
+            metadata={
+                'filename': media_info['filename'],
+                'size': len(media_info['data']),
+                'content_type': media_info['content_type']
+            }
+        )
+    
     async def get_task(self, uid: str) -> Optional[Task]:
-        """Get task by UID"""
+        """Get task by UID (archived tasks are read from their pack)"""
         try:
-            task_path = f"tasks/{uid}.json"
-            data = await self.gcs.read_json(task_path)
+            data = await self._read_task_data(uid)
             if not data:
                 return None
             
@@ -81,15 +140,35 @@ class TaskService:
             logger.error(f"Failed to get task {uid}: {e}")
             return None
     
+    async def _read_task_data(self, uid: str) -> Optional[Dict]:
+        """Raw task document from tasks/, falling back to the cold archive"""
+        data = await self.gcs.read_json(f"tasks/{uid}.json")
+        if data is None:
+            data = await self.archive.read_task(uid)
+        return data
+    
     async def update_task(self, task: Task) -> bool:
-        """Update task and indices"""
+        """Update task and indices
+        
+        This overwrites the stored document without a generation check; use
+        mutate_task for read-modify-write updates so concurrent changes are
+        not lost. Nothing is written if no field changed since the task was
+        loaded.
+        """
         try:
+            changes = task.changed_fields(user_refs=settings.TASK_USER_REFS)
+            if not changes:
+                return True
+            
             task.updated_at = datetime.now(timezone.utc)
             task_path = f"tasks/{task.uid}.json"
             
-            success = await self.gcs.write_json(task_path, task.to_dict())
+            document = task.to_dict()
+            success = await self.gcs.write_json(task_path, self._stored_document(document))
             if success:
-                await self._update_task_indices(task)
+                task.mark_saved(document, changes)
+                if changes & INDEXED_FIELDS:
+                    await self._update_task_indices(task)
                 logger.info(f"Updated task {task.uid}")
             
             return success
@@ -97,6 +176,261 @@ class TaskService:
             logger.error(f"Failed to update task {task.uid}: {e}")
             return False
     
+    async def mutate_task(
+        self,
+        uid: str,
+        mutation: Callable[[Task], Optional[bool]]
+    ) -> Optional[Task]:
+        """Apply a read-modify-write to a task with generation-matched writes
+        
+        The mutation receives a freshly loaded task and is called again if
+        another writer saved the task in between, so it must only change the
+        task it is given. Returning False from the mutation skips the write.
+        
+        Mutations for the same task that arrive within the coalescing window,
+        or while a write for that task is in flight, are applied together in a
+        single load/apply/save cycle; every caller gets the combined result.
+        
+        Returns the saved task, or None if the task does not exist or the
+        write kept conflicting.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending_mutations.setdefault(uid, []).append((mutation, future))
+        
+        if uid not in self._mutation_workers:
+            self._mutation_workers[uid] = asyncio.create_task(self._run_mutation_queue(uid))
+        
+        return await future
+    
+    async def _run_mutation_queue(self, uid: str):
+        """Drain the pending mutations for a task, one batched write at a time"""
+        try:
+            while self._pending_mutations.get(uid):
+                # Let a burst of mutations for this task gather
+                await asyncio.sleep(settings.TASK_COALESCE_WINDOW_MS / 1000)
+                batch = self._pending_mutations.pop(uid)
+                
+                task, errors = await self._apply_mutations(uid, [mutation for mutation, _ in batch])
+                
+                if len(batch) > 1:
+                    logger.info(f"Coalesced {len(batch)} mutations into one write for task {uid}")
+                
+                for i, (_, future) in enumerate(batch):
+                    if future.done():
+                        continue
+                    if i in errors:
+                        future.set_exception(errors[i])
+                    else:
+                        future.set_result(task)
+        finally:
+            self._mutation_workers.pop(uid, None)
+    
+    async def _apply_mutations(
+        self,
+        uid: str,
+        mutations: List[Callable[[Task], Optional[bool]]]
+    ) -> Tuple[Optional[Task], Dict[int, Exception]]:
+        """Load a task, apply mutations in order and save it once
+        
+        A mutation that raises is reported back to its caller only and does
+        not prevent the others from being saved.
+        """
+        task_path = f"tasks/{uid}.json"
+        max_attempts = settings.TASK_MUTATION_MAX_ATTEMPTS
+        errors: Dict[int, Exception] = {}
+        
+        try:
+            for attempt in range(max_attempts):
+                data, generation = await self.gcs.read_json_with_generation(task_path)
+                if not data:
+                    # Writing an archived task with generation 0 restores it to tasks/
+                    data = await self.archive.read_task(uid)
+                if not data:
+                    return None, {}
+                
+                task = Task.from_dict(data)
+                previous_status = task.status
+                previous_priority = task.priority
+                previous_assignee_ids = {a["telegramId"] for a in data.get("assignees", [])}
+                committed_counts = (task.notes_count, task.status_history_count)
+                
+                errors = {}
+                changed = False
+                for i, mutation in enumerate(mutations):
+                    try:
+                        if mutation(task) is not False:
+                            changed = True
+                    except Exception as e:
+                        errors[i] = e
+                
+                # Mutations that set fields to their current values write nothing
+                changes = task.changed_fields(user_refs=settings.TASK_USER_REFS) if changed else set()
+                if not changes:
+                    return task, errors
+                
+                task.updated_at = datetime.now(timezone.utc)
+                await self._spill_segments(task, *committed_counts)
+                document = task.to_dict()
+                if await self.gcs.write_json(task_path, self._stored_document(document), if_generation_match=generation):
+                    task.mark_saved(document, changes)
+                    if changes & INDEXED_FIELDS:
+                        await self._sync_task_indices(task, previous_status, previous_priority, previous_assignee_ids)
+                        await self.counters.record_change(
+                            (previous_status, previous_priority, previous_assignee_ids),
+                            self._counter_state(task)
+                        )
+                    if changes & ANALYTICS_FIELDS:
+                        self.analytics.observe(task)
+                    logger.info(f"Updated task {uid} ({', '.join(sorted(changes))})")
+                    return task, errors
+                
+                # Lost the race: back off with full jitter and re-run the mutations
+                backoff = settings.TASK_MUTATION_BACKOFF_MS / 1000 * (2 ** attempt)
+                logger.warning(f"Write conflict on task {uid}, attempt {attempt + 1}")
+                await asyncio.sleep(random.uniform(0, min(backoff, 2.0)))
+            
+            logger.error(f"Failed to update task {uid} after {max_attempts} conflicting writes")
+            return None, errors
+        except Exception as e:
+            logger.error(f"Failed to update task {uid}: {e}")
+            return None, errors
+    
+    async def _spill_segments(self, task: Task, committed_notes: int, committed_history: int):
+        """Move the oldest inline notes and history entries into segment objects
+        
+        Entries are spilled in fixed-size chunks to immutable objects named by
+        their absolute start index. Only entries that were already saved in
+        the document we loaded are spilled, so competing writers produce
+        identical segments and the writes are safe to repeat on a retry.
+        """
+        segment_writes = []
+        threshold = settings.TASK_INLINE_ENTRIES + settings.TASK_SEGMENT_SIZE
+        
+        # Check inline lengths first so untouched lists are not decoded
+        if task.notes_count - task.notes_offset >= threshold:
+            task.notes, note_chunks = self._split_segments(task.notes, task.notes_offset, committed_notes)
+            for start, chunk in note_chunks:
+                segment_writes.append(self._write_segment(task.uid, "notes", start, chunk))
+        
+        if task.status_history_count - task.status_history_offset >= threshold:
+            task.status_history, history_chunks = self._split_segments(
+                task.status_history, task.status_history_offset, committed_history
+            )
+            for start, chunk in history_chunks:
+                segment_writes.append(self._write_segment(task.uid, "history", start, chunk))
+        
+        if not all(await asyncio.gather(*segment_writes)):
+            raise Exception(f"Failed to write segments for task {task.uid}")
+    
+    def _split_segments(self, entries: list, offset: int, committed: int) -> Tuple[list, List[Tuple[int, list]]]:
+        """Split full segments off the front of an inline list
+        
+        Returns the remaining inline entries and the (start, entries) chunks.
+        """
+        segment_size = settings.TASK_SEGMENT_SIZE
+        chunks = []
+        while (len(entries) >= settings.TASK_INLINE_ENTRIES + segment_size and
+               offset + segment_size <= committed):
+            chunks.append((offset, entries[:segment_size]))
+            entries = entries[segment_size:]
+            offset += segment_size
+        return entries, chunks
+    
+    async def _write_segment(self, uid: str, kind: str, start: int, entries: list) -> bool:
+        """Write an immutable notes/history segment"""
+        return await self.gcs.write_json(f"segments/{uid}/{kind}/{start:08d}.json", self._stored_document({
+            "uid": uid,
+            "start": start,
+            "entries": [e.to_dict() for e in entries]
+        }))
+    
+    async def _read_segments(self, uid: str, kind: str, end: int) -> List[Dict]:
+        """Read spilled entries [0, end) of a task's notes or history"""
+        if end <= 0:
+            return []
+        
+        paths = await self.gcs.list_objects(f"segments/{uid}/{kind}/")
+        segments = await asyncio.gather(*(self.gcs.read_json(path) for path in paths))
+        
+        entries: List[Dict] = []
+        for segment in sorted((s for s in segments if s), key=lambda s: s["start"]):
+            # Skip anything not contiguous with what we have so far
+            if segment["start"] == len(entries):
+                entries.extend(segment["entries"])
+        
+        if len(entries) < end:
+            logger.warning(f"Task {uid} {kind} segments hold {len(entries)} of {end} entries")
+        return entries[:end]
+    
+    async def load_task_notes(self, task: Task) -> List[TaskNote]:
+        """Return all notes of a task: spilled segments followed by the inline notes"""
+        entries = await self._read_segments(task.uid, "notes", task.notes_offset)
+        return [TaskNote.from_dict(e) for e in entries] + task.notes
+    
+    async def load_task_history(self, task: Task) -> List[StatusHistoryEntry]:
+        """Return the full status history: spilled segments followed by inline entries"""
+        entries = await self._read_segments(task.uid, "history", task.status_history_offset)
+        return [StatusHistoryEntry.from_dict(e) for e in entries] + task.status_history
+    
+    async def _spill_task(self, uid: str) -> Optional[bool]:
+        """Spill a task's full segments even though nothing else changed
+        
+        mutate_task skips tasks whose fields are unchanged, so this does the
+        spill on its own, with the same generation-matched write. updatedAt
+        is left alone. Returns True if the document was rewritten, False if
+        nothing was due and None if the write failed.
+        """
+        task_path = f"tasks/{uid}.json"
+        for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+            data, generation = await self.gcs.read_json_with_generation(task_path)
+            if not data:
+                return None
+            
+            task = Task.from_dict(data)
+            await self._spill_segments(task, task.notes_count, task.status_history_count)
+            changes = task.changed_fields(user_refs=settings.TASK_USER_REFS)
+            if not changes:
+                return False
+            
+            document = task.to_dict()
+            if await self.gcs.write_json(task_path, self._stored_document(document), if_generation_match=generation):
+                task.mark_saved(document, changes)
+                logger.info(f"Spilled segments of task {uid} ({', '.join(sorted(changes))})")
+                return True
+            
+            logger.warning(f"Write conflict on task {uid}, attempt {attempt + 1}")
+            await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        
+        logger.error(f"Failed to spill segments of task {uid} after {settings.TASK_MUTATION_MAX_ATTEMPTS} conflicting writes")
+        return None
+    
+    async def migrate_task_segments(self) -> Dict[str, int]:
+        """Move inline notes/history of existing task documents into segments"""
+        try:
+            threshold = settings.TASK_INLINE_ENTRIES + settings.TASK_SEGMENT_SIZE
+            checked = 0
+            migrated = 0
+            
+            for path in await self.gcs.list_objects("tasks/"):
+                if not path.endswith('.json'):
+                    continue
+                
+                task_data = await self.gcs.read_json(path)
+                if not task_data:
+                    continue
+                
+                checked += 1
+                if (len(task_data.get('notes', [])) >= threshold or
+                        len(task_data.get('statusHistory', [])) >= threshold):
+                    if await self._spill_task(task_data['uid']):
+                        migrated += 1
+            
+            logger.info(f"Migrated {migrated} of {checked} tasks to segmented notes/history")
+            return {"checked_tasks": checked, "migrated_tasks": migrated}
+        except Exception as e:
+            logger.error(f"Failed to migrate task segments: {e}")
+            return {"checked_tasks": 0, "migrated_tasks": 0}
+    
     async def change_task_status(
         self, 
         uid: str, 
@@ -105,55 +439,34 @@ class TaskService:
         reason: Optional[str] = None
     ) -> bool:
         """Change task status with history tracking"""
-        task = await self.get_task(uid)
+        def apply(task: Task):
+            task.change_status(new_status, changed_by, reason)
+            
+            # Set deletion date for media when task is done
+            if new_status == TaskStatus.DONE and task.media:
+                deletion_date = datetime.now(timezone.utc) + timedelta(days=7)
+                for media_item in task.media:
+                    media_item.delete_after = deletion_date
+        
+        task = await self.mutate_task(uid, apply)
         if not task:
             return False
         
-        old_status = task.status
-        task.change_status(new_status, changed_by, reason)
-        
-        # Set deletion date for media when task is done
+        # Schedule media for the retention job
         if new_status == TaskStatus.DONE and task.media:
-            deletion_date = datetime.now(timezone.utc) + timedelta(days=7)
-            for media_item in task.media:
-                media_item.delete_after = deletion_date
+            await self._schedule_media_retention(task.uid, task.media)
         
-        success = await self.update_task(task)
-        if success:
-            # Update status index
-            await self._update_status_index(task, old_status, new_status)
-        
-        return success
+        return True
     
     async def assign_task(self, uid: str, assignee: TelegramUser) -> bool:
         """Assign task to user"""
-        task = await self.get_task(uid)
-        if not task:
-            return False
-        
-        task.add_assignee(assignee)
-        success = await self.update_task(task)
-        
-        if success:
-            # Create assignee index
-            await self._create_assignee_index(task.uid, assignee.telegram_id)
-        
-        return success
+        task = await self.mutate_task(uid, lambda t: t.add_assignee(assignee))
+        return task is not None
     
     async def unassign_task(self, uid: str, telegram_id: int) -> bool:
         """Unassign task from user"""
-        task = await self.get_task(uid)
-        if not task:
-            return False
-        
-        task.remove_assignee(telegram_id)
-        success = await self.update_task(task)
-        
-        if success:
-            # Remove assignee index
-            await self._remove_assignee_index(task.uid, telegram_id)
-        
-        return success
+        task = await self.mutate_task(uid, lambda t: t.remove_assignee(telegram_id))
+        return task is not None
     
     async def add_task_note(
         self, 
@@ -163,33 +476,91 @@ class TaskService:
         media_file: Optional[Dict[str, Any]] = None
     ) -> bool:
         """Add note to task"""
-        task = await self.get_task(uid)
-        if not task:
-            return False
-        
         media_item = None
         if media_file:
-            media_path = f"media/{uid}/notes/{media_file['filename']}"
-            success = await self.gcs.upload_media(
-                media_file['data'],
-                media_path,
-                media_file['content_type']
-            )
-            
-            if success:
-                from src.models.task import MediaItem, MediaType
-                media_item = MediaItem(
-                    type=MediaType(media_file['type']),
-                    path=media_path,
-                    metadata={
-                        'filename': media_file['filename'],
-                        'size': len(media_file['data']),
-                        'content_type': media_file['content_type']
-                    }
-                )
+            media_item = await self._upload_media_file(f"media/{uid}/notes/{media_file['filename']}", media_file)
+        
+        task = await self.mutate_task(uid, lambda t: t.add_note(content, author, media_item))
+        if not task and media_item:
+            # Don't leave the uploaded attachment behind
+            await self.gcs.delete_object(media_item.path)
+        
+        return task is not None
+    
+    async def bulk_update_tasks(
+        self,
+        uids: List[str],
+        operation: str,
+        changed_by: TelegramUser,
+        status: Optional[TaskStatus] = None,
+        reason: Optional[str] = None,
+        priority: Optional[Priority] = None,
+        assignees: Optional[List[TelegramUser]] = None,
+        assignee_ids: Optional[List[int]] = None
+    ) -> Dict[str, Optional[str]]:
+        """Apply one operation to many tasks with bounded concurrency
+        
+        operation is one of set_status, set_priority, assign and
+        set_assignees (which take assignees) or unassign (which takes
+        assignee_ids). Returns {uid: None} for each success and {uid: error}
+        for each failure; one task failing does not stop the others.
+        """
+        if operation == "set_status" and status is None:
+            raise ValueError("set_status requires a status")
+        if operation == "set_priority" and priority is None:
+            raise ValueError("set_priority requires a priority")
+        if operation in ("assign", "set_assignees") and assignees is None:
+            raise ValueError(f"{operation} requires assignees")
+        if operation == "unassign" and assignee_ids is None:
+            raise ValueError("unassign requires assignee_ids")
+        
+        def set_priority(task: Task):
+            if task.priority == priority:
+                return False
+            task.priority = priority
         
-        task.add_note(content, author, media_item)
-        return await self.update_task(task)
+        def assign(task: Task):
+            for assignee in assignees:
+                task.add_assignee(assignee)
+        
+        def unassign(task: Task):
+            if not any(a.telegram_id in assignee_ids for a in task.assignees):
+                return False
+            for telegram_id in assignee_ids:
+                task.remove_assignee(telegram_id)
+        
+        def set_assignees(task: Task):
+            task.assignees = list(assignees)
+        
+        mutations = {
+            "set_priority": set_priority,
+            "assign": assign,
+            "unassign": unassign,
+            "set_assignees": set_assignees,
+        }
+        if operation != "set_status" and operation not in mutations:
+            raise ValueError(f"Unknown bulk operation: {operation}")
+        
+        semaphore = asyncio.Semaphore(settings.BULK_MAX_CONCURRENCY)
+        
+        async def run(uid: str) -> Optional[str]:
+            async with semaphore:
+                try:
+                    if operation == "set_status":
+                        ok = await self.change_task_status(uid, status, changed_by, reason)
+                    else:
+                        ok = await self.mutate_task(uid, mutations[operation]) is not None
+                    return None if ok else "Task not found or update failed"
+                except Exception as e:
+                    return str(e)
+        
+        # Preserve request order, drop repeats
+        unique_uids = list(dict.fromkeys(uids))
+        errors = await asyncio.gather(*(run(uid) for uid in unique_uids))
+        
+        failed = sum(1 for error in errors if error)
+        logger.info(f"Bulk {operation} on {len(unique_uids)} tasks, {failed} failed")
+        return dict(zip(unique_uids, errors))
     
     async def list_tasks_by_status(self, status: TaskStatus, limit: int = 100) -> List[str]:
         """List task UIDs by status using index"""
@@ -263,14 +634,444 @@ class TaskService:
             logger.error(f"Failed to search tasks: {e}")
             return []
     
-    async def delete_expired_media(self) -> Dict[str, int]:
-        """Delete media files that have passed their deletion date"""
+    async def backfill_task_indices(self) -> Dict[str, int]:
+        """Create index markers for every existing task (full scan)
+        
+        Writes status, assignee, priority, creator and creation-day markers
+        and removes priority markers that no longer match the task.
+        """
+        try:
+            indexed = 0
+            stale_removed = 0
+            priorities: Dict[str, str] = {}
+            
+            for path in await self.gcs.list_objects("tasks/"):
+                if not path.endswith('.json') or path.count('/') != 1:
+                    continue
+                
+                task_data = await self.gcs.read_json(path)
+                if not task_data:
+                    continue
+                
+                task = Task.from_dict(task_data)
+                await self._create_task_indices(task)
+                priorities[task.uid] = task.priority.value
+                indexed += 1
+            
+            for marker in await self.gcs.list_objects("index/priority/"):
+                _, _, priority_value, uid = marker.split('/', 3)
+                if priorities.get(uid) != priority_value:
+                    await self.gcs.delete_index_marker(marker)
+                    stale_removed += 1
+            
+            logger.info(f"Backfilled indices for {indexed} tasks, removed {stale_removed} stale markers")
+            return {"indexed_tasks": indexed, "stale_markers_removed": stale_removed}
+        except Exception as e:
+            logger.error(f"Failed to backfill task indices: {e}")
+            return {"indexed_tasks": 0, "stale_markers_removed": 0}
+    
+    async def query_tasks(
+        self,
+        statuses: Optional[List[TaskStatus]] = None,
+        assignee_id: Optional[int] = None,
+        priority: Optional[Priority] = None,
+        created_by: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        text: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Find tasks matching any combination of filters
+        
+        The planner orders the applicable indexes by estimated cardinality,
+        lists the most selective one and intersects the others only while
+        that is cheaper than checking them on the fetched documents; filters
+        without an index are checked on the documents. Documents are fetched
+        in UID order only until the page is full. Archived tasks are found
+        too: indexes keep their markers, and a scan without any indexed
+        filter adds the UIDs from the archive index.
+        
+        Returns {"tasks": [Task], "next_cursor": str | None, "plan": dict}.
+        """
+        ordered, residual, plan = await self._plan_query(
+            statuses, assignee_id, priority, created_by, created_from, created_to, text, cursor
+        )
+        
+        # Fetch documents in chunks until the page is full
+        tasks: List[Task] = []
+        fetched = 0
+        position = 0
+        while position < len(ordered) and len(tasks) < limit:
+            # Residual filters drop some documents, so fetch a quarter more
+            # than the page still needs; without them exactly what it needs
+            need = limit - len(tasks)
+            chunk = ordered[position:position + need + (need // 4 + 1 if residual else 0)]
+            position += len(chunk)
+            documents = await asyncio.gather(*(self._read_task_data(uid) for uid in chunk))
+            fetched += len(chunk)
+            
+            for data in documents:
+                if data and all(predicate(data) for predicate in residual.values()):
+                    tasks.append(Task.from_dict(data))
+                    if len(tasks) >= limit:
+                        break
+        
+        plan["docs_fetched"] = fetched
+        next_cursor = tasks[-1].uid if len(tasks) >= limit and tasks[-1].uid != ordered[-1] else None
+        
+        return {"tasks": tasks, "next_cursor": next_cursor, "plan": plan}
+    
+    async def iter_tasks(
+        self,
+        statuses: Optional[List[TaskStatus]] = None,
+        assignee_id: Optional[int] = None,
+        priority: Optional[Priority] = None,
+        created_by: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        text: Optional[str] = None
+    ) -> AsyncIterator[Task]:
+        """Yield every task matching the filters, in UID order
+        
+        Uses the same plan as query_tasks, so archived tasks are included.
+        Up to EXPORT_MAX_CONCURRENCY
+        document reads run ahead of the consumer, so memory stays bounded by
+        that window rather than by the number of matches.
+        """
+        ordered, residual, _ = await self._plan_query(
+            statuses, assignee_id, priority, created_by, created_from, created_to, text, None
+        )
+        
+        window: Deque[asyncio.Future] = deque()
+        uids = iter(ordered)
+        try:
+            while True:
+                for uid in uids:
+                    window.append(asyncio.ensure_future(self._read_task_data(uid)))
+                    if len(window) >= settings.EXPORT_MAX_CONCURRENCY:
+                        break
+                if not window:
+                    return
+                
+                data = await window.popleft()
+                if data and all(predicate(data) for predicate in residual.values()):
+                    yield Task.from_dict(data)
+        finally:
+            for future in window:
+                future.cancel()
+    
+    async def stream_tasks_csv(self, user_refs: Optional[UserRefResolver] = None, **filters) -> AsyncIterator[str]:
+        """Export tasks matching iter_tasks filters as CSV text chunks
+        
+        Users stored as references are named through user_refs, each one
+        looked up once per export.
+        """
+        users: Dict[int, TelegramUser] = {}
+        
+        async def rows():
+            async for task in self.iter_tasks(**filters):
+                if user_refs is not None:
+                    refs = {
+                        user.telegram_id for user in (task.created_by, *task.assignees)
+                        if user and user.is_ref and user.telegram_id not in users
+                    }
+                    if refs:
+                        users.update(await user_refs.users(refs))
+                yield task_csv_row(task, users)
+        
+        async for chunk in stream_csv(TASK_CSV_HEADER, rows()):
+            yield chunk
+    
+    async def _plan_query(
+        self,
+        statuses: Optional[List[TaskStatus]],
+        assignee_id: Optional[int],
+        priority: Optional[Priority],
+        created_by: Optional[int],
+        created_from: Optional[datetime],
+        created_to: Optional[datetime],
+        text: Optional[str],
+        cursor: Optional[str]
+    ) -> Tuple[List[str], Dict[str, Callable[[Dict], bool]], Dict[str, Any]]:
+        """Candidate UIDs in order, residual predicates and the plan"""
+        plan: Dict[str, Any] = {"indexes": {}, "intersected": [], "residual": [], "scan": False}
+        
+        # Stored timestamps are UTC; treat naive bounds as UTC too
+        if created_from is not None and created_from.tzinfo is None:
+            created_from = created_from.replace(tzinfo=timezone.utc)
+        if created_to is not None and created_to.tzinfo is None:
+            created_to = created_to.replace(tzinfo=timezone.utc)
+        
+        # Indexed filters: name -> (index prefixes, predicate on the raw document)
+        sources: Dict[str, Tuple[List[str], Callable[[Dict], bool]]] = {}
+        if statuses:
+            status_values = {s.value for s in statuses}
+            sources["status"] = (
+                [f"index/status/{value}/" for value in sorted(status_values)],
+                lambda d: d.get("status") in status_values
+            )
+        if assignee_id is not None:
+            sources["assignee"] = (
+                [f"index/assignee/{assignee_id}/"],
+                lambda d: any(a.get("telegramId") == assignee_id for a in d.get("assignees", []))
+            )
+        
+        if priority is not None:
+            sources["priority"] = (
+                [f"index/priority/{priority.value}/"],
+                lambda d: d.get("priority", "medium") == priority.value
+            )
+        if created_by is not None:
+            sources["creator"] = (
+                [f"index/creator/{created_by}/"],
+                lambda d: (d.get("createdBy") or {}).get("telegramId") == created_by
+            )
+        if created_from is not None:
+            sources["created"] = (
+                self._created_index_prefixes(created_from, created_to or datetime.now(timezone.utc)),
+                lambda d: self._created_in_range(d, created_from, created_to)
+            )
+        
+        # Filters without an index are evaluated on the documents
+        residual: Dict[str, Callable[[Dict], bool]] = {}
+        if created_from is not None or created_to is not None:
+            # Exact bounds; the creation index only narrows to whole days
+            residual["created"] = lambda d: self._created_in_range(d, created_from, created_to)
+        if text:
+            query_lower = text.lower()
+            residual["text"] = lambda d: (
+                query_lower in d.get("uid", "").lower() or
+                query_lower in d.get("title", "").lower() or
+                query_lower in d.get("description", "").lower()
+            )
+        
+        candidates: Optional[Set[str]] = None
+        if sources:
+            estimates = {name: self._estimate_index_size(prefixes) for name, (prefixes, _) in sources.items()}
+            plan["indexes"] = {name: estimate for name, estimate in estimates.items()}
+            
+            for name in sorted(sources, key=lambda n: (estimates[n] is None, estimates[n] or 0)):
+                prefixes, predicate = sources[name]
+                estimate = estimates[name]
+                # Probing a large index costs more listing than checking the
+                # predicate on the few documents we would fetch anyway
+                if candidates is not None and estimate is not None and estimate > max(len(candidates) * 20, 1000):
+                    residual[name] = predicate
+                    continue
+                
+                uids = await self._list_index_uids(prefixes)
+                plan["indexes"][name] = len(uids)
+                candidates = uids if candidates is None else candidates & uids
+                plan["intersected"].append(name)
+        else:
+            # No index to narrow by: every hot task plus everything archived
+            plan["scan"] = True
+            hot_paths, archived = await asyncio.gather(self.gcs.list_objects("tasks/"), self.archive.list_uids())
+            candidates = {
+                path[len("tasks/"):-len(".json")]
+                for path in hot_paths
+                if path.endswith(".json") and path.count("/") == 1
+            }
+            plan["archived"] = len(archived - candidates)
+            candidates |= archived
+        
+        plan["residual"] = sorted(residual)
+        plan["candidates"] = len(candidates)
+        
+        ordered = sorted(candidates, key=self._uid_sort_key)
+        if cursor:
+            ordered = [uid for uid in ordered if self._uid_sort_key(uid) > self._uid_sort_key(cursor)]
+        
+        return ordered, residual, plan
+    
+    async def _list_index_uids(self, prefixes: List[str]) -> Set[str]:
+        """List the UIDs under one or more index prefixes"""
+        listings = await asyncio.gather(*(self.gcs.list_objects(prefix) for prefix in prefixes))
+        uids: Set[str] = set()
+        for prefix, paths in zip(prefixes, listings):
+            self._index_cardinality[prefix] = len(paths)
+            uids.update(path.rsplit('/', 1)[-1] for path in paths if path[len(prefix):])
+        return uids
+    
+    def _estimate_index_size(self, prefixes: List[str]) -> Optional[int]:
+        """Estimated entries under index prefixes, from the last listing seen"""
+        counts = [self._index_cardinality.get(prefix) for prefix in prefixes]
+        if any(count is None for count in counts):
+            return None
+        return sum(counts)
+    
+    @staticmethod
+    def _created_index_prefixes(created_from: datetime, created_to: datetime) -> List[str]:
+        """Creation index prefixes covering a date range (days, or months for long ranges)"""
+        first = created_from.astimezone(timezone.utc).date()
+        last = created_to.astimezone(timezone.utc).date()
+        if (last - first).days <= 31:
+            return [
+                f"index/created/{(first + timedelta(days=i)).strftime('%Y/%m/%d')}/"
+                for i in range((last - first).days + 1)
+            ]
+        
+        prefixes = []
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            prefixes.append(f"index/created/{year:04d}/{month:02d}/")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return prefixes
+    
+    @staticmethod
+    def _uid_sort_key(uid: str) -> Tuple[int, str]:
+        """Sort UIDs numerically (SJ9999 before SJ10000)"""
+        digits = uid[2:]
+        return (int(digits), uid) if digits.isdigit() else (0, uid)
+    
+    @staticmethod
+    def _created_in_range(
+        data: Dict,
+        created_from: Optional[datetime],
+        created_to: Optional[datetime]
+    ) -> bool:
+        created_at = data.get("timestamps", {}).get("createdAt")
+        if not created_at:
+            return False
+        created = datetime.fromisoformat(created_at)
+        if created_from is not None and created < created_from:
+            return False
+        if created_to is not None and created > created_to:
+            return False
+        return True
+    
+    async def delete_expired_media(
+        self,
+        max_concurrency: Optional[int] = None,
+        time_budget_seconds: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Delete media files that have passed their deletion date
+        
+        Only the retention index buckets for days that are due are read, so
+        the cost scales with the media actually expiring. Tasks are processed
+        by a bounded pool of workers, each task document is rewritten once,
+        and no new task is started after the time budget runs out. Processed
+        index entries are removed as they complete and the cursor records the
+        first day still pending, so an interrupted run resumes where it left off.
+        """
+        started = time.monotonic()
+        max_concurrency = max_concurrency or settings.RETENTION_MAX_CONCURRENCY
+        if time_budget_seconds is None:
+            time_budget_seconds = settings.RETENTION_TIME_BUDGET_SEC
+        deadline = started + time_budget_seconds
+        
+        stats = {
+            "deleted_files": 0,
+            "failed_files": 0,
+            "checked_tasks": 0,
+            "remaining_tasks": 0,
+            "completed": False,
+        }
+        
         try:
-            deleted_count = 0
-            checked_count = 0
             current_time = datetime.now(timezone.utc)
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            start_day = await self._load_retention_cursor(current_time)
+            due_entries, pending_days = await self._collect_due_retention_entries(
+                start_day, current_time, semaphore
+            )
+            
+            queue = deque(sorted(due_entries))
+            
+            async def worker():
+                while queue and time.monotonic() < deadline:
+                    uid = queue.popleft()
+                    deleted, failed = await self._expire_task_media(
+                        uid, due_entries[uid], current_time, semaphore
+                    )
+                    stats["checked_tasks"] += 1
+                    stats["deleted_files"] += deleted
+                    stats["failed_files"] += failed
+                    if failed:
+                        pending_days.update(day for day, _, _ in due_entries[uid])
             
-            # Get all task files
+            await asyncio.gather(*(worker() for _ in range(max_concurrency)))
+            
+            # Tasks left over when the budget ran out stay in the index
+            for uid in queue:
+                pending_days.update(day for day, _, _ in due_entries[uid])
+            stats["remaining_tasks"] = len(queue)
+            stats["completed"] = not queue
+            
+            cursor_day = min(pending_days) if pending_days else current_time.date()
+            await self.gcs.write_json("index/retention/cursor.json", {
+                "day": cursor_day.isoformat(),
+                "updatedAt": datetime.now(timezone.utc).isoformat()
+            })
+        
+        except Exception as e:
+            logger.error(f"Failed to delete expired media: {e}")
+        
+        elapsed = time.monotonic() - started
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["files_per_second"] = round(stats["deleted_files"] / elapsed, 2) if elapsed > 0 else 0.0
+        return stats
+    
+    async def _load_retention_cursor(self, current_time: datetime) -> date:
+        """Return the first retention day to read, backfilling on first run"""
+        cursor = await self.gcs.read_json("index/retention/cursor.json")
+        if cursor is None:
+            # First run: index media scheduled before the index existed
+            await self.backfill_retention_index()
+            cursor = await self.gcs.read_json("index/retention/cursor.json") or {}
+        
+        today = current_time.date()
+        if cursor.get("day"):
+            return min(date.fromisoformat(cursor["day"]), today)
+        return today
+    
+    async def _collect_due_retention_entries(
+        self,
+        start_day: date,
+        current_time: datetime,
+        semaphore: asyncio.Semaphore
+    ) -> Tuple[Dict[str, List[Tuple[date, str, List[str]]]], Set[date]]:
+        """Read the due retention buckets and group their entries by task UID
+        
+        Each entry is returned as (day, entry path, media paths).
+        """
+        days = []
+        day = start_day
+        while day <= current_time.date():
+            days.append(day)
+            day += timedelta(days=1)
+        
+        async def read_entry(path: str):
+            async with semaphore:
+                return await self.gcs.read_json(path)
+        
+        bucket_listings = await asyncio.gather(
+            *(self.gcs.list_objects(self._retention_bucket_prefix(d)) for d in days)
+        )
+        entry_locations = [
+            (d, path) for d, paths in zip(days, bucket_listings) for path in paths
+        ]
+        entries = await asyncio.gather(*(read_entry(path) for _, path in entry_locations))
+        
+        due_entries: Dict[str, List[Tuple[date, str, List[str]]]] = {}
+        pending_days: Set[date] = set()
+        for (d, path), entry in zip(entry_locations, entries):
+            if not entry:
+                continue
+            if datetime.fromisoformat(entry["deleteAfter"]) > current_time:
+                pending_days.add(d)
+                continue
+            due_entries.setdefault(entry["uid"], []).append((d, path, entry.get("paths", [])))
+        
+        return due_entries, pending_days
+    
+    async def backfill_retention_index(self) -> int:
+        """Build retention index entries from existing task documents (full scan)"""
+        try:
+            earliest_day = None
+            scheduled = 0
             task_paths = await self.gcs.list_objects("tasks/")
             
             for path in task_paths:
@@ -281,51 +1082,187 @@ class TaskService:
                 if not task_data:
                     continue
                 
-                checked_count += 1
-                media_to_remove = []
-                
-                # Check each media item
-                for i, media_data in enumerate(task_data.get('media', [])):
+                # Group scheduled media by deletion date
+                by_delete_after: Dict[str, List[str]] = {}
+                for media_data in task_data.get('media', []):
                     delete_after = media_data.get('deleteAfter')
                     if delete_after:
-                        delete_time = datetime.fromisoformat(delete_after)
-                        if current_time >= delete_time:
-                            # Delete the media file
-                            media_path = media_data['path']
-                            if await self.gcs.delete_object(media_path):
-                                media_to_remove.append(i)
-                                deleted_count += 1
-                                logger.info(f"Deleted expired media: {media_path}")
+                        by_delete_after.setdefault(delete_after, []).append(media_data['path'])
                 
-                # Update task if media was removed
-                if media_to_remove:
-                    # Remove media entries (in reverse order to maintain indices)
-                    for i in reversed(media_to_remove):
-                        task_data['media'].pop(i)
-                    
-                    # Update task file
-                    await self.gcs.write_json(path, task_data)
+                for delete_after, paths in by_delete_after.items():
+                    delete_time = datetime.fromisoformat(delete_after)
+                    await self._write_retention_entry(task_data['uid'], delete_time, paths)
+                    scheduled += 1
+                    if earliest_day is None or delete_time.date() < earliest_day:
+                        earliest_day = delete_time.date()
             
-            return {
-                "deleted_files": deleted_count,
-                "checked_tasks": checked_count
-            }
+            cursor_day = earliest_day or datetime.now(timezone.utc).date()
+            await self.gcs.write_json("index/retention/cursor.json", {"day": cursor_day.isoformat()})
             
+            logger.info(f"Backfilled {scheduled} retention index entries")
+            return scheduled
         except Exception as e:
-            logger.error(f"Failed to delete expired media: {e}")
-            return {"deleted_files": 0, "checked_tasks": 0}
+            logger.error(f"Failed to backfill retention index: {e}")
+            return 0
+    
+    async def _expire_task_media(
+        self,
+        uid: str,
+        entries: List[Tuple[date, str, List[str]]],
+        current_time: datetime,
+        semaphore: asyncio.Semaphore
+    ) -> Tuple[int, int]:
+        """Delete the due media of one task and rewrite its document once
+        
+        Returns (deleted, failed) media counts. Index entries are removed only
+        when every deletion succeeded, so failures are retried next run.
+        """
+        entry_paths = {path for _, _, paths in entries for path in paths}
+        
+        task_path = f"tasks/{uid}.json"
+        task_data = await self.gcs.read_json(task_path)
+        
+        expired = []
+        if task_data:
+            for media_data in task_data.get('media', []):
+                delete_after = media_data.get('deleteAfter')
+                # The task document is authoritative: media may have been
+                # rescheduled or already removed since the entry was written
+                if (media_data['path'] in entry_paths and delete_after and
+                        current_time >= datetime.fromisoformat(delete_after)):
+                    expired.append(media_data['path'])
+        
+        async def delete_media(path: str) -> bool:
+            async with semaphore:
+                return await self.gcs.delete_object(path)
+        
+        results = await asyncio.gather(*(delete_media(path) for path in expired))
+        deleted_paths = {path for path, ok in zip(expired, results) if ok}
+        failed = len(expired) - len(deleted_paths)
+        
+        if deleted_paths:
+            def remove_deleted(task: Task):
+                task.media = [m for m in task.media if m.path not in deleted_paths]
+            
+            await self.mutate_task(uid, remove_deleted)
+            logger.info(f"Deleted {len(deleted_paths)} expired media file(s) for task {uid}")
+        
+        if not failed:
+            await asyncio.gather(*(self.gcs.delete_object(path) for _, path, _ in entries))
+        
+        return len(deleted_paths), failed
+    
+    async def archive_closed_tasks(self, older_than_days: Optional[int] = None) -> Dict[str, int]:
+        """Move tasks closed more than N days ago from tasks/ into archive packs
+        
+        Tasks are grouped into packs by the month they were last updated.
+        Tasks whose media still awaits the retention job stay hot. The hot
+        document is only deleted if it is unchanged since it was packed; index
+        markers are kept, so indexed queries still find archived tasks. Only
+        closed markers with a hot document are read, so tasks archived by
+        earlier runs cost nothing.
+        """
+        days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        stats = {"checked_tasks": 0, "archived_tasks": 0, "skipped_tasks": 0}
+        
+        try:
+            hot_paths, *marker_lists = await asyncio.gather(
+                self.gcs.list_objects("tasks/"),
+                self.gcs.list_objects(f"index/status/{TaskStatus.DONE.value}/"),
+                self.gcs.list_objects(f"index/status/{TaskStatus.CANCELED.value}/")
+            )
+            hot = set(hot_paths)
+            uids = [
+                uid for uid in (marker.split('/')[-1] for markers in marker_lists for marker in markers)
+                if f"tasks/{uid}.json" in hot
+            ]
+            semaphore = asyncio.Semaphore(settings.ARCHIVE_MAX_CONCURRENCY)
+            
+            async def load(uid: str):
+                async with semaphore:
+                    return await self.gcs.read_json_with_generation(f"tasks/{uid}.json")
+            
+            by_month: Dict[str, List[Tuple[Dict, int]]] = {}
+            for data, generation in await asyncio.gather(*(load(uid) for uid in uids)):
+                if not data:
+                    # Archived or deleted since the listing
+                    continue
+                
+                stats["checked_tasks"] += 1
+                updated_at = Task.from_dict(data).updated_at
+                pending_media = any(m.get("deleteAfter") for m in data.get("media", []))
+                if (data.get("status") not in (TaskStatus.DONE.value, TaskStatus.CANCELED.value)
+                        or updated_at >= cutoff or pending_media):
+                    continue
+                
+                by_month.setdefault(updated_at.strftime("%Y/%m"), []).append((data, generation))
+            
+            for month, entries in sorted(by_month.items()):
+                locations = await self.archive.append(month, [data for data, _ in entries])
+                if not locations or not await self.archive.update_index(locations):
+                    stats["skipped_tasks"] += len(entries)
+                    continue
+                
+                async def remove_hot(uid: str, generation: int) -> bool:
+                    async with semaphore:
+                        return await self.gcs.delete_object(f"tasks/{uid}.json", if_generation_match=generation)
+                
+                results = await asyncio.gather(*(remove_hot(data["uid"], gen) for data, gen in entries))
+                stats["archived_tasks"] += sum(results)
+                # A task that changed meanwhile stays hot; the hot copy wins on read
+                stats["skipped_tasks"] += len(results) - sum(results)
+            
+            logger.info(f"Archived {stats['archived_tasks']} of {stats['checked_tasks']} closed tasks")
+            return stats
+        except Exception as e:
+            logger.error(f"Failed to archive closed tasks: {e}")
+            return stats
+    
+    def _retention_bucket_prefix(self, day) -> str:
+        """Retention index prefix for an expiry day"""
+        return f"index/retention/{day.strftime('%Y/%m/%d')}/"
+    
+    async def _write_retention_entry(self, uid: str, delete_after: datetime, paths: List[str]):
+        """Write retention index entry pointing at the task and its media paths"""
+        entry_path = f"{self._retention_bucket_prefix(delete_after)}{uid}.json"
+        await self.gcs.write_json(entry_path, {
+            "uid": uid,
+            "deleteAfter": delete_after.isoformat(),
+            "paths": paths
+        })
+    
+    async def _schedule_media_retention(self, uid: str, media: List[MediaItem]):
+        """Add media with a deletion date to the retention schedule index"""
+        by_delete_after: Dict[datetime, List[str]] = {}
+        for media_item in media:
+            if media_item.delete_after:
+                by_delete_after.setdefault(media_item.delete_after, []).append(media_item.path)
+        
+        for delete_after, paths in by_delete_after.items():
+            await self._write_retention_entry(uid, delete_after, paths)
     
     # Index management methods
     async def _create_task_indices(self, task: Task):
         """Create index markers for new task"""
-        # Status index
-        status_path = f"index/status/{task.status.value}/{task.uid}"
-        await self.gcs.create_index_marker(status_path)
-        
-        # Assignee indices
-        for assignee in task.assignees:
-            assignee_path = f"index/assignee/{assignee.telegram_id}/{task.uid}"
-            await self.gcs.create_index_marker(assignee_path)
+        await asyncio.gather(*(self.gcs.create_index_marker(path) for path in self._task_index_paths(task)))
+    
+    def _task_index_paths(self, task: Task) -> List[str]:
+        """Every index marker of a task: status, assignees and static indices"""
+        paths = [f"index/status/{task.status.value}/{task.uid}"]
+        paths.extend(f"index/assignee/{a.telegram_id}/{task.uid}" for a in task.assignees)
+        paths.extend(self._static_index_paths(task))
+        return paths
+    
+    def _static_index_paths(self, task: Task) -> List[str]:
+        """Priority, creator and creation-day index markers of a task"""
+        paths = [
+            f"index/priority/{task.priority.value}/{task.uid}",
+            f"index/created/{task.created_at.astimezone(timezone.utc).strftime('%Y/%m/%d')}/{task.uid}",
+        ]
+        if task.created_by:
+            paths.append(f"index/creator/{task.created_by.telegram_id}/{task.uid}")
+        return paths
     
     async def _update_task_indices(self, task: Task):
         """Update indices for existing task"""
@@ -333,6 +1270,66 @@ class TaskService:
         # to track previous state to avoid recreating all indices
         await self._create_task_indices(task)
     
+    async def _sync_task_indices(
+        self,
+        task: Task,
+        previous_status: TaskStatus,
+        previous_priority: Priority,
+        previous_assignee_ids: Set[int]
+    ):
+        """Bring index markers in line with a task's before/after state
+        
+        The marker writes are independent, so they are issued together.
+        """
+        writes = [self._update_status_index(task, previous_status, task.status)]
+        
+        if previous_priority != task.priority:
+            writes.append(self.gcs.delete_index_marker(f"index/priority/{previous_priority.value}/{task.uid}"))
+            writes.append(self.gcs.create_index_marker(f"index/priority/{task.priority.value}/{task.uid}"))
+        
+        assignee_ids = {a.telegram_id for a in task.assignees}
+        for telegram_id in assignee_ids - previous_assignee_ids:
+            writes.append(self._create_assignee_index(task.uid, telegram_id))
+        for telegram_id in previous_assignee_ids - assignee_ids:
+            writes.append(self._remove_assignee_index(task.uid, telegram_id))
+        
+        await asyncio.gather(*writes)
+    
+    def _counter_state(self, task: Task) -> TaskCounterState:
+        return task.status, task.priority, {a.telegram_id for a in task.assignees}
+    
+    async def get_task_stats(self, days: int = 14) -> Dict[str, Any]:
+        """Dashboard counts from the counter shards, with the last `days` of rollups"""
+        totals = await self.counters.read()
+        
+        today = datetime.now(timezone.utc).date()
+        daily = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            values = totals["daily"].get(day, {})
+            daily.append({"date": day, "created": values.get("created", 0), "closed": values.get("closed", 0)})
+        
+        return {
+            "total": sum(totals["status"].values()),
+            "by_status": {s.value: totals["status"].get(s.value, 0) for s in TaskStatus},
+            "by_priority": {p.value: totals["priority"].get(p.value, 0) for p in Priority},
+            "by_assignee": totals["assignee"],
+            "daily": daily
+        }
+    
+    async def get_task_analytics(self) -> Dict[str, Any]:
+        """Cycle-time and status-duration analytics (cached, refreshed incrementally)"""
+        return await self.analytics.get_summary()
+    
+    async def reconcile_task_counters(self) -> Dict[str, int]:
+        """Recompute the task counters from the index markers"""
+        totals = await self.counters.reconcile()
+        return {
+            "total": sum(totals["status"].values()),
+            "assignees": len(totals["assignee"]),
+            "days": len(totals["daily"])
+        }
+    
     async def _update_status_index(self, task: Task, old_status: TaskStatus, new_status: TaskStatus):
         """Update status index when status changes"""
         if old_status != new_status:
@@ -371,15 +1368,26 @@ class TaskService:
                 for assignee in task.assignees:
                     await self._remove_assignee_index(uid, assignee.telegram_id)
             
+            # Remove from priority, creator and creation day indices
+            for path in self._static_index_paths(task):
+                await self.gcs.delete_index_marker(path)
+            
+            # Remove spilled notes/history segments
+            for segment_path in await self.gcs.list_objects(f"segments/{uid}/"):
+                await self.gcs.delete_object(segment_path)
+            
             # Delete the main task file
             task_path = f"tasks/{uid}.json"
             success = await self.gcs.delete_blob(task_path)
+            success = await self.archive.remove(uid) or success
             
             if success:
+                await self.counters.record_change(self._counter_state(task), None)
+                self.analytics.forget(uid)
                 logger.info(f"Task {uid} deleted successfully")
             
             return success
-            
+        
         except Exception as e:
             logger.error(f"Failed to delete task {uid}: {e}")
             return False
\ No newline at end of file
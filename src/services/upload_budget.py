@@ -0,0 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class UploadBudget:
+    """Caps the number of media bytes being uploaded at once
+    
+    Uploads reserve their size before starting and release it when done.
+    A file larger than the whole budget is let through on its own once
+    nothing else is in flight, so it cannot wait forever.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+    
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        size = min(size, self.max_bytes)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight + size <= self.max_bytes)
+            self.in_flight += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= size
+                self._condition.notify_all()
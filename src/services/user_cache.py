@@ -0,0 +1,79 @@
+import copy
+import time
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
+from src.config import settings
+from src.models.user import User
+from src.services.user_search import UserSearchIndex
+
+
+class RoleSnapshot(NamedTuple):
+    """In-memory copy of the role index document"""
+    version: int
+    admins: FrozenSet[int]
+    inactive: FrozenSet[int]
+    checked_at: float
+    
+    def is_admin(self, telegram_id: int) -> bool:
+        return telegram_id in self.admins and telegram_id not in self.inactive
+
+
+class UserCache:
+    """In-process cache of user documents, shared by the bot and the API
+    
+    Entries expire after USER_CACHE_TTL_SEC so changes made by other
+    instances show up within that time. Besides the user, each entry keeps
+    the last_seen_at value that was last persisted, which lets callers
+    debounce last-seen writes to USER_LAST_SEEN_FLUSH_SEC.
+    """
+    
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: int = 10000):
+        self.ttl_seconds = settings.USER_CACHE_TTL_SEC if ttl_seconds is None else ttl_seconds
+        self.max_entries = max_entries
+        # telegram_id -> (user, expires_at, persisted last_seen_at)
+        self._entries: Dict[int, Tuple[User, float, Optional[datetime]]] = {}
+        # Admin and inactive sets, maintained by UserRoleIndex
+        self.roles: Optional[RoleSnapshot] = None
+        # Name/username prefix index built from the roster
+        self.search: Optional[UserSearchIndex] = None
+    
+    def get(self, telegram_id: int) -> Optional[User]:
+        """Return a copy of the cached user, or None if missing or expired"""
+        entry = self._entries.get(telegram_id)
+        if not entry or entry[1] <= time.monotonic():
+            return None
+        return copy.copy(entry[0])
+    
+    def put(self, user: User, persisted: bool = True):
+        """Cache a user; persisted=False records an in-memory-only change"""
+        previous = self._entries.get(user.telegram_id)
+        if persisted or not previous:
+            expires_at = time.monotonic() + self.ttl_seconds
+            persisted_last_seen = user.last_seen_at if persisted else None
+        else:
+            # Unsaved changes must not keep an entry alive past its TTL
+            expires_at, persisted_last_seen = previous[1], previous[2]
+        
+        self._entries.pop(user.telegram_id, None)
+        self._entries[user.telegram_id] = (copy.copy(user), expires_at, persisted_last_seen)
+        while len(self._entries) > self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+    
+    def roles_fresh(self) -> bool:
+        """True if the role snapshot was checked within the TTL"""
+        return self.roles is not None and time.monotonic() - self.roles.checked_at < self.ttl_seconds
+    
+    def search_fresh(self) -> bool:
+        """True if the search index was built within the TTL"""
+        return self.search is not None and time.monotonic() - self.search.built_at < self.ttl_seconds
+    
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+    
+    def last_seen_due(self, user: User) -> bool:
+        """True if user.last_seen_at is far enough ahead of the stored value to write"""
+        entry = self._entries.get(user.telegram_id)
+        persisted = entry[2] if entry else None
+        if persisted is None or user.last_seen_at is None:
+            return True
+        return user.last_seen_at - persisted >= timedelta(seconds=settings.USER_LAST_SEEN_FLUSH_SEC)
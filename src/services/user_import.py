@@ -0,0 +1,112 @@
+import codecs
+import csv
+import json
+import re
+from typing import AsyncIterable, AsyncIterator, Dict, Optional, Tuple
+from src.models.user import User, UserRole
+
+USERNAME = re.compile(r'^[A-Za-z0-9_]{1,32}$')
+TRUE_VALUES = {"true", "1", "yes", "y"}
+FALSE_VALUES = {"false", "0", "no", "n"}
+
+# Accepted spellings of each field, as in the CSV export or the API models
+FIELD_ALIASES = {
+    "telegramid": "telegram_id", "telegram_id": "telegram_id", "id": "telegram_id",
+    "name": "name", "username": "username", "role": "role", "active": "active",
+}
+
+
+class ImportTooLarge(Exception):
+    """The input has more rows than USER_IMPORT_MAX_ROWS"""
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without buffering the whole body"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def parse_rows(
+    lines: AsyncIterable[str],
+    fmt: str
+) -> AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (row number, fields, error) for each non-blank input row
+    
+    fmt is "csv" (first row is the header; quoted fields must not span
+    lines) or "jsonl" (one JSON object per line).
+    """
+    header = None
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [FIELD_ALIASES.get(column.strip().lower(), column.strip().lower()) for column in values]
+                continue
+            row_number += 1
+            if len(values) != len(header):
+                yield row_number, None, f"expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row_number, dict(zip(header, values)), None
+        else:
+            row_number += 1
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield row_number, None, "invalid JSON"
+                continue
+            if not isinstance(data, dict):
+                yield row_number, None, "expected a JSON object"
+                continue
+            yield row_number, {FIELD_ALIASES.get(key.lower(), key.lower()): value for key, value in data.items()}, None
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid active value {value!r}")
+
+
+def build_user(fields: Dict) -> User:
+    """Validate one import row; raises ValueError with a row-level message"""
+    try:
+        telegram_id = int(str(fields.get("telegram_id", "")).strip())
+    except ValueError:
+        raise ValueError("telegram_id must be an integer")
+    if telegram_id <= 0:
+        raise ValueError("telegram_id must be positive")
+    
+    name = str(fields.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    
+    username = str(fields.get("username") or "").strip().lstrip("@") or None
+    if username and not USERNAME.match(username):
+        raise ValueError(f"invalid username {username!r}")
+    
+    role_value = str(fields.get("role") or UserRole.USER.value).strip().lower()
+    try:
+        role = UserRole(role_value)
+    except ValueError:
+        raise ValueError(f"invalid role {role_value!r}")
+    
+    active = fields.get("active")
+    active = True if active in (None, "") else _parse_bool(active)
+    
+    return User(telegram_id=telegram_id, name=name, username=username, role=role, active=active)
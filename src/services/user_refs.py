@@ -0,0 +1,100 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+from src.models.task import ENTRY_USER_KEYS, TelegramUser
+from src.services.user_service import UserService
+
+logger = logging.getLogger(__name__)
+
+
+def _users_in(document: Dict) -> Iterable[Dict]:
+    if document.get("createdBy"):
+        yield document["createdBy"]
+    yield from document.get("assignees") or []
+    for key in ("notes", "statusHistory"):
+        for entry in document.get(key) or []:
+            for user_key in ENTRY_USER_KEYS:
+                if entry.get(user_key):
+                    yield entry[user_key]
+
+
+def unresolved_user_ids(document: Dict) -> Set[int]:
+    """Telegram ids of users in a task document that have no display data"""
+    return {user["telegramId"] for user in _users_in(document) if "name" not in user}
+
+
+def expand_user_refs(document: Dict, users: Dict[int, Dict]) -> Dict:
+    """Copy of document with user references replaced by users[telegramId]
+    
+    Only the touched sections are copied, so a document that shares lists
+    with a Task's stored data can be expanded safely.
+    """
+    def expand(user: Optional[Dict]) -> Optional[Dict]:
+        if not user or "name" in user:
+            return user
+        return users.get(user["telegramId"], user)
+    
+    def expand_entry(entry: Dict) -> Dict:
+        if not any(entry.get(key) and "name" not in entry[key] for key in ENTRY_USER_KEYS):
+            return entry
+        return {**entry, **{key: expand(entry[key]) for key in ENTRY_USER_KEYS if key in entry}}
+    
+    expanded = dict(document)
+    if document.get("createdBy"):
+        expanded["createdBy"] = expand(document["createdBy"])
+    if document.get("assignees"):
+        expanded["assignees"] = [expand(user) for user in document["assignees"]]
+    for key in ("notes", "statusHistory"):
+        if document.get(key):
+            expanded[key] = [expand_entry(entry) for entry in document[key]]
+    return expanded
+
+
+class UserRefResolver:
+    """Display data for users stored in task documents as bare references
+    
+    Every method looks up all the users it needs with one
+    UserService.get_users call, so a page of 100 tasks costs at most one
+    roster read however many notes and history entries it has. Documents
+    written before TASK_USER_REFS was enabled carry names already and cost
+    nothing.
+    """
+    
+    def __init__(self, user_service: UserService):
+        self.user_service = user_service
+    
+    async def users(self, telegram_ids: Iterable[int]) -> Dict[int, TelegramUser]:
+        """TelegramUser for each id; unknown users are named by their id"""
+        telegram_ids = set(telegram_ids)
+        if not telegram_ids:
+            return {}
+        
+        found, missing = await self.user_service.get_users(telegram_ids)
+        if missing:
+            logger.warning(f"Task documents reference unknown users: {sorted(missing)}")
+        
+        resolved = {
+            telegram_id: TelegramUser(telegram_id, user.name, user.username)
+            for telegram_id, user in found.items()
+        }
+        for telegram_id in missing:
+            resolved[telegram_id] = TelegramUser(telegram_id, str(telegram_id))
+        return resolved
+    
+    async def resolve(self, documents: List[Dict]) -> List[Dict]:
+        """Task documents (or note/history pages) with every user filled in"""
+        users = await self.users(
+            telegram_id for document in documents for telegram_id in unresolved_user_ids(document)
+        )
+        if not users:
+            return documents
+        
+        encoded = {telegram_id: user.to_dict() for telegram_id, user in users.items()}
+        return [expand_user_refs(document, encoded) for document in documents]
+    
+    async def resolve_one(self, document: Dict) -> Dict:
+        return (await self.resolve([document]))[0]
+    
+    async def resolve_users(self, users: List[TelegramUser]) -> List[TelegramUser]:
+        """The given users with references replaced by their current details"""
+        resolved = await self.users(user.telegram_id for user in users if user.is_ref)
+        return [resolved.get(user.telegram_id, user) for user in users]
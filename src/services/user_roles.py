@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from src.config import settings
+from src.models.user import User
+from src.services.user_cache import RoleSnapshot, UserCache
+from src.storage.gcs_client import GCSClient
+
+logger = logging.getLogger(__name__)
+
+ROLE_INDEX_PATH = "index/users/roles.json"
+
+
+class UserRoleIndex:
+    """Admin and inactive user sets kept in one small document
+    
+    index/users/roles.json  {"version": n, "admins": [...], "inactive": [...]}
+    
+    The parsed sets live in the shared UserCache as a RoleSnapshot, so
+    permission checks need no GCS round trip. A snapshot older than
+    USER_CACHE_TTL_SEC is revalidated by re-reading the document; the sets
+    are only rebuilt when its version moved. Writers do a generation-matched
+    read-modify-write and bump the version.
+    """
+    
+    def __init__(self, gcs_client: GCSClient, cache: UserCache):
+        self.gcs = gcs_client
+        self.cache = cache
+    
+    def _snapshot(self, data: Dict) -> RoleSnapshot:
+        current = self.cache.roles
+        if current is not None and current.version == data.get("version"):
+            return current._replace(checked_at=time.monotonic())
+        return RoleSnapshot(
+            version=data.get("version", 0),
+            admins=frozenset(data.get("admins", [])),
+            inactive=frozenset(data.get("inactive", [])),
+            checked_at=time.monotonic()
+        )
+    
+    def _document(self, version: int, admins: Iterable[int], inactive: Iterable[int]) -> Dict:
+        return {
+            "version": version,
+            "admins": sorted(admins),
+            "inactive": sorted(inactive),
+            "updatedAt": datetime.now(timezone.utc).isoformat()
+        }
+    
+    async def load(self) -> Optional[RoleSnapshot]:
+        """Return a fresh snapshot, or None if the index does not exist yet
+        
+        Storage errors propagate so a failed read is not taken for a
+        missing index.
+        """
+        if self.cache.roles_fresh():
+            return self.cache.roles
+        
+        data = await self.gcs.read_json(ROLE_INDEX_PATH)
+        if data is None:
+            self.cache.roles = None
+            return None
+        
+        self.cache.roles = self._snapshot(data)
+        return self.cache.roles
+    
+    async def rebuild(self, users: Iterable[User], only_if_absent: bool = False) -> bool:
+        """Overwrite the index from a full list of users
+        
+        With only_if_absent the index is only created, never replaced, so a
+        bootstrap racing another instance cannot clobber newer changes.
+        """
+        admins, inactive = set(), set()
+        for user in users:
+            if user.is_admin():
+                admins.add(user.telegram_id)
+            if not user.active:
+                inactive.add(user.telegram_id)
+        
+        try:
+            if only_if_absent:
+                document = self._document(1, admins, inactive)
+                written = await self.gcs.create_if_absent(ROLE_INDEX_PATH, document)
+            else:
+                data, generation = await self.gcs.read_json_with_generation(ROLE_INDEX_PATH)
+                document = self._document((data or {}).get("version", 0) + 1, admins, inactive)
+                written = await self.gcs.write_json(ROLE_INDEX_PATH, document, if_generation_match=generation)
+            if not written:
+                logger.warning("Role index changed during rebuild; keeping the newer copy")
+                self.cache.roles = None
+                return False
+        except Exception as e:
+            logger.error(f"Failed to rebuild role index: {e}")
+            return False
+        
+        self.cache.roles = self._snapshot(document)
+        logger.info(f"Rebuilt role index: {len(admins)} admin(s), {len(inactive)} inactive user(s)")
+        return True
+    
+    async def apply(self, users: Iterable[User]) -> bool:
+        """Record users' current role and active state in one index write"""
+        users = list(users)
+        for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+            try:
+                data, generation = await self.gcs.read_json_with_generation(ROLE_INDEX_PATH)
+                if data is None:
+                    # Created by the bootstrap rebuild, never from a few users
+                    self.cache.roles = None
+                    return False
+                
+                admins, inactive = set(data.get("admins", [])), set(data.get("inactive", []))
+                for user in users:
+                    (admins.add if user.is_admin() else admins.discard)(user.telegram_id)
+                    (inactive.discard if user.active else inactive.add)(user.telegram_id)
+                
+                if admins == set(data.get("admins", [])) and inactive == set(data.get("inactive", [])):
+                    self.cache.roles = self._snapshot(data)
+                    return True
+                
+                document = self._document(data.get("version", 0) + 1, admins, inactive)
+                if await self.gcs.write_json(ROLE_INDEX_PATH, document, if_generation_match=generation):
+                    self.cache.roles = self._snapshot(document)
+                    return True
+            except Exception as e:
+                logger.error(f"Failed to update role index: {e}")
+                break
+            await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        
+        logger.error(f"Failed to update role index for {len(users)} user(s)")
+        self.cache.roles = None
+        return False
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+from typing import Dict, Iterable, List, Optional
+from src.config import settings
+from src.models.user import User
+from src.storage.gcs_client import GCSClient
+
+logger = logging.getLogger(__name__)
+
+# User document fields shown from the roster; lastSeenAt is kept per day
+ROSTER_FIELDS = {"name", "username", "role", "active"}
+
+
+def roster_entry(user: User) -> Dict:
+    """The roster copy of a user, with lastSeenAt cut to the start of its day
+    
+    Last-seen flushes then only reach the roster once a day per user.
+    """
+    entry = user.to_dict()
+    if user.last_seen_at:
+        entry["lastSeenAt"] = user.last_seen_at.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    return entry
+
+
+class UserRoster:
+    """Every user's public fields in USER_ROSTER_SHARDS small documents
+    
+    index/users/roster/shard-NN.json  {"users": {telegramId: roster_entry}}
+    
+    Users are spread over shards by telegram_id, so listing all users takes
+    one GET per shard instead of one per user. Shards are rewritten with a
+    generation-matched read-modify-write after the user documents, which
+    stay the source of truth; rebuild() recreates the roster from them.
+    """
+    
+    def __init__(self, gcs_client: GCSClient):
+        self.gcs = gcs_client
+    
+    def _shard_path(self, shard: int) -> str:
+        return f"index/users/roster/shard-{shard:02d}.json"
+    
+    def _shard_of(self, telegram_id: int) -> int:
+        return telegram_id % settings.USER_ROSTER_SHARDS
+    
+    async def read(self) -> Optional[List[User]]:
+        """All users in the roster, or None if any shard is missing
+        
+        Storage errors propagate so a failed read is not taken for a
+        missing roster.
+        """
+        shards = await asyncio.gather(
+            *(self.gcs.read_json(self._shard_path(shard)) for shard in range(settings.USER_ROSTER_SHARDS))
+        )
+        if any(shard is None for shard in shards):
+            return None
+        
+        users = []
+        for index, shard in enumerate(shards):
+            for key, data in shard.get("users", {}).items():
+                # Entries left behind by a different shard count
+                if self._shard_of(int(key)) != index:
+                    continue
+                try:
+                    users.append(User.from_dict(data))
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable roster entry {key}: {e}")
+        return users
+    
+    async def get(self, telegram_ids: Iterable[int]) -> Dict[int, User]:
+        """Roster entries for the given users, reading only their shards
+        
+        Users missing from the roster (or a missing shard) are left out.
+        """
+        by_shard: Dict[int, List[int]] = {}
+        for telegram_id in telegram_ids:
+            by_shard.setdefault(self._shard_of(telegram_id), []).append(telegram_id)
+        
+        shards = await asyncio.gather(*(self.gcs.read_json(self._shard_path(shard)) for shard in by_shard))
+        users: Dict[int, User] = {}
+        for ids, shard in zip(by_shard.values(), shards):
+            entries = (shard or {}).get("users", {})
+            for telegram_id in ids:
+                data = entries.get(str(telegram_id))
+                if data:
+                    try:
+                        users[telegram_id] = User.from_dict(data)
+                    except Exception as e:
+                        logger.warning(f"Skipping unreadable roster entry {telegram_id}: {e}")
+        return users
+    
+    async def apply(self, users: Iterable[User]) -> bool:
+        """Write the current state of users into their shards, one write per shard"""
+        by_shard: Dict[int, Dict[str, Dict]] = {}
+        for user in users:
+            by_shard.setdefault(self._shard_of(user.telegram_id), {})[str(user.telegram_id)] = roster_entry(user)
+        
+        results = await asyncio.gather(
+            *(self._apply_shard(shard, entries) for shard, entries in by_shard.items())
+        )
+        return all(results)
+    
+    async def _apply_shard(self, shard: int, entries: Dict[str, Dict]) -> bool:
+        path = self._shard_path(shard)
+        for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+            try:
+                roster, generation = await self.gcs.read_json_with_generation(path)
+                if roster is None:
+                    # Not built yet; the bootstrap reads the user documents
+                    return True
+                
+                if all(roster["users"].get(key) == entry for key, entry in entries.items()):
+                    return True
+                roster["users"].update(entries)
+                
+                if await self.gcs.write_json(path, roster, if_generation_match=generation):
+                    return True
+            except Exception as e:
+                logger.error(f"Failed to update user roster {path}: {e}")
+                return False
+            await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        
+        logger.error(f"Failed to update user roster {path}")
+        return False
+    
+    async def rebuild(self, users: Iterable[User], only_if_absent: bool = False) -> bool:
+        """Rewrite every shard from a full list of users
+        
+        With only_if_absent only missing shards are created, so a bootstrap
+        racing another instance cannot clobber newer entries. A full rebuild
+        may drop changes written while it runs; rerun it if in doubt.
+        """
+        shards: Dict[int, Dict[str, Dict]] = {shard: {} for shard in range(settings.USER_ROSTER_SHARDS)}
+        for user in users:
+            shards[self._shard_of(user.telegram_id)][str(user.telegram_id)] = roster_entry(user)
+        
+        async def write(shard: int, entries: Dict[str, Dict]) -> bool:
+            path = self._shard_path(shard)
+            if only_if_absent:
+                return await self.gcs.create_if_absent(path, {"users": entries}) is not None
+            return await self.gcs.write_json(path, {"users": entries})
+        
+        results = await asyncio.gather(*(write(shard, entries) for shard, entries in shards.items()))
+        if not all(results):
+            logger.error("Failed to rebuild user roster")
+            return False
+        return True
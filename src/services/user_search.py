@@ -0,0 +1,49 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+from src.models.user import User
+
+
+def _normalize(text: str) -> str:
+    return text.casefold().lstrip('@')
+
+
+class UserSearchIndex:
+    """Sorted prefix keys over user names and usernames
+    
+    Every user contributes its full name, each word of it and its username,
+    so "ann", "smi" and "@asmith" all find Ann Smith. A search is one bisect
+    plus a walk over the matching keys.
+    """
+    
+    def __init__(self, users: Iterable[User]):
+        keys: List[Tuple[str, int]] = []
+        self._users: Dict[int, User] = {}
+        for user in users:
+            self._users[user.telegram_id] = user
+            terms = {_normalize(user.name)}
+            terms.update(_normalize(word) for word in user.name.split())
+            if user.username:
+                terms.add(_normalize(user.username))
+            keys.extend((term, user.telegram_id) for term in terms if term)
+        keys.sort()
+        self._keys = keys
+        self.built_at = time.monotonic()
+    
+    def search(self, query: str, limit: int = 10) -> List[User]:
+        """Users with a name, word or username starting with query"""
+        prefix = _normalize(query.strip())
+        if not prefix:
+            return []
+        
+        matches: List[User] = []
+        position = bisect_left(self._keys, (prefix, -1))
+        while position < len(self._keys) and len(matches) < limit:
+            term, telegram_id = self._keys[position]
+            if not term.startswith(prefix):
+                break
+            user = self._users[telegram_id]
+            if user not in matches:
+                matches.append(user)
+            position += 1
+        return matches
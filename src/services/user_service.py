@@ -1,28 +1,93 @@
+import asyncio
 import logging
+import random
 from datetime import datetime, timezone
-from typing import List, Optional, Dict
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Dict, Set, Tuple
 from src.storage.gcs_client import GCSClient
 from src.models.user import User, UserRole
+from src.config import settings
+from src.services.audit_log import AuditLog
+from src.services.csv_export import USER_CSV_HEADER, stream_csv, user_csv_row
+from src.services.user_cache import RoleSnapshot, UserCache
+from src.services.user_roles import UserRoleIndex
+from src.services.user_import import ImportTooLarge, build_user, parse_rows
+from src.services.user_roster import ROSTER_FIELDS, UserRoster, roster_entry
+from src.services.user_search import UserSearchIndex
 
 logger = logging.getLogger(__name__)
 
+# User document fields the role index is derived from
+ROLE_FIELDS = {"role", "active"}
+# Fields the name/username search index is built from
+SEARCH_FIELDS = {"name", "username"}
+
 class UserService:
-    def __init__(self, gcs_client: GCSClient):
+    def __init__(self, gcs_client: GCSClient, cache: Optional[UserCache] = None):
         self.gcs = gcs_client
+        # Pass the process-wide cache so the bot and API share it
+        self.cache = cache or UserCache()
+        self.roles = UserRoleIndex(gcs_client, self.cache)
+        self.roster = UserRoster(gcs_client)
+        self.audit = AuditLog(gcs_client)
     
-    async def get_user(self, telegram_id: int) -> Optional[User]:
-        """Get user by Telegram ID"""
+    async def get_user(self, telegram_id: int, fresh: bool = False) -> Optional[User]:
+        """Get user by Telegram ID (served from the user cache when fresh)
+        
+        fresh=True reads the document even if the user is cached; use it
+        before decisions on role or active state, which the cache may lag.
+        """
+        cached = None if fresh else self.cache.get(telegram_id)
+        if cached:
+            return cached
+        
         try:
             user_path = f"users/{telegram_id}.json"
             data = await self.gcs.read_json(user_path)
             if not data:
                 return None
             
-            return User.from_dict(data)
+            user = User.from_dict(data)
+            self.cache.put(user)
+            return user
         except Exception as e:
             logger.error(f"Failed to get user {telegram_id}: {e}")
             return None
     
+    async def get_users(self, telegram_ids: Iterable[int]) -> Tuple[Dict[int, User], List[int]]:
+        """Look up several users at once
+        
+        Cached users are answered from memory. Remaining users come from the
+        roster in one read per shard, and only users the roster lacks are read
+        from their documents, concurrently. Returns (users by telegram_id,
+        missing ids in request order).
+        """
+        found: Dict[int, User] = {}
+        misses: List[int] = []
+        for telegram_id in dict.fromkeys(telegram_ids):
+            cached = self.cache.get(telegram_id)
+            if cached:
+                found[telegram_id] = cached
+            else:
+                misses.append(telegram_id)
+        
+        if len(misses) > 1:
+            try:
+                # Roster entries are for display only and stay out of the
+                # write-through cache, which must hold whole documents
+                for telegram_id, user in (await self.roster.get(misses)).items():
+                    found[telegram_id] = user
+            except Exception as e:
+                logger.warning(f"Roster lookup failed, reading user documents: {e}")
+            misses = [telegram_id for telegram_id in misses if telegram_id not in found]
+        
+        users = await asyncio.gather(*(self.get_user(telegram_id) for telegram_id in misses))
+        for telegram_id, user in zip(misses, users):
+            if user:
+                found[telegram_id] = user
+        
+        missing = [telegram_id for telegram_id in misses if telegram_id not in found]
+        return found, missing
+    
     async def create_user(
         self, 
         telegram_id: int, 
@@ -40,28 +105,154 @@ class UserService:
             )
             
             user_path = f"users/{telegram_id}.json"
-            await self.gcs.write_json(user_path, user.to_dict())
+            document = user.to_dict()
+            await self.gcs.write_json(user_path, document)
+            user.mark_saved(document)
+            self.cache.put(user)
+            await self._sync_indexes(user, set(document))
             
             logger.info(f"Created user {telegram_id}")
             return user
-            
+        
         except Exception as e:
             logger.error(f"Failed to create user {telegram_id}: {e}")
             raise
     
-    async def update_user(self, user: User) -> bool:
-        """Update user"""
-        try:
-            user_path = f"users/{user.telegram_id}.json"
-            success = await self.gcs.write_json(user_path, user.to_dict())
+    async def import_users(self, lines: AsyncIterable[str], fmt: str) -> Dict:
+        """Create users from CSV or JSON lines
+        
+        Every row is parsed and validated before anything is written, so an
+        input over USER_IMPORT_MAX_ROWS raises ImportTooLarge and changes
+        nothing. Valid rows are then written at most BULK_MAX_CONCURRENCY at
+        a time, and only if no user document exists yet. The roster and role
+        index are updated once for the whole batch.
+        
+        Returns counts and {"row", "telegram_id", "status", "error"} per row,
+        where status is created, exists, duplicate, invalid or failed.
+        """
+        semaphore = asyncio.Semaphore(settings.BULK_MAX_CONCURRENCY)
+        results: List[Dict] = []
+        pending: List[Tuple[Dict, User]] = []
+        seen: Set[int] = set()
+        
+        async def create(result: Dict, user: User):
+            async with semaphore:
+                document = user.to_dict()
+                created = await self.gcs.create_if_absent(f"users/{user.telegram_id}.json", document)
+                if created is None:
+                    result.update(status="failed", error="storage error")
+                    return None
+                if not created:
+                    result["status"] = "exists"
+                    return None
+                
+                user.mark_saved(document)
+                self.cache.put(user)
+                if user.username:
+                    await self._sync_username(user, None)
+                result["status"] = "created"
+                return user
+        
+        async for row, fields, error in parse_rows(lines, fmt):
+            if len(results) >= settings.USER_IMPORT_MAX_ROWS:
+                raise ImportTooLarge(f"Import is limited to {settings.USER_IMPORT_MAX_ROWS} rows")
             
-            if success:
-                logger.info(f"Updated user {user.telegram_id}")
+            result = {"row": row, "telegram_id": None, "status": "invalid", "error": error}
+            results.append(result)
+            if fields is None:
+                continue
+            try:
+                user = build_user(fields)
+            except ValueError as e:
+                result["error"] = str(e)
+                continue
             
-            return success
-        except Exception as e:
-            logger.error(f"Failed to update user {user.telegram_id}: {e}")
+            result.update(telegram_id=user.telegram_id, error=None)
+            if user.telegram_id in seen:
+                result["status"] = "duplicate"
+                continue
+            seen.add(user.telegram_id)
+            pending.append((result, user))
+        
+        written = await asyncio.gather(*(create(result, user) for result, user in pending))
+        created = [user for user in written if user]
+        if created:
+            # apply re-reads the index, so a stale cached snapshot cannot hide a change
+            if await self.get_role_snapshot() is not None:
+                await self.roles.apply(created)
+            await self.roster.apply(created)
+            self.cache.search = None
+        
+        counts: Dict[str, int] = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        logger.info(f"Imported users: {counts}")
+        return {"counts": counts, "rows": results}
+    
+    async def update_user(self, user: User) -> bool:
+        """Save the fields of user that changed since it was loaded
+        
+        Only those fields are written, on top of the current document (see
+        _update_fields), so a stale cached copy cannot undo changes made by
+        another instance. user is refreshed from the saved document. Nothing
+        is written if no field changed.
+        """
+        changes = user.changed_fields()
+        if not changes:
+            return True
+        
+        document = user.to_dict()
+        saved = await self._update_fields(user.telegram_id, {key: document[key] for key in changes})
+        if saved is None:
             return False
+        for slot in User.__slots__:
+            setattr(user, slot, getattr(saved, slot))
+        return True
+    
+    async def _update_fields(self, telegram_id: int, updates: Dict) -> Optional[User]:
+        """Apply document fields with a generation-matched read-modify-write
+        
+        The document is re-read on every attempt, so only updates are
+        written over whatever another instance saved in between. A
+        lastSeenAt older than the stored one is ignored. Returns the saved
+        user, or None if it does not exist or the write kept failing.
+        """
+        user_path = f"users/{telegram_id}.json"
+        try:
+            for attempt in range(settings.TASK_MUTATION_MAX_ATTEMPTS):
+                data, generation = await self.gcs.read_json_with_generation(user_path)
+                if data is None:
+                    self.cache.invalidate(telegram_id)
+                    return None
+                
+                fields = dict(updates)
+                if data.get("lastSeenAt") and (fields.get("lastSeenAt") or "") <= data["lastSeenAt"]:
+                    fields.pop("lastSeenAt", None)
+                changes = {key for key, value in fields.items() if data.get(key) != value}
+                if not changes:
+                    user = User.from_dict(data)
+                    self.cache.put(user)
+                    return user
+                
+                document = {**data, **fields}
+                if await self.gcs.write_json(user_path, document, if_generation_match=generation):
+                    user = User.from_dict(document)
+                    self.cache.put(user)
+                    await self._sync_indexes(user, changes, data)
+                    logger.info(f"Updated user {telegram_id} ({', '.join(sorted(changes))})")
+                    return user
+                
+                # Another instance saved first; our cached copy is stale
+                self.cache.invalidate(telegram_id)
+                await asyncio.sleep(random.uniform(0, settings.TASK_MUTATION_BACKOFF_MS / 1000))
+        except Exception as e:
+            logger.error(f"Failed to update user {telegram_id}: {e}")
+            self.cache.invalidate(telegram_id)
+            return None
+        
+        logger.error(f"Failed to update user {telegram_id} after {settings.TASK_MUTATION_MAX_ATTEMPTS} conflicting writes")
+        self.cache.invalidate(telegram_id)
+        return None
     
     async def get_or_create_user(
         self, 
@@ -69,89 +260,202 @@ class UserService:
         name: str, 
         username: Optional[str] = None
     ) -> User:
-        """Get existing user or create new one"""
+        """Get existing user or create new one
+        
+        The user document is only written when name or username changed or
+        when last_seen_at has not been saved for USER_LAST_SEEN_FLUSH_SEC;
+        otherwise the new last_seen_at is kept in the cache only.
+        """
         user = await self.get_user(telegram_id)
         if user:
             # Update last seen and potentially name/username
             user.update_last_seen()
-            if user.name != name:
-                user.name = name
-            if user.username != username:
-                user.username = username
-            await self.update_user(user)
+            user.name = name
+            user.username = username
+            if user.changed_fields() - {"lastSeenAt"} or self.cache.last_seen_due(user):
+                await self.update_user(user)
+            else:
+                self.cache.put(user, persisted=False)
             return user
         
         return await self.create_user(telegram_id, name, username)
     
     async def update_user_role(self, telegram_id: int, role: UserRole) -> bool:
-        """Update user role"""
-        user = await self.get_user(telegram_id)
-        if not user:
-            return False
-        
-        user.role = role
-        return await self.update_user(user)
+        """Update user role (applied to the stored document, not the cache)"""
+        return await self._update_fields(telegram_id, {"role": role.value}) is not None
     
     async def deactivate_user(self, telegram_id: int) -> bool:
-        """Deactivate user"""
-        user = await self.get_user(telegram_id)
-        if not user:
-            return False
-        
-        user.active = False
-        return await self.update_user(user)
+        """Deactivate user (applied to the stored document, not the cache)"""
+        return await self._update_fields(telegram_id, {"active": False}) is not None
     
     async def activate_user(self, telegram_id: int) -> bool:
-        """Activate user"""
-        user = await self.get_user(telegram_id)
-        if not user:
-            return False
-        
-        user.active = True
-        return await self.update_user(user)
+        """Activate user (applied to the stored document, not the cache)"""
+        return await self._update_fields(telegram_id, {"active": True}) is not None
     
     async def get_all_users(self) -> List[User]:
         """Get all users (alias for list_all_users)"""
         return await self.list_all_users()
     
     async def list_all_users(self) -> List[User]:
-        """List all users"""
+        """List all users from the roster, building it on first use"""
         try:
-            user_paths = await self.gcs.list_objects("users/")
-            users = []
-            
-            for path in user_paths:
-                if not path.endswith('.json'):
-                    continue
-                
-                data = await self.gcs.read_json(path)
-                if data:
-                    try:
-                        user = User.from_dict(data)
-                        users.append(user)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse user from {path}: {e}")
+            users = await self.roster.read()
+            if users is None:
+                users = await self._read_all_users()
+                await self.roster.rebuild(users, only_if_absent=True)
             
             # Sort by last seen (most recent first)
             users.sort(key=lambda u: u.last_seen_at or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
             return users
-            
+        
         except Exception as e:
             logger.error(f"Failed to list users: {e}")
             return []
     
+    async def _read_all_users(self) -> List[User]:
+        """Read every user document; storage errors propagate"""
+        user_paths = await self.gcs.list_objects("users/")
+        users = []
+        
+        for path in user_paths:
+            if not path.endswith('.json'):
+                continue
+            
+            data = await self.gcs.read_json(path)
+            if data:
+                try:
+                    user = User.from_dict(data)
+                    users.append(user)
+                    self.cache.put(user)
+                except Exception as e:
+                    logger.warning(f"Failed to parse user from {path}: {e}")
+        
+        return users
+    
     async def list_active_users(self) -> List[User]:
         """List only active users"""
         all_users = await self.list_all_users()
         return [user for user in all_users if user.active]
     
+    async def get_role_snapshot(self) -> Optional[RoleSnapshot]:
+        """Admin and inactive sets, building the role index on first use"""
+        try:
+            snapshot = await self.roles.load()
+            if snapshot is None and await self.roles.rebuild(await self._read_all_users(), only_if_absent=True):
+                snapshot = self.cache.roles
+            return snapshot
+        except Exception as e:
+            logger.error(f"Failed to load role index: {e}")
+            return None
+    
+    async def _sync_indexes(self, user: User, changes: Set[str], previous: Optional[Dict] = None):
+        """Bring the roster, role and lookup indexes in line with the fields just written
+        
+        previous is the document before the write; without it (a new user)
+        the roster entry is written regardless.
+        """
+        if changes & ROLE_FIELDS:
+            # Not decided on the cached snapshot, which may be stale; apply
+            # re-reads the index and skips the write if nothing changed
+            if await self.get_role_snapshot() is not None:
+                await self.roles.apply([user])
+        if "username" in changes:
+            await self._sync_username(user, (previous or {}).get("username"))
+        if changes & SEARCH_FIELDS:
+            self.cache.search = None
+        # Most saves are last-seen flushes, which the roster keeps per day
+        if previous is None or changes & ROSTER_FIELDS or roster_entry(user) != roster_entry(User.from_dict(previous)):
+            await self.roster.apply([user])
+    
+    def _username_path(self, username: str) -> str:
+        return f"index/users/username/{username.lstrip('@').lower()}.json"
+    
+    async def _sync_username(self, user: User, previous_username: Optional[str]):
+        """Point the user's username at it and drop the entry for a previous one"""
+        writes = []
+        if user.username:
+            writes.append(self.gcs.write_json(self._username_path(user.username), {"telegramId": user.telegram_id}))
+        if previous_username and previous_username.lower() != (user.username or "").lower():
+            path = self._username_path(previous_username)
+            entry = await self.gcs.read_json(path)
+            # Someone else may have taken the name since
+            if entry and entry.get("telegramId") == user.telegram_id:
+                writes.append(self.gcs.delete_object(path))
+        await asyncio.gather(*writes)
+    
+    async def find_by_username(self, username: str) -> Optional[User]:
+        """Resolve a @username through the username index
+        
+        A missing or stale entry falls back to the roster and repairs the
+        entry, so users saved before the index existed are still found.
+        """
+        wanted = username.lstrip('@').lower()
+        if not wanted:
+            return None
+        
+        try:
+            entry = await self.gcs.read_json(self._username_path(wanted))
+            if entry:
+                user = await self.get_user(entry["telegramId"])
+                if user and (user.username or "").lower() == wanted:
+                    return user
+            
+            users = await self.roster.read()
+            if users is None:
+                users = await self._read_all_users()
+            for user in users:
+                if (user.username or "").lower() == wanted:
+                    await self.gcs.write_json(self._username_path(wanted), {"telegramId": user.telegram_id})
+                    return user
+            return None
+        except Exception as e:
+            logger.error(f"Failed to look up username {username}: {e}")
+            return None
+    
+    async def search_users(self, query: str, limit: int = 10) -> List[User]:
+        """Users whose name, a word of it or username starts with query
+        
+        The prefix index is built from the roster and kept in the shared
+        cache for USER_CACHE_TTL_SEC, or until a local rename.
+        """
+        if not self.cache.search_fresh():
+            self.cache.search = UserSearchIndex(await self.list_all_users())
+        return self.cache.search.search(query, limit)
+    
+    async def rebuild_user_indexes(self) -> Dict:
+        """Rebuild the roster, role and username indexes from the user documents"""
+        users = await self._read_all_users()
+        semaphore = asyncio.Semaphore(settings.BULK_MAX_CONCURRENCY)
+        
+        async def write_username(user: User) -> bool:
+            async with semaphore:
+                return await self.gcs.write_json(self._username_path(user.username), {"telegramId": user.telegram_id})
+        
+        roster_ok, roles_ok, usernames = await asyncio.gather(
+            self.roster.rebuild(users),
+            self.roles.rebuild(users),
+            asyncio.gather(*(write_username(user) for user in users if user.username))
+        )
+        self.cache.search = None
+        return {"users": len(users), "roster": roster_ok, "roles": roles_ok, "usernames": all(usernames)}
+    
     async def list_admins(self) -> List[User]:
-        """List admin users"""
-        all_users = await self.list_all_users()
-        return [user for user in all_users if user.is_admin() and user.active]
+        """List active admin users"""
+        snapshot = await self.get_role_snapshot()
+        if snapshot is None:
+            all_users = await self.list_all_users()
+            return [user for user in all_users if user.is_admin() and user.active]
+        
+        admin_ids = sorted(snapshot.admins - snapshot.inactive)
+        users = await asyncio.gather(*(self.get_user(telegram_id) for telegram_id in admin_ids))
+        return [user for user in users if user and user.is_admin() and user.active]
     
     async def is_admin(self, telegram_id: int) -> bool:
-        """Check if user is admin"""
+        """Check if user is an active admin (answered from the role snapshot)"""
+        snapshot = await self.get_role_snapshot()
+        if snapshot is not None:
+            return snapshot.is_admin(telegram_id)
+        
         user = await self.get_user(telegram_id)
         return user is not None and user.is_admin() and user.active
     
@@ -164,39 +468,26 @@ class UserService:
     ):
         """Log admin action for audit trail"""
         try:
-            now = datetime.now(timezone.utc)
-            date_path = now.strftime("%Y/%m/%d")
-            audit_path = f"audit/{date_path}/{now.strftime('%H%M%S')}_{admin_telegram_id}.jsonl"
-            
-            audit_entry = {
-                "timestamp": now.isoformat(),
-                "adminTelegramId": admin_telegram_id,
-                "action": action,
-                "target": target,
-                "details": details
-            }
-            
-            await self.gcs.append_jsonl(audit_path, audit_entry)
-            logger.info(f"Logged admin action: {action} by {admin_telegram_id}")
-            
+            if await self.audit.record(admin_telegram_id, action, target, details):
+                logger.info(f"Logged admin action: {action} by {admin_telegram_id}")
+            else:
+                logger.error(f"Failed to log admin action: {action} by {admin_telegram_id}")
+        
         except Exception as e:
             logger.error(f"Failed to log admin action: {e}")
     
-    async def export_users_csv(self) -> str:
-        """Export users to CSV format"""
+    async def stream_users_csv(
+        self,
+        role: Optional[UserRole] = None,
+        active: Optional[bool] = None
+    ) -> AsyncIterator[str]:
+        """Export users matching the filters as CSV text chunks"""
         users = await self.list_all_users()
         
-        # CSV header
-        csv_lines = ["telegramId,name,username,role,active,lastSeenAt,createdAt"]
-        
-        for user in users:
-            line = f"{user.telegram_id}," \
-                   f'"{user.name}",' \
-                   f'"{user.username or ""}",' \
-                   f"{user.role.value}," \
-                   f"{user.active}," \
-                   f"{user.last_seen_at.isoformat() if user.last_seen_at else ''}," \
-                   f"{user.created_at.isoformat()}"
-            csv_lines.append(line)
+        async def rows():
+            for user in users:
+                if (role is None or user.role == role) and (active is None or user.active == active):
+                    yield user_csv_row(user)
         
-        return "\n".join(csv_lines)
\ No newline at end of file
+        async for chunk in stream_csv(USER_CSV_HEADER, rows()):
+            yield chunk
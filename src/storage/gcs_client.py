@@ -1,7 +1,9 @@
+import asyncio
 import json
 import logging
+import uuid
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from io import BytesIO
 
 from google.cloud import storage
@@ -10,7 +12,16 @@ from google.api_core.exceptions import RetryError
 
 logger = logging.getLogger(__name__)
 
+# GCS limit on the number of components of a composite object
+MAX_COMPOSE_COMPONENTS = 1024
+
 class GCSClient:
+    """Async facade over the GCS bucket.
+    
+    The google-cloud-storage calls are blocking, so they run in worker
+    threads; this lets callers overlap requests with asyncio.gather.
+    """
+    
     def __init__(self, bucket_name: str):
         self.bucket_name = bucket_name
         self.client = storage.Client()
@@ -20,15 +31,34 @@ class GCSClient:
         """Read JSON object from GCS"""
         try:
             blob = self.bucket.blob(path)
-            if not blob.exists():
+            if not await asyncio.to_thread(blob.exists):
                 return None
             
-            content = blob.download_as_text()
+            content = await asyncio.to_thread(blob.download_as_text)
             return json.loads(content)
         except Exception as e:
             logger.error(f"Failed to read JSON from {path}: {e}")
             return None
     
+    async def read_json_with_generation(self, path: str) -> Tuple[Optional[Dict], int]:
+        """Read JSON object together with its generation
+        
+        Returns (None, 0) when the object does not exist; generation 0 can be
+        passed to write_json to require that the object still does not exist.
+        """
+        try:
+            blob = await asyncio.to_thread(self.bucket.get_blob, path)
+            if blob is None:
+                return None, 0
+            
+            content = await asyncio.to_thread(
+                blob.download_as_text, if_generation_match=blob.generation
+            )
+            return json.loads(content), blob.generation
+        except Exception as e:
+            logger.error(f"Failed to read JSON from {path}: {e}")
+            return None, 0
+    
     async def write_json(self, path: str, data: Dict, if_generation_match: Optional[int] = None) -> bool:
         """Write JSON object to GCS with optional conditional write"""
         try:
@@ -36,13 +66,14 @@ class GCSClient:
             content = json.dumps(data, indent=2, default=str)
             
             if if_generation_match is not None:
-                blob.upload_from_string(
+                await asyncio.to_thread(
+                    blob.upload_from_string,
                     content, 
                     content_type='application/json',
                     if_generation_match=if_generation_match
                 )
             else:
-                blob.upload_from_string(content, content_type='application/json')
+                await asyncio.to_thread(blob.upload_from_string, content, content_type='application/json')
             
             return True
         except PreconditionFailed:
@@ -52,30 +83,76 @@ class GCSClient:
             logger.error(f"Failed to write JSON to {path}: {e}")
             return False
     
+    async def create_if_absent(self, path: str, data: Dict) -> Optional[bool]:
+        """Create a JSON object only if it does not exist yet
+        
+        Returns True if this call created it, False if it already existed and
+        None if the request failed.
+        """
+        try:
+            blob = self.bucket.blob(path)
+            await asyncio.to_thread(
+                blob.upload_from_string,
+                json.dumps(data, default=str),
+                content_type='application/json',
+                if_generation_match=0
+            )
+            return True
+        except PreconditionFailed:
+            return False
+        except Exception as e:
+            logger.error(f"Failed to create {path}: {e}")
+            return None
+    
     async def append_jsonl(self, path: str, data: Dict) -> bool:
         """Append JSON line to a JSONL file"""
         try:
             # Read existing content
             blob = self.bucket.blob(path)
             existing_content = ""
-            if blob.exists():
-                existing_content = blob.download_as_text()
+            if await asyncio.to_thread(blob.exists):
+                existing_content = await asyncio.to_thread(blob.download_as_text)
             
             # Append new line
             new_line = json.dumps(data, default=str) + "\n"
             updated_content = existing_content + new_line
             
-            blob.upload_from_string(updated_content, content_type='application/json')
+            await asyncio.to_thread(blob.upload_from_string, updated_content, content_type='application/json')
             return True
         except Exception as e:
             logger.error(f"Failed to append to JSONL {path}: {e}")
             return False
     
+    async def read_jsonl(self, path: str) -> Optional[List[Dict]]:
+        """Read a JSONL object, decoding it line by line
+        
+        Malformed lines (e.g. a torn append) are skipped. Returns None if the
+        object does not exist.
+        """
+        try:
+            blob = self.bucket.blob(path)
+            content = await asyncio.to_thread(blob.download_as_bytes)
+        except NotFound:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to read JSONL from {path}: {e}")
+            return None
+        
+        entries = []
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping malformed line in {path}")
+        return entries
+    
     async def upload_media(self, file_data: bytes, path: str, content_type: str) -> bool:
         """Upload media file to GCS"""
         try:
             blob = self.bucket.blob(path)
-            blob.upload_from_string(file_data, content_type=content_type)
+            await asyncio.to_thread(blob.upload_from_string, file_data, content_type=content_type)
             return True
         except Exception as e:
             logger.error(f"Failed to upload media to {path}: {e}")
@@ -85,29 +162,88 @@ class GCSClient:
         """Download media file from GCS"""
         try:
             blob = self.bucket.blob(path)
-            if not blob.exists():
+            if not await asyncio.to_thread(blob.exists):
                 return None
-            return blob.download_as_bytes()
+            return await asyncio.to_thread(blob.download_as_bytes)
         except Exception as e:
             logger.error(f"Failed to download media from {path}: {e}")
             return None
     
-    async def delete_object(self, path: str) -> bool:
-        """Delete object from GCS"""
+    async def delete_object(self, path: str, if_generation_match: Optional[int] = None) -> bool:
+        """Delete object from GCS, optionally only if it is still at a generation"""
         try:
             blob = self.bucket.blob(path)
-            if blob.exists():
-                blob.delete()
+            if if_generation_match is not None:
+                await asyncio.to_thread(blob.delete, if_generation_match=if_generation_match)
+            elif await asyncio.to_thread(blob.exists):
+                await asyncio.to_thread(blob.delete)
             return True
+        except PreconditionFailed:
+            logger.warning(f"Conditional delete failed for {path}")
+            return False
+        except NotFound:
+            return if_generation_match is None
         except Exception as e:
             logger.error(f"Failed to delete {path}: {e}")
             return False
     
+    async def append_bytes(self, path: str, data: bytes, content_type: str = 'application/gzip') -> Optional[int]:
+        """Append bytes to an object using compose
+        
+        Returns the offset the data starts at, or None if the object changed
+        concurrently, reached the composite component limit or the append
+        failed. The object is created if it does not exist.
+        """
+        def _append() -> Optional[int]:
+            blob = self.bucket.get_blob(path)
+            if blob is None:
+                self.bucket.blob(path).upload_from_string(
+                    data, content_type=content_type, if_generation_match=0
+                )
+                return 0
+            
+            if (blob.component_count or 1) >= MAX_COMPOSE_COMPONENTS:
+                return None
+            
+            chunk = self.bucket.blob(f"{path}.append-{uuid.uuid4().hex}")
+            chunk.upload_from_string(data, content_type=content_type)
+            try:
+                destination = self.bucket.blob(path)
+                destination.content_type = content_type
+                destination.compose([blob, chunk], if_generation_match=blob.generation)
+                return blob.size
+            finally:
+                chunk.delete()
+        
+        try:
+            return await asyncio.to_thread(_append)
+        except PreconditionFailed:
+            logger.warning(f"Concurrent append to {path}")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to append to {path}: {e}")
+            return None
+    
+    async def read_range(self, path: str, start: int, length: int) -> Optional[bytes]:
+        """Read length bytes of an object starting at start (ranged GET)"""
+        try:
+            blob = self.bucket.blob(path)
+            return await asyncio.to_thread(
+                blob.download_as_bytes, start=start, end=start + length - 1
+            )
+        except NotFound:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to read range of {path}: {e}")
+            return None
+    
     async def list_objects(self, prefix: str) -> List[str]:
         """List objects with given prefix"""
         try:
-            blobs = self.bucket.list_blobs(prefix=prefix)
-            return [blob.name for blob in blobs]
+            def _list() -> List[str]:
+                return [blob.name for blob in self.bucket.list_blobs(prefix=prefix)]
+            
+            return await asyncio.to_thread(_list)
         except Exception as e:
             logger.error(f"Failed to list objects with prefix {prefix}: {e}")
             return []
@@ -116,7 +252,7 @@ class GCSClient:
         """Create zero-byte marker file for indexing"""
         try:
             blob = self.bucket.blob(path)
-            blob.upload_from_string("", content_type='text/plain')
+            await asyncio.to_thread(blob.upload_from_string, "", content_type='text/plain')
             return True
         except Exception as e:
             logger.error(f"Failed to create index marker {path}: {e}")
@@ -136,8 +272,8 @@ class GCSClient:
                 # Try to read current counter
                 blob = self.bucket.blob(counter_path)
                 
-                if blob.exists():
-                    current_content = blob.download_as_text().strip()
+                if await asyncio.to_thread(blob.exists):
+                    current_content = (await asyncio.to_thread(blob.download_as_text)).strip()
                     current_num = int(current_content) if current_content else 0
                     generation = blob.generation
                 else:
@@ -168,10 +304,10 @@ class GCSClient:
         """Get blob metadata"""
         try:
             blob = self.bucket.blob(path)
-            if not blob.exists():
+            if not await asyncio.to_thread(blob.exists):
                 return None
             
-            blob.reload()
+            await asyncio.to_thread(blob.reload)
             return {
                 'size': blob.size,
                 'content_type': blob.content_type,
@@ -188,8 +324,8 @@ class GCSClient:
         """Delete a blob from GCS"""
         try:
             blob = self.bucket.blob(path)
-            if blob.exists():
-                blob.delete()
+            if await asyncio.to_thread(blob.exists):
+                await asyncio.to_thread(blob.delete)
                 logger.info(f"Deleted blob: {path}")
                 return True
             else:
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+
+class InMemoryGCS:
+    """In-memory stand-in for GCSClient with generation semantics"""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.generations: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        self._next_generation = 1
+
+    def _count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _put(self, path: str, content: bytes):
+        self.objects[path] = content
+        self.generations[path] = self._next_generation
+        self._next_generation += 1
+
+    async def read_json(self, path: str) -> Optional[Dict]:
+        self._count("read_json")
+        await asyncio.sleep(0)
+        if path not in self.objects:
+            return None
+        return json.loads(self.objects[path])
+
+    async def read_json_with_generation(self, path: str) -> Tuple[Optional[Dict], int]:
+        self._count("read_json")
+        await asyncio.sleep(0)
+        if path not in self.objects:
+            return None, 0
+        return json.loads(self.objects[path]), self.generations[path]
+
+    async def write_json(self, path: str, data: Dict, if_generation_match: Optional[int] = None) -> bool:
+        self._count("write_json")
+        await asyncio.sleep(0)
+        if if_generation_match is not None and self.generations.get(path, 0) != if_generation_match:
+            return False
+        self._put(path, json.dumps(data, default=str).encode())
+        return True
+
+    async def create_if_absent(self, path: str, data: Dict) -> Optional[bool]:
+        self._count("create_if_absent")
+        await asyncio.sleep(0)
+        if path in self.objects:
+            return False
+        self._put(path, json.dumps(data, default=str).encode())
+        return True
+    
+    async def append_jsonl(self, path: str, data: Dict) -> bool:
+        self._count("append_jsonl")
+        existing = self.objects.get(path, b"")
+        self._put(path, existing + (json.dumps(data, default=str) + "\n").encode())
+        return True
+
+    async def read_jsonl(self, path: str) -> Optional[List[Dict]]:
+        self._count("read_jsonl")
+        await asyncio.sleep(0)
+        if path not in self.objects:
+            return None
+        return [json.loads(line) for line in self.objects[path].splitlines() if line.strip()]
+
+    async def upload_media(self, file_data: bytes, path: str, content_type: str) -> bool:
+        self._count("upload_media")
+        await asyncio.sleep(0)
+        self._put(path, file_data)
+        return True
+
+    async def download_media(self, path: str) -> Optional[bytes]:
+        return self.objects.get(path)
+
+    async def delete_object(self, path: str, if_generation_match: Optional[int] = None) -> bool:
+        self._count("delete_object")
+        await asyncio.sleep(0)
+        if if_generation_match is not None and self.generations.get(path, 0) != if_generation_match:
+            return False
+        self.objects.pop(path, None)
+        self.generations.pop(path, None)
+        return True
+
+    async def append_bytes(self, path: str, data: bytes, content_type: str = "application/gzip") -> Optional[int]:
+        self._count("append_bytes")
+        await asyncio.sleep(0)
+        existing = self.objects.get(path, b"")
+        self._put(path, existing + data)
+        return len(existing)
+    
+    async def read_range(self, path: str, start: int, length: int) -> Optional[bytes]:
+        self._count("read_range")
+        if path not in self.objects:
+            return None
+        return self.objects[path][start:start + length]
+    
+    async def list_objects(self, prefix: str) -> List[str]:
+        self._count("list_objects")
+        return sorted(path for path in self.objects if path.startswith(prefix))
+
+    async def create_index_marker(self, path: str) -> bool:
+        self._count("create_index_marker")
+        self._put(path, b"")
+        return True
+
+    async def delete_index_marker(self, path: str) -> bool:
+        return await self.delete_object(path)
+
+    async def delete_blob(self, path: str) -> bool:
+        existed = path in self.objects
+        await self.delete_object(path)
+        return existed
+
+    async def get_next_uid(self) -> str:
+        current = int(self.objects.get("counters/uid.seq", b"0"))
+        self._put("counters/uid.seq", str(current + 1).encode())
+        return f"SJ{current + 1:04d}"
+
+
+@pytest.fixture
+def memory_gcs():
+    return InMemoryGCS()
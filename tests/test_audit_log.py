@@ -0,0 +1,67 @@
+import pytest
+from datetime import date, datetime, timezone
+from src.services import audit_log
+from src.services.audit_log import AuditLog
+
+
+async def record_at(log, monkeypatch, when, admin, action, target, details=None):
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return when
+    
+    monkeypatch.setattr(audit_log, "datetime", FixedDatetime)
+    await log.record(admin, action, target, details or {})
+    monkeypatch.setattr(audit_log, "datetime", datetime)
+
+
+@pytest.mark.asyncio
+async def test_query_filters_and_paginates_newest_first(memory_gcs, monkeypatch):
+    log = AuditLog(memory_gcs)
+    for day, hour, admin, action, target in [
+        (1, 9, 10, "change_status", "SJ0001"),
+        (1, 9, 10, "add_note", "SJ0002"),
+        (2, 8, 11, "delete_media", "SJ0001/a.jpg"),
+        (3, 7, 10, "promote_user", "42"),
+        (3, 8, 10, "change_status", "SJ0003"),
+    ]:
+        when = datetime(2026, 10, day, hour, tzinfo=timezone.utc)
+        await record_at(log, monkeypatch, when, admin, action, target)
+    
+    first = await log.query(date(2026, 10, 1), date(2026, 10, 3), limit=2)
+    assert [e["target"] for e in first["entries"]] == ["SJ0003", "42"]
+    rest = await log.query(date(2026, 10, 1), date(2026, 10, 3), limit=10, cursor=first["next_cursor"])
+    # Same-second entries share one object and come back newest first
+    assert [e["target"] for e in rest["entries"]] == ["SJ0001/a.jpg", "SJ0002", "SJ0001"]
+    assert rest["next_cursor"] is None
+    
+    by_admin = await log.query(date(2026, 10, 1), date(2026, 10, 3), admin_telegram_id=11)
+    assert [e["action"] for e in by_admin["entries"]] == ["delete_media"]
+    assert by_admin["objects_fetched"] == 1
+    
+    by_action = await log.query(date(2026, 10, 1), date(2026, 10, 3), action="change_status")
+    assert [e["target"] for e in by_action["entries"]] == ["SJ0003", "SJ0001"]
+
+
+@pytest.mark.asyncio
+async def test_target_query_uses_index_and_only_range_days(memory_gcs, monkeypatch):
+    log = AuditLog(memory_gcs)
+    for day in range(1, 11):
+        when = datetime(2026, 10, day, 12, tzinfo=timezone.utc)
+        await record_at(log, monkeypatch, when, 10, "add_note", f"SJ{day:04d}")
+    when = datetime(2026, 10, 5, 13, tzinfo=timezone.utc)
+    await record_at(log, monkeypatch, when, 10, "bulk_set_status", "2 tasks", {"uids": ["SJ0004", "SJ0009"]})
+    
+    lists = memory_gcs.calls.get("list_objects", 0)
+    result = await log.query(date(2026, 10, 4), date(2026, 10, 9), target="SJ0004")
+    
+    assert [e["action"] for e in result["entries"]] == ["bulk_set_status", "add_note"]
+    assert result["objects_fetched"] == 2
+    assert memory_gcs.calls["list_objects"] == lists + 6
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cursor", ["garbage", "garbage|3", "audit/2026/10/01/x.jsonl|-1", "audit/2026/13/40/x.jsonl|0"])
+async def test_query_rejects_malformed_cursor(memory_gcs, cursor):
+    with pytest.raises(ValueError):
+        await AuditLog(memory_gcs).query(date(2026, 10, 1), date(2026, 10, 3), cursor=cursor)
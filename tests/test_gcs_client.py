@@ -144,5 +144,62 @@ async def test_list_objects(gcs_client, mock_storage_client):
     assert result == ["test1.json", "test2.json"]
     mock_bucket.list_blobs.assert_called_with(prefix="test/")
 
+@pytest.mark.asyncio
+async def test_read_json_with_generation(gcs_client, mock_storage_client):
+    """Test JSON read returns the generation it was read at"""
+    mock_bucket = mock_storage_client['bucket']
+    mock_blob = Mock()
+    mock_blob.generation = 7
+    mock_blob.download_as_text.return_value = '{"test": "data"}'
+    mock_bucket.get_blob.return_value = mock_blob
+    
+    data, generation = await gcs_client.read_json_with_generation("test/path.json")
+    
+    assert data == {"test": "data"}
+    assert generation == 7
+    mock_blob.download_as_text.assert_called_with(if_generation_match=7)
+
+@pytest.mark.asyncio
+async def test_read_json_with_generation_missing(gcs_client, mock_storage_client):
+    """Test missing object reports generation 0"""
+    mock_storage_client['bucket'].get_blob.return_value = None
+    
+    assert await gcs_client.read_json_with_generation("missing.json") == (None, 0)
+
+@pytest.mark.asyncio
+async def test_append_bytes_composes_onto_existing_object(gcs_client, mock_storage_client):
+    """Test append composes a temporary chunk onto the object at its generation"""
+    mock_bucket = mock_storage_client['bucket']
+    existing = Mock()
+    existing.size = 120
+    existing.generation = 3
+    existing.component_count = 2
+    mock_bucket.get_blob.return_value = existing
+    mock_blob = mock_storage_client['blob']
+    
+    offset = await gcs_client.append_bytes("archive/pack.gz", b"data")
+    
+    assert offset == 120
+    mock_blob.compose.assert_called_once()
+    assert mock_blob.compose.call_args.kwargs["if_generation_match"] == 3
+    mock_blob.delete.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_read_range(gcs_client, mock_storage_client):
+    """Test ranged read passes an inclusive end offset"""
+    mock_blob = mock_storage_client['blob']
+    mock_blob.download_as_bytes.return_value = b"abc"
+    
+    assert await gcs_client.read_range("archive/pack.gz", 10, 3) == b"abc"
+    mock_blob.download_as_bytes.assert_called_with(start=10, end=12)
+
+@pytest.mark.asyncio
+async def test_read_jsonl_skips_malformed_lines(gcs_client, mock_storage_client):
+    """Test JSONL objects decode line by line, skipping torn lines"""
+    mock_blob = mock_storage_client['blob']
+    mock_blob.download_as_bytes.return_value = b'{"a": 1}\n{"a": 2\n\n{"a": 3}\n'
+    
+    assert await gcs_client.read_jsonl("audit/2026/10/01/120000_1.jsonl") == [{"a": 1}, {"a": 3}]
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,79 @@
+import pytest
+from datetime import datetime, timezone
+from src.models.task import Task, TaskStatus, TelegramUser, _UNDECODED
+
+@pytest.fixture
+def sample_user():
+    return TelegramUser(
+        telegram_id=12345,
+        name="Test User",
+        username="testuser"
+    )
+
+@pytest.fixture
+def stored_task(sample_user):
+    task = Task(uid="SJ0001", title="Stored", description="Body", created_by=sample_user)
+    task.add_assignee(TelegramUser(telegram_id=2, name="Worker"))
+    for i in range(5):
+        task.add_note(f"note {i}", sample_user)
+    task.change_status(TaskStatus.IN_PROGRESS, sample_user)
+    return task.to_dict()
+
+def test_from_dict_decodes_nothing_nested(stored_task):
+    """Scalar access does not decode nested sections or timestamps"""
+    task = Task.from_dict(stored_task)
+    
+    assert task.uid == "SJ0001"
+    assert task.status == TaskStatus.IN_PROGRESS
+    for name in ("created_by", "assignees", "notes", "media",
+                 "status_history", "created_at", "updated_at"):
+        assert getattr(task, f"_{name}") is _UNDECODED
+
+def test_to_dict_passes_untouched_sections_through(stored_task):
+    """Undecoded sections round-trip as the same objects"""
+    task = Task.from_dict(stored_task)
+    
+    data = task.to_dict()
+    
+    assert data == stored_task
+    assert data["notes"] is stored_task["notes"]
+    assert task._notes is _UNDECODED
+
+def test_decoded_sections_are_reencoded(stored_task, sample_user):
+    """Sections that were read and changed are written back"""
+    task = Task.from_dict(stored_task)
+    
+    task.add_note("new", sample_user)
+    task.updated_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    data = task.to_dict()
+    
+    assert [n["content"] for n in data["notes"]][-1] == "new"
+    assert data["notesCount"] == 6
+    assert data["timestamps"]["updatedAt"] == "2030-01-01T00:00:00+00:00"
+    assert data["timestamps"]["createdAt"] == stored_task["timestamps"]["createdAt"]
+    assert data["assignees"] is stored_task["assignees"]
+
+def test_inline_offsets_do_not_decode(stored_task):
+    """Segment offsets are computed from raw lengths"""
+    stored_task["notesCount"] = 40
+    task = Task.from_dict(stored_task)
+    
+    assert task.notes_offset == 35
+    assert task._notes is _UNDECODED
+
+def test_decoded_telegram_users_are_interned(stored_task):
+    """The same identity decodes to one shared TelegramUser"""
+    task = Task.from_dict(stored_task)
+    
+    authors = {id(n.author) for n in task.notes}
+    
+    assert len(authors) == 1
+    assert task.notes[0].author is task.created_by
+    assert task.status_history[0].changed_by is task.created_by
+
+def test_models_have_no_instance_dict(stored_task):
+    """Slotted models carry no per-instance __dict__"""
+    task = Task.from_dict(stored_task)
+    
+    for obj in (task, task.created_by, task.notes[0], task.status_history[0]):
+        assert not hasattr(obj, "__dict__")
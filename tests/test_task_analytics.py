@@ -0,0 +1,122 @@
+import pytest
+import numpy as np
+from src.services.task_analytics import summarize, STATUS_CODES, PRIORITY_CODES
+from src.services.task_service import TaskService
+from src.models.task import TaskStatus, Priority, TelegramUser
+from src.config import settings
+
+HOUR = 3600.0
+
+
+def make_row(transitions, priority=Priority.MEDIUM, assignees=()):
+    """transitions: [(status, hours since epoch)], starting with NEW"""
+    statuses = np.array([STATUS_CODES[s] for s, _ in transitions], dtype=np.int8)
+    times = np.array([h * HOUR for _, h in transitions])
+    return statuses, times, PRIORITY_CODES[priority], tuple(assignees)
+
+
+def test_summarize_durations_and_cycle_time():
+    """Time in status, cycle time and on-hold durations from flattened histories"""
+    rows = [
+        make_row([(TaskStatus.NEW, 0), (TaskStatus.IN_PROGRESS, 2), (TaskStatus.ON_HOLD, 5),
+                  (TaskStatus.IN_PROGRESS, 9), (TaskStatus.DONE, 10)], Priority.URGENT, [1, 2]),
+        make_row([(TaskStatus.NEW, 0), (TaskStatus.IN_PROGRESS, 1), (TaskStatus.DONE, 4)], Priority.URGENT, [1]),
+        # Still open: its current status runs until now
+        make_row([(TaskStatus.NEW, 10), (TaskStatus.ON_HOLD, 12)], Priority.LOW, [2]),
+    ]
+    
+    summary = summarize(rows, now=20 * HOUR)
+    
+    assert summary["tasks"] == 3
+    assert summary["cycle_time"]["count"] == 2
+    assert summary["cycle_time"]["mean_hours"] == 7.0
+    assert summary["on_hold"]["count"] == 2
+    assert summary["on_hold"]["p50_hours"] == 6.0
+    assert summary["time_in_status"]["in_progress"]["mean_hours"] == 3.5
+    assert summary["time_in_status"]["new"]["count"] == 3
+    assert "done" in summary["time_in_status"] and summary["time_in_status"]["done"]["mean_hours"] == 0
+    assert summary["by_priority"]["urgent"]["cycle_time"]["p90_hours"] == pytest.approx(9.4)
+    assert summary["by_priority"]["low"]["cycle_time"] is None
+    assert summary["by_assignee"]["1"]["tasks"] == 2
+    assert summary["by_assignee"]["2"]["on_hold"]["count"] == 2
+
+
+def test_summarize_percentiles_match_numpy():
+    """Grouped percentiles agree with np.percentile for every group"""
+    rng = np.random.default_rng(7)
+    rows = []
+    for i in range(500):
+        done_at = float(rng.integers(1, 1000))
+        rows.append(make_row(
+            [(TaskStatus.NEW, 0), (TaskStatus.DONE, done_at)],
+            list(Priority)[i % 4],
+            [i % 7]
+        ))
+    
+    summary = summarize(rows, now=2000 * HOUR)
+    
+    for code in range(7):
+        cycles = [r[1][1] / HOUR for r in rows if r[3] == (code,)]
+        stats = summary["by_assignee"][str(code)]["cycle_time"]
+        assert stats["count"] == len(cycles)
+        assert stats["p90_hours"] == pytest.approx(np.percentile(cycles, 90), abs=0.01)
+        assert stats["p50_hours"] == pytest.approx(np.percentile(cycles, 50), abs=0.01)
+
+
+def test_summarize_empty():
+    summary = summarize([], now=0)
+    assert summary["tasks"] == 0
+    assert summary["cycle_time"] is None
+    assert summary["by_assignee"] == {}
+
+
+@pytest.mark.asyncio
+async def test_analytics_cache_refreshes_incrementally(memory_gcs):
+    """Summary is cached and rows follow later mutations without a rescan"""
+    service = TaskService(memory_gcs)
+    user = TelegramUser(telegram_id=1, name="Admin")
+    first = await service.create_task(title="First", description="", created_by=user)
+    
+    summary = await service.get_task_analytics()
+    assert summary["tasks"] == 1
+    assert summary["cycle_time"] is None
+    assert await service.get_task_analytics() is summary
+    
+    lists_before = memory_gcs.calls["list_objects"]
+    second = await service.create_task(title="Second", description="", created_by=user)
+    await service.change_task_status(first.uid, TaskStatus.DONE, user)
+    summary = await service.get_task_analytics()
+    
+    assert summary["tasks"] == 2
+    assert summary["cycle_time"]["count"] == 1
+    # Rows came from the mutation hooks, not a rescan
+    assert memory_gcs.calls["list_objects"] == lists_before
+    
+    await service.delete_task(second.uid)
+    assert (await service.get_task_analytics())["tasks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_analytics_restart_reads_snapshot_and_refreshes_in_background(memory_gcs, monkeypatch):
+    """A new process answers from the saved rows; the refresh runs after the response"""
+    user = TelegramUser(telegram_id=1, name="Admin")
+    writer = TaskService(memory_gcs)
+    first = await writer.create_task(title="First", description="", created_by=user)
+    await writer.change_task_status(first.uid, TaskStatus.DONE, user)
+    await writer.get_task_analytics()
+    second = await writer.create_task(title="Second", description="", created_by=user)
+    
+    monkeypatch.setattr(settings, "ANALYTICS_REFRESH_SEC", 0)
+    service = TaskService(memory_gcs)
+    reads = memory_gcs.calls["read_json"]
+    summary = await service.get_task_analytics()
+    
+    # Only the snapshot was read; the task created since is not in it yet
+    assert memory_gcs.calls["read_json"] == reads + 1
+    assert summary["tasks"] == 1
+    assert summary["cycle_time"]["count"] == 1
+    
+    await service.analytics._refreshing
+    assert (await service.get_task_analytics())["tasks"] == 2
+    assert second.uid in (await memory_gcs.read_json("index/analytics/rows.json"))["rows"]
+    await service.analytics._refreshing
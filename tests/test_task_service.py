@@ -1,9 +1,19 @@
 import pytest
+import pytest_asyncio
 import asyncio
+import csv
+import io
+import json
+import random
+from datetime import datetime, timezone, timedelta
 from unittest.mock import AsyncMock, Mock
 from src.services.task_service import TaskService
-from src.models.task import Task, TaskStatus, TelegramUser
+from src.services.user_cache import UserCache
+from src.services.user_refs import UserRefResolver
+from src.services.user_service import UserService
+from src.models.task import Task, TaskStatus, Priority, TelegramUser
 from src.storage.gcs_client import GCSClient
+from src.config import settings
 
 @pytest.fixture
 def mock_gcs_client():
@@ -12,12 +22,19 @@ def mock_gcs_client():
     client.write_json = AsyncMock(return_value=True)
     client.create_index_marker = AsyncMock(return_value=True)
     client.read_json = AsyncMock()
+    
+    async def read_json_with_generation(path):
+        return await client.read_json(path), 1
+    
+    client.read_json_with_generation = AsyncMock(side_effect=read_json_with_generation)
     client.upload_media = AsyncMock(return_value=True)
     return client
 
 @pytest.fixture
 def task_service(mock_gcs_client):
-    return TaskService(mock_gcs_client)
+    service = TaskService(mock_gcs_client)
+    service.counters.record_change = AsyncMock(return_value=True)
+    return service
 
 @pytest.fixture
 def sample_user():
@@ -134,5 +151,680 @@ async def test_change_task_status(task_service, mock_gcs_client, sample_user):
     assert success is True
     mock_gcs_client.write_json.assert_called()
 
+@pytest.mark.asyncio
+async def test_done_status_schedules_media_retention(memory_gcs, sample_user):
+    """Marking a task done writes a retention index entry for its media"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(
+        title="Task with Media",
+        description="Description",
+        created_by=sample_user,
+        media_files=[{
+            'type': 'photo',
+            'filename': 'test.jpg',
+            'content_type': 'image/jpeg',
+            'data': b'fake image data'
+        }]
+    )
+    
+    assert await service.change_task_status(task.uid, TaskStatus.DONE, sample_user)
+    
+    entries = await memory_gcs.list_objects("index/retention/")
+    assert len(entries) == 1
+    entry = await memory_gcs.read_json(entries[0])
+    assert entry["uid"] == task.uid
+    assert entry["paths"] == ["media/SJ0001/test.jpg"]
+
+@pytest.mark.asyncio
+async def test_delete_expired_media_reads_only_due_buckets(memory_gcs, sample_user):
+    """Retention job deletes due media without scanning the tasks prefix"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(
+        title="Task with Media",
+        description="Description",
+        created_by=sample_user,
+        media_files=[{
+            'type': 'photo',
+            'filename': 'test.jpg',
+            'content_type': 'image/jpeg',
+            'data': b'fake image data'
+        }]
+    )
+    await service.create_task(title="Unrelated", description="", created_by=sample_user)
+    
+    # Schedule deletion in the past
+    past = datetime.now(timezone.utc) - timedelta(days=1)
+    task.media[0].delete_after = past
+    await service.update_task(task)
+    await service._schedule_media_retention(task.uid, task.media)
+    await memory_gcs.write_json("index/retention/cursor.json", {"day": past.date().isoformat()})
+    
+    result = await service.delete_expired_media()
+    
+    assert result["deleted_files"] == 1
+    assert result["checked_tasks"] == 1
+    assert result["completed"] is True
+    assert "media/SJ0001/test.jpg" not in memory_gcs.objects
+    # Only retention buckets were listed, never the tasks/ prefix
+    assert memory_gcs.calls["list_objects"] == 2
+    assert (await service.get_task(task.uid)).media == []
+    assert await memory_gcs.list_objects("index/retention/2") == []
+
+@pytest.mark.asyncio
+async def test_delete_expired_media_backfills_on_first_run(memory_gcs, sample_user):
+    """Without a cursor the job indexes legacy scheduled media first"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(
+        title="Legacy",
+        description="",
+        created_by=sample_user,
+        media_files=[{
+            'type': 'photo',
+            'filename': 'old.jpg',
+            'content_type': 'image/jpeg',
+            'data': b'old'
+        }]
+    )
+    task.media[0].delete_after = datetime.now(timezone.utc) - timedelta(days=3)
+    await service.update_task(task)
+    
+    result = await service.delete_expired_media()
+    
+    assert result["deleted_files"] == 1
+    assert "media/SJ0001/old.jpg" not in memory_gcs.objects
+
+@pytest.mark.asyncio
+async def test_delete_expired_media_resumes_after_time_budget(memory_gcs, sample_user):
+    """A run that hits its time budget leaves the rest for the next run"""
+    service = TaskService(memory_gcs)
+    past = datetime.now(timezone.utc) - timedelta(days=2)
+    for i in range(3):
+        task = await service.create_task(
+            title=f"Task {i}",
+            description="",
+            created_by=sample_user,
+            media_files=[{
+                'type': 'photo',
+                'filename': f'{i}.jpg',
+                'content_type': 'image/jpeg',
+                'data': b'x'
+            }]
+        )
+        task.media[0].delete_after = past
+        await service.update_task(task)
+        await service._schedule_media_retention(task.uid, task.media)
+    await memory_gcs.write_json("index/retention/cursor.json", {"day": past.date().isoformat()})
+    
+    stopped = await service.delete_expired_media(time_budget_seconds=0)
+    assert stopped["completed"] is False
+    assert stopped["remaining_tasks"] == 3
+    assert (await memory_gcs.read_json("index/retention/cursor.json"))["day"] == past.date().isoformat()
+    
+    resumed = await service.delete_expired_media(max_concurrency=2)
+    assert resumed["completed"] is True
+    assert resumed["deleted_files"] == 3
+    assert await memory_gcs.list_objects("media/") == []
+
+@pytest.mark.asyncio
+async def test_mutate_task_retries_on_generation_conflict(memory_gcs, sample_user):
+    """A conflicting write re-runs the mutation on the latest document"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Task", description="", created_by=sample_user)
+    
+    calls = []
+    
+    def apply(t):
+        calls.append(t.title)
+        if len(calls) == 1:
+            # Simulate a concurrent writer landing between our read and write
+            data = json.loads(memory_gcs.objects["tasks/SJ0001.json"])
+            data["title"] = "Renamed elsewhere"
+            memory_gcs._put("tasks/SJ0001.json", json.dumps(data).encode())
+        t.description = "updated"
+    
+    updated = await service.mutate_task(task.uid, apply)
+    
+    assert calls == ["Task", "Renamed elsewhere"]
+    assert updated.title == "Renamed elsewhere"
+    assert updated.description == "updated"
+
+@pytest.mark.asyncio
+async def test_concurrent_mutations_lose_no_updates(memory_gcs, sample_user, monkeypatch):
+    """Stress test: concurrent notes, assignments and status changes all land"""
+    monkeypatch.setattr(settings, "TASK_MUTATION_MAX_ATTEMPTS", 200)
+    monkeypatch.setattr(settings, "TASK_MUTATION_BACKOFF_MS", 1)
+    # Separate service instances stand in for separate Cloud Run instances
+    services = [TaskService(memory_gcs) for _ in range(4)]
+    service = services[0]
+    task = await service.create_task(title="Hot task", description="", created_by=sample_user)
+    
+    assignees = [TelegramUser(telegram_id=100 + i, name=f"Worker {i}") for i in range(10)]
+    operations = [services[i % 4].add_task_note(task.uid, f"note {i}", sample_user) for i in range(40)]
+    operations += [services[i % 4].assign_task(task.uid, a) for i, a in enumerate(assignees)]
+    operations.append(services[3].change_task_status(task.uid, TaskStatus.IN_PROGRESS, sample_user))
+    random.shuffle(operations)
+    
+    results = await asyncio.gather(*operations)
+    
+    assert all(results)
+    stored = await service.get_task(task.uid)
+    notes = await service.load_task_notes(stored)
+    assert sorted(n.content for n in notes) == sorted(f"note {i}" for i in range(40))
+    assert {a.telegram_id for a in stored.assignees} == {a.telegram_id for a in assignees}
+    assert stored.status == TaskStatus.IN_PROGRESS
+    assert len(await memory_gcs.list_objects("index/assignee/")) == 10
+    assert await memory_gcs.list_objects("index/status/new/") == []
+
+@pytest.mark.asyncio
+async def test_mutation_burst_coalesces_into_one_write(memory_gcs, sample_user):
+    """Mutations arriving together share one load/apply/save cycle"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Task", description="", created_by=sample_user)
+    writes_before = memory_gcs.calls["write_json"]
+    
+    results = await asyncio.gather(
+        service.add_task_note(task.uid, "first", sample_user),
+        service.change_task_status(task.uid, TaskStatus.IN_PROGRESS, sample_user),
+        service.mutate_task(task.uid, lambda t: setattr(t, "title", "Renamed")),
+    )
+    
+    assert results[0] is True and results[1] is True
+    assert results[2].title == "Renamed"
+    assert results[2].status == TaskStatus.IN_PROGRESS
+    assert [n.content for n in results[2].notes] == ["first"]
+    # One task document write plus one counter shard update
+    assert memory_gcs.calls["write_json"] - writes_before == 2
+
+@pytest.mark.asyncio
+async def test_failing_mutation_does_not_block_batch(memory_gcs, sample_user):
+    """A mutation that raises fails only its own caller"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Task", description="", created_by=sample_user)
+    
+    def broken(t):
+        raise ValueError("bad update")
+    
+    results = await asyncio.gather(
+        service.mutate_task(task.uid, broken),
+        service.add_task_note(task.uid, "kept", sample_user),
+        return_exceptions=True
+    )
+    
+    assert isinstance(results[0], ValueError)
+    assert results[1] is True
+    assert [n.content for n in (await service.get_task(task.uid)).notes] == ["kept"]
+
+@pytest.mark.asyncio
+async def test_notes_spill_into_segments(memory_gcs, sample_user, monkeypatch):
+    """Older notes move to segment objects and load back in order"""
+    monkeypatch.setattr(settings, "TASK_INLINE_ENTRIES", 3)
+    monkeypatch.setattr(settings, "TASK_SEGMENT_SIZE", 4)
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Long ticket", description="", created_by=sample_user)
+    
+    for i in range(20):
+        assert await service.add_task_note(task.uid, f"note {i}", sample_user)
+    
+    stored = await service.get_task(task.uid)
+    assert stored.notes_count == 20
+    assert len(stored.notes) < 3 + 4
+    assert stored.notes[-1].content == "note 19"
+    assert await memory_gcs.list_objects("segments/SJ0001/notes/")
+    
+    notes = await service.load_task_notes(stored)
+    assert [n.content for n in notes] == [f"note {i}" for i in range(20)]
+
+@pytest.mark.asyncio
+async def test_migrate_task_segments(memory_gcs, sample_user, monkeypatch):
+    """Existing documents with long inline history are migrated"""
+    monkeypatch.setattr(settings, "TASK_INLINE_ENTRIES", 2)
+    monkeypatch.setattr(settings, "TASK_SEGMENT_SIZE", 5)
+    service = TaskService(memory_gcs)
+    task = Task(uid="SJ0042", title="Legacy", description="", created_by=sample_user)
+    for i in range(12):
+        task.add_note(f"legacy {i}", sample_user)
+        task.change_status(TaskStatus.IN_PROGRESS if i % 2 == 0 else TaskStatus.ON_HOLD, sample_user)
+    legacy = task.to_dict()
+    del legacy["notesCount"], legacy["statusHistoryCount"]
+    await memory_gcs.write_json("tasks/SJ0042.json", legacy)
+    
+    result = await service.migrate_task_segments()
+    
+    assert result == {"checked_tasks": 1, "migrated_tasks": 1}
+    stored = await service.get_task("SJ0042")
+    assert len(stored.notes) == 2
+    assert stored.notes_count == 12
+    history = await service.load_task_history(stored)
+    assert [h.to_status for h in history] == [h.to_status for h in task.status_history]
+
+@pytest.mark.asyncio
+async def test_migrate_task_segments_spills_current_documents(memory_gcs, sample_user, monkeypatch):
+    """Documents that already have counts are spilled too; short ones are not rewritten"""
+    service = TaskService(memory_gcs)
+    task = Task(uid="SJ0043", title="Inline", description="", created_by=sample_user)
+    for i in range(12):
+        task.add_note(f"inline {i}", sample_user)
+    await memory_gcs.write_json("tasks/SJ0043.json", task.to_dict())
+    short = Task(uid="SJ0044", title="Short", description="", created_by=sample_user)
+    short.add_note("only", sample_user)
+    await memory_gcs.write_json("tasks/SJ0044.json", short.to_dict())
+    # The thresholds drop after the documents were written
+    monkeypatch.setattr(settings, "TASK_INLINE_ENTRIES", 2)
+    monkeypatch.setattr(settings, "TASK_SEGMENT_SIZE", 5)
+    writes = memory_gcs.calls["write_json"]
+    
+    result = await service.migrate_task_segments()
+    
+    assert result == {"checked_tasks": 2, "migrated_tasks": 1}
+    assert await memory_gcs.list_objects("segments/SJ0043/notes/")
+    # Two segments and the task document
+    assert memory_gcs.calls["write_json"] == writes + 3
+    stored = await service.get_task("SJ0043")
+    assert len(stored.notes) == 2
+    assert stored.updated_at == task.updated_at
+    notes = await service.load_task_notes(stored)
+    assert [n.content for n in notes] == [f"inline {i}" for i in range(12)]
+    
+    assert await service.migrate_task_segments() == {"checked_tasks": 2, "migrated_tasks": 0}
+
+@pytest_asyncio.fixture
+async def populated_service(memory_gcs, sample_user):
+    """Twelve tasks: every third assigned to 777, every fourth urgent"""
+    service = TaskService(memory_gcs)
+    worker = TelegramUser(telegram_id=777, name="Worker")
+    for i in range(12):
+        task = await service.create_task(title=f"Task {i}", description=f"pump {i}" if i % 2 else "", created_by=sample_user)
+        if i % 3 == 0:
+            await service.assign_task(task.uid, worker)
+        if i % 4 == 0:
+            await service.mutate_task(task.uid, lambda t: setattr(t, "priority", Priority.URGENT))
+        if i >= 6:
+            await service.change_task_status(task.uid, TaskStatus.IN_PROGRESS, sample_user)
+    return service
+
+@pytest.mark.asyncio
+async def test_query_tasks_combines_filters(populated_service, memory_gcs):
+    """Status, assignee, priority and text filters all apply together"""
+    result = await populated_service.query_tasks(
+        statuses=[TaskStatus.NEW, TaskStatus.IN_PROGRESS],
+        assignee_id=777,
+        priority=Priority.URGENT
+    )
+    
+    # Assigned: 0, 3, 6, 9 -> urgent: 0 -> SJ0001
+    assert [t.uid for t in result["tasks"]] == ["SJ0001"]
+    assert result["plan"]["intersected"][0] in ("status", "assignee", "priority")
+    assert result["plan"]["docs_fetched"] <= 4
+    
+    text_result = await populated_service.query_tasks(statuses=[TaskStatus.IN_PROGRESS], text="pump")
+    assert [t.uid for t in text_result["tasks"]] == ["SJ0008", "SJ0010", "SJ0012"]
+
+@pytest.mark.asyncio
+async def test_query_tasks_fetches_only_what_the_page_needs(populated_service):
+    result = await populated_service.query_tasks(limit=2)
+    assert [t.uid for t in result["tasks"]] == ["SJ0001", "SJ0002"]
+    assert result["plan"]["docs_fetched"] == 2
+    assert result["next_cursor"] == "SJ0002"
+    
+    # Every other task matches: SJ0001-3 hold one, then SJ0004-5 the other
+    text_result = await populated_service.query_tasks(text="pump", limit=2)
+    assert [t.uid for t in text_result["tasks"]] == ["SJ0002", "SJ0004"]
+    assert text_result["plan"]["docs_fetched"] == 5
+
+@pytest.mark.asyncio
+async def test_query_tasks_starts_from_most_selective_index(populated_service):
+    """With known cardinalities the small index drives the plan"""
+    await populated_service.query_tasks(statuses=[TaskStatus.NEW])
+    await populated_service.query_tasks(assignee_id=777)
+    
+    result = await populated_service.query_tasks(statuses=[TaskStatus.NEW], assignee_id=777)
+    
+    assert result["plan"]["intersected"][0] == "assignee"
+    assert [t.uid for t in result["tasks"]] == ["SJ0001", "SJ0004"]
+
+@pytest.mark.asyncio
+async def test_query_tasks_paginates_with_cursor(populated_service):
+    """Pages follow numeric UID order and fetch only what they need"""
+    first = await populated_service.query_tasks(statuses=[TaskStatus.NEW], limit=4)
+    second = await populated_service.query_tasks(statuses=[TaskStatus.NEW], limit=4, cursor=first["next_cursor"])
+    
+    assert [t.uid for t in first["tasks"]] == ["SJ0001", "SJ0002", "SJ0003", "SJ0004"]
+    assert [t.uid for t in second["tasks"]] == ["SJ0005", "SJ0006"]
+    assert second["next_cursor"] is None
+
+@pytest.mark.asyncio
+async def test_stream_tasks_csv_prefetches_within_limit(populated_service, monkeypatch):
+    """The export streams every match in UID order with bounded read-ahead"""
+    monkeypatch.setattr(settings, "EXPORT_MAX_CONCURRENCY", 3)
+    await populated_service.mutate_task("SJ0002", lambda t: setattr(t, "title", 'Pump, "big" one'))
+    
+    in_flight = peak = 0
+    read_task_data = populated_service._read_task_data
+    
+    async def counting_read(uid):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await read_task_data(uid)
+        finally:
+            in_flight -= 1
+    
+    monkeypatch.setattr(populated_service, "_read_task_data", counting_read)
+    chunks = [chunk async for chunk in populated_service.stream_tasks_csv()]
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    
+    assert rows[0][:3] == ["uid", "title", "description"]
+    assert [row[0] for row in rows[1:]] == [f"SJ{i:04d}" for i in range(1, 13)]
+    assert rows[2][1] == 'Pump, "big" one'
+    assert peak == 3
+    
+    filtered = "".join([chunk async for chunk in populated_service.stream_tasks_csv(assignee_id=777, text="pump")])
+    assert [row[0] for row in csv.reader(io.StringIO(filtered))][1:] == ["SJ0004", "SJ0010"]
+
+@pytest.mark.asyncio
+async def test_priority_creator_and_created_filters_use_indexes(populated_service, memory_gcs):
+    """Priority, creator and creation day resolve through index markers"""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    result = await populated_service.query_tasks(
+        priority=Priority.URGENT,
+        created_by=12345,
+        created_from=today
+    )
+    
+    assert [t.uid for t in result["tasks"]] == ["SJ0001", "SJ0005", "SJ0009"]
+    assert set(result["plan"]["intersected"]) == {"priority", "creator", "created"}
+    assert result["plan"]["scan"] is False
+    assert result["plan"]["docs_fetched"] == 3
+
+@pytest.mark.asyncio
+async def test_put_style_priority_change_moves_index_marker(populated_service, memory_gcs):
+    """Priority changes through mutate_task move the priority marker"""
+    await populated_service.mutate_task("SJ0002", lambda t: setattr(t, "priority", Priority.HIGH))
+    
+    assert "index/priority/high/SJ0002" in memory_gcs.objects
+    assert "index/priority/medium/SJ0002" not in memory_gcs.objects
+
+@pytest.mark.asyncio
+async def test_no_op_mutation_skips_write_and_side_effects(memory_gcs, sample_user):
+    """Setting fields to their stored values writes nothing; a title edit touches no index"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Fix pump", description="", created_by=sample_user)
+    calls_before = dict(memory_gcs.calls)
+    
+    same = await service.mutate_task(task.uid, lambda t: setattr(t, "title", "Fix pump"))
+    assert same.changes == frozenset()
+    assert memory_gcs.calls.get("write_json") == calls_before.get("write_json")
+    
+    renamed = await service.mutate_task(task.uid, lambda t: setattr(t, "title", "Fix big pump"))
+    assert renamed.changes == {"title"}
+    assert memory_gcs.calls["write_json"] == calls_before["write_json"] + 1
+    assert memory_gcs.calls["create_index_marker"] == calls_before["create_index_marker"]
+    assert renamed.changed_fields() == set()
+    
+    loaded = await service.get_task(task.uid)
+    assert await service.update_task(loaded)
+    assert memory_gcs.calls["write_json"] == calls_before["write_json"] + 1
+
+@pytest.mark.asyncio
+async def test_backfill_task_indices(memory_gcs, sample_user):
+    """Backfill creates missing markers and drops stale priority markers"""
+    service = TaskService(memory_gcs)
+    task = Task(uid="SJ0100", title="Legacy", description="", created_by=sample_user, priority=Priority.LOW)
+    await memory_gcs.write_json("tasks/SJ0100.json", task.to_dict())
+    await memory_gcs.create_index_marker("index/priority/urgent/SJ0100")
+    
+    result = await service.backfill_task_indices()
+    
+    assert result == {"indexed_tasks": 1, "stale_markers_removed": 1}
+    assert "index/priority/low/SJ0100" in memory_gcs.objects
+    assert "index/creator/12345/SJ0100" in memory_gcs.objects
+    assert await memory_gcs.list_objects("index/created/") == [
+        f"index/created/{task.created_at.strftime('%Y/%m/%d')}/SJ0100"
+    ]
+
+@pytest.mark.asyncio
+async def test_task_counters_follow_mutations(memory_gcs, sample_user):
+    """Counters and daily rollups track creates, transitions and deletes"""
+    service = TaskService(memory_gcs)
+    worker = TelegramUser(telegram_id=777, name="Worker")
+    tasks = [
+        await service.create_task(title=f"Task {i}", description="", created_by=sample_user)
+        for i in range(3)
+    ]
+    await service.assign_task(tasks[0].uid, worker)
+    await service.change_task_status(tasks[0].uid, TaskStatus.DONE, sample_user)
+    await service.mutate_task(tasks[1].uid, lambda t: setattr(t, "priority", Priority.URGENT))
+    await service.delete_task(tasks[2].uid)
+    
+    stats = await service.get_task_stats(days=1)
+    
+    assert stats["total"] == 2
+    assert stats["by_status"]["new"] == 1
+    assert stats["by_status"]["done"] == 1
+    assert stats["by_priority"]["urgent"] == 1
+    assert stats["by_assignee"] == {"777": 1}
+    assert stats["daily"][-1]["created"] == 3
+    assert stats["daily"][-1]["closed"] == 1
+
+@pytest.mark.asyncio
+async def test_reconcile_task_counters_rebuilds_from_indices(memory_gcs, sample_user):
+    """Reconciliation fixes drifted shards and collapses them into one"""
+    service = TaskService(memory_gcs)
+    for i in range(4):
+        await service.create_task(title=f"Task {i}", description="", created_by=sample_user)
+    # Simulate drift from a lost increment
+    await memory_gcs.write_json("counters/tasks/shard-01.json", {"status": {"new": 5}})
+    
+    result = await service.reconcile_task_counters()
+    stats = await service.get_task_stats(days=1)
+    
+    assert result["total"] == 4
+    assert stats["by_status"]["new"] == 4
+    assert stats["daily"][-1]["created"] == 4
+    assert await memory_gcs.read_json("counters/tasks/shard-01.json") == {}
+
+async def _close_and_backdate(memory_gcs, service, uid, status, user, days):
+    await service.change_task_status(uid, status, user)
+    path = f"tasks/{uid}.json"
+    data = json.loads(memory_gcs.objects[path])
+    data["timestamps"]["updatedAt"] = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    memory_gcs._put(path, json.dumps(data).encode())
+
+@pytest.mark.asyncio
+async def test_archive_closed_tasks_into_packs(memory_gcs, sample_user):
+    """Old closed tasks move to a monthly pack and stay readable by UID"""
+    import gzip
+    service = TaskService(memory_gcs)
+    tasks = [
+        await service.create_task(title=f"Task {i}", description="", created_by=sample_user)
+        for i in range(4)
+    ]
+    await _close_and_backdate(memory_gcs, service, tasks[0].uid, TaskStatus.DONE, sample_user, 120)
+    await _close_and_backdate(memory_gcs, service, tasks[1].uid, TaskStatus.CANCELED, sample_user, 120)
+    # Closed, but too recently
+    await _close_and_backdate(memory_gcs, service, tasks[2].uid, TaskStatus.DONE, sample_user, 5)
+    
+    result = await service.archive_closed_tasks(older_than_days=90)
+    
+    assert result == {"checked_tasks": 3, "archived_tasks": 2, "skipped_tasks": 0}
+    assert await memory_gcs.list_objects("tasks/") == [f"tasks/{tasks[2].uid}.json", f"tasks/{tasks[3].uid}.json"]
+    packs = await memory_gcs.list_objects("archive/packs/")
+    assert len(packs) == 1
+    # The pack as a whole is a valid gzipped JSON lines file
+    lines = gzip.decompress(memory_gcs.objects[packs[0]]).decode().splitlines()
+    assert sorted(json.loads(line)["uid"] for line in lines) == [tasks[0].uid, tasks[1].uid]
+    
+    archived = await service.get_task(tasks[1].uid)
+    assert archived.title == "Task 1"
+    assert archived.status == TaskStatus.CANCELED
+    assert memory_gcs.calls["read_range"] == 1
+    
+    done = await service.query_tasks(statuses=[TaskStatus.DONE])
+    assert sorted(t.uid for t in done["tasks"]) == [tasks[0].uid, tasks[2].uid]
+    
+    # Scans without an indexed filter include the archive
+    result = await service.query_tasks(text="task")
+    assert result["plan"]["scan"] and result["plan"]["archived"] == 2
+    assert sorted(t.uid for t in result["tasks"]) == sorted(t.uid for t in tasks)
+    exported = [row[0] for row in csv.reader(io.StringIO("".join([c async for c in service.stream_tasks_csv()])))]
+    assert exported[1:] == sorted(t.uid for t in tasks)
+    
+    # A second run only reads the closed task that is still hot
+    reads = memory_gcs.calls["read_json"]
+    assert await service.archive_closed_tasks(older_than_days=90) == {
+        "checked_tasks": 1, "archived_tasks": 0, "skipped_tasks": 0
+    }
+    assert memory_gcs.calls["read_json"] == reads + 1
+
+@pytest.mark.asyncio
+async def test_archived_task_restored_on_mutation_and_deleted(memory_gcs, sample_user):
+    """Mutating an archived task brings it back to tasks/; delete drops its index entry"""
+    service = TaskService(memory_gcs)
+    task = await service.create_task(title="Old", description="", created_by=sample_user)
+    await _close_and_backdate(memory_gcs, service, task.uid, TaskStatus.DONE, sample_user, 120)
+    await service.archive_closed_tasks(older_than_days=90)
+    
+    assert await service.change_task_status(task.uid, TaskStatus.IN_PROGRESS, sample_user, "Reopened")
+    restored = json.loads(memory_gcs.objects[f"tasks/{task.uid}.json"])
+    assert restored["status"] == "in_progress"
+    
+    assert await service.delete_task(task.uid)
+    assert await service.get_task(task.uid) is None
+    assert await service.archive.read_task(task.uid) is None
+
+@pytest.mark.asyncio
+async def test_bulk_update_tasks_reports_per_uid(memory_gcs, sample_user):
+    """Bulk operations run together, report each UID and share counter writes"""
+    service = TaskService(memory_gcs)
+    tasks = [
+        await service.create_task(title=f"Task {i}", description="", created_by=sample_user)
+        for i in range(6)
+    ]
+    uids = [t.uid for t in tasks] + ["SJ9999", tasks[0].uid]
+    writes_before = memory_gcs.calls["write_json"]
+    
+    results = await service.bulk_update_tasks(uids, "set_status", sample_user, status=TaskStatus.DONE)
+    
+    assert list(results) == [t.uid for t in tasks] + ["SJ9999"]
+    assert results["SJ9999"] == "Task not found or update failed"
+    assert all(results[t.uid] is None for t in tasks)
+    # Six task documents plus one coalesced counter shard write
+    assert memory_gcs.calls["write_json"] - writes_before == 7
+    assert (await service.get_task_stats(days=1))["by_status"]["done"] == 6
+    
+    worker = TelegramUser(telegram_id=777, name="Worker")
+    await service.bulk_update_tasks(uids[:3], "assign", sample_user, assignees=[worker])
+    results = await service.bulk_update_tasks(uids[:4], "unassign", sample_user, assignee_ids=[777])
+    assert all(error is None for error in results.values())
+    assert await memory_gcs.list_objects("index/assignee/777/") == []
+    
+    with pytest.raises(ValueError):
+        await service.bulk_update_tasks(uids, "set_priority", sample_user)
+
+@pytest.mark.asyncio
+async def test_create_task_uploads_album_within_byte_budget(memory_gcs, sample_user):
+    """Album uploads overlap, but never beyond the in-flight byte budget"""
+    from src.services.upload_budget import UploadBudget
+    service = TaskService(memory_gcs)
+    service._upload_budget = UploadBudget(2500)
+    in_flight = []
+    peak = 0
+    original_upload = memory_gcs.upload_media
+    
+    async def tracked_upload(file_data, path, content_type):
+        nonlocal peak
+        in_flight.append(path)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(path)
+        return await original_upload(file_data, path, content_type)
+    
+    memory_gcs.upload_media = tracked_upload
+    album = [
+        {"filename": f"{i}.jpg", "data": b"x" * 1000, "content_type": "image/jpeg", "type": "photo"}
+        for i in range(5)
+    ]
+    
+    task = await service.create_task(title="Album", description="", created_by=sample_user, media_files=album)
+    
+    assert peak == 2
+    assert [m.path for m in task.media] == [f"media/{task.uid}/{i}.jpg" for i in range(5)]
+    assert await memory_gcs.list_objects("index/status/new/") == [f"index/status/new/{task.uid}"]
+
+@pytest.mark.asyncio
+async def test_create_task_cleans_up_when_document_write_fails(memory_gcs, sample_user):
+    """A failed task write leaves no media or index markers behind"""
+    service = TaskService(memory_gcs)
+    original_write = memory_gcs.write_json
+    
+    async def failing_write(path, data, if_generation_match=None):
+        if path.startswith("tasks/"):
+            return False
+        return await original_write(path, data, if_generation_match)
+    
+    memory_gcs.write_json = failing_write
+    album = [{"filename": "a.jpg", "data": b"x", "content_type": "image/jpeg", "type": "photo"}]
+    
+    with pytest.raises(Exception):
+        await service.create_task(title="Broken", description="", created_by=sample_user, media_files=album)
+    
+    assert await memory_gcs.list_objects("media/") == []
+    assert await memory_gcs.list_objects("index/") == []
+
+@pytest.mark.asyncio
+async def test_user_refs_are_stored_as_ids_and_resolved_per_page(memory_gcs, monkeypatch):
+    """With TASK_USER_REFS documents hold telegram ids; names come from the roster"""
+    monkeypatch.setattr(settings, "TASK_USER_REFS", True)
+    users = UserService(memory_gcs, UserCache())
+    for telegram_id, name in ((1, "Ann"), (2, "Bea"), (3, "Cy")):
+        await users.create_user(telegram_id, name, f"user{telegram_id}")
+    await users.list_all_users()
+    
+    service = TaskService(memory_gcs)
+    uids = []
+    for i in range(3):
+        task = await service.create_task(title=f"Task {i}", description="", created_by=TelegramUser(1, "Ann", "user1"))
+        await service.mutate_task(task.uid, lambda t: t.add_note("checked", TelegramUser(2, "Bea", "user2")))
+        await service.mutate_task(task.uid, lambda t: t.change_status(TaskStatus.IN_PROGRESS, TelegramUser(3, "Cy")))
+        await service.assign_task(task.uid, TelegramUser(2, "Bea", "user2"))
+        uids.append(task.uid)
+    
+    stored = await memory_gcs.read_json(f"tasks/{uids[0]}.json")
+    assert stored["createdBy"] == {"telegramId": 1}
+    assert stored["assignees"] == [{"telegramId": 2}]
+    assert stored["notes"][0]["author"] == {"telegramId": 2}
+    assert stored["statusHistory"][0]["changedBy"] == {"telegramId": 3}
+    
+    # Decoded references encode back unchanged, so reloading writes nothing
+    reloaded = Task.from_dict(stored)
+    reloaded.notes, reloaded.status_history, reloaded.assignees, reloaded.created_by
+    assert reloaded.changed_fields() == set()
+    
+    # Re-sending the same assignees with full details, as PUT /tasks/{uid} does, is a no-op
+    writes = memory_gcs.calls["write_json"]
+    task = await service.mutate_task(uids[0], lambda t: setattr(t, "assignees", [TelegramUser(2, "Bea", "user2")]))
+    assert task.changes == frozenset()
+    assert memory_gcs.calls["write_json"] == writes
+    
+    await users.get_or_create_user(2, "Bea Renamed", "user2")
+    resolver = UserRefResolver(UserService(memory_gcs, UserCache()))
+    reads = memory_gcs.calls["read_json"]
+    tasks = await resolver.resolve([(await service.get_task(uid)).to_dict() for uid in uids])
+    # Three task documents and one read per roster shard holding their users
+    shards = {telegram_id % settings.USER_ROSTER_SHARDS for telegram_id in (1, 2, 3)}
+    assert memory_gcs.calls["read_json"] == reads + 3 + len(shards)
+    
+    assert tasks[2]["createdBy"] == {"telegramId": 1, "name": "Ann", "username": "user1"}
+    assert tasks[2]["notes"][0]["author"]["name"] == "Bea Renamed"
+    assert tasks[2]["statusHistory"][0]["changedBy"]["name"] == "Cy"
+    # The task's own document is left as stored
+    assert "name" not in (await service.get_task(uids[2])).to_dict()["createdBy"]
+    
+    chunks = [chunk async for chunk in service.stream_tasks_csv(user_refs=resolver)]
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert {(row[7], row[8]) for row in rows[1:]} == {("Ann", "Bea Renamed")}
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
@@ -0,0 +1,40 @@
+import pytest
+from src.bot.update_dedup import UpdateDeduplicator
+
+
+@pytest.mark.asyncio
+async def test_duplicate_update_suppressed_in_memory(memory_gcs):
+    """A redelivered update_id is rejected without touching GCS"""
+    dedup = UpdateDeduplicator(memory_gcs)
+    
+    assert await dedup.claim(1001) is True
+    writes = memory_gcs.calls["create_if_absent"]
+    assert await dedup.claim(1001) is False
+    
+    assert memory_gcs.calls["create_if_absent"] == writes
+    assert dedup.stats == {"processed": 1, "duplicates": 1, "shared_duplicates": 0}
+
+
+@pytest.mark.asyncio
+async def test_duplicate_update_suppressed_across_instances(memory_gcs):
+    """The shared marker catches a redelivery that lands on another instance"""
+    first = UpdateDeduplicator(memory_gcs)
+    second = UpdateDeduplicator(memory_gcs)
+    
+    assert await first.claim(2002) is True
+    assert await second.claim(2002) is False
+    assert second.stats["shared_duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_window_forgets_old_ids_and_release_allows_retry(memory_gcs):
+    dedup = UpdateDeduplicator(memory_gcs, window=2)
+    for update_id in (1, 2, 3):
+        await dedup.claim(update_id)
+    
+    assert 1 not in dedup._recent_ids
+    # Still caught by the shared marker
+    assert await dedup.claim(1) is False
+    
+    await dedup.release(3)
+    assert await dedup.claim(3) is True
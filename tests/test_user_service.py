@@ -0,0 +1,394 @@
+import csv
+import io
+import pytest
+from datetime import datetime, timezone
+from src.services.user_cache import UserCache
+from src.services.user_import import ImportTooLarge, iter_lines
+from src.services.user_service import UserService
+from src.models.user import UserRole
+from src.config import settings
+
+
+@pytest.mark.asyncio
+async def test_repeat_messages_do_no_user_io(memory_gcs):
+    """After the first message, get_or_create_user and is_admin hit the cache only"""
+    service = UserService(memory_gcs, UserCache())
+    await service.get_or_create_user(42, "Alice", "alice")
+    calls_before = dict(memory_gcs.calls)
+    
+    for _ in range(5):
+        user = await service.get_or_create_user(42, "Alice", "alice")
+        assert not await service.is_admin(42)
+    
+    assert memory_gcs.calls == calls_before
+    assert user.name == "Alice"
+
+
+@pytest.mark.asyncio
+async def test_profile_change_and_due_last_seen_are_written(memory_gcs, monkeypatch):
+    service = UserService(memory_gcs, UserCache())
+    await service.get_or_create_user(42, "Alice", "alice")
+    writes = memory_gcs.calls["write_json"]
+    
+    await service.get_or_create_user(42, "Alice Smith", "alice")
+    assert memory_gcs.calls["write_json"] == writes + 1
+    stored = await memory_gcs.read_json("users/42.json")
+    assert stored["name"] == "Alice Smith"
+    
+    monkeypatch.setattr(settings, "USER_LAST_SEEN_FLUSH_SEC", 0)
+    await service.get_or_create_user(42, "Alice Smith", "alice")
+    assert memory_gcs.calls["write_json"] == writes + 2
+
+
+@pytest.mark.asyncio
+async def test_cache_shared_between_services_and_expires(memory_gcs):
+    """A shared cache serves other UserService instances until the TTL runs out"""
+    cache = UserCache()
+    await UserService(memory_gcs, cache).get_or_create_user(7, "Bob")
+    reads = memory_gcs.calls.get("read_json", 0)
+    
+    assert (await UserService(memory_gcs, cache).get_user(7)).name == "Bob"
+    assert memory_gcs.calls.get("read_json", 0) == reads
+    
+    expired = UserCache(ttl_seconds=0)
+    await UserService(memory_gcs, expired).get_user(7)
+    await UserService(memory_gcs, expired).get_user(7)
+    assert memory_gcs.calls["read_json"] == reads + 2
+
+
+@pytest.mark.asyncio
+async def test_cached_user_is_a_copy(memory_gcs):
+    """Mutating a returned user does not change the cache until it is saved"""
+    service = UserService(memory_gcs, UserCache())
+    user = await service.create_user(9, "Carol")
+    user.name = "Changed"
+    
+    assert (await service.get_user(9)).name == "Carol"
+
+
+@pytest.mark.asyncio
+async def test_role_index_bootstraps_and_answers_admin_checks(memory_gcs):
+    """Existing users seed the role index once; later checks read no user documents"""
+    await UserService(memory_gcs, UserCache()).create_user(1, "Admin", role=UserRole.ADMIN)
+    await UserService(memory_gcs, UserCache()).create_user(2, "Worker")
+    
+    service = UserService(memory_gcs, UserCache())
+    assert await service.is_admin(1)
+    assert not await service.is_admin(2)
+    stored = await memory_gcs.read_json("index/users/roles.json")
+    assert stored["admins"] == [1] and stored["inactive"] == []
+    
+    calls_before = dict(memory_gcs.calls)
+    for _ in range(5):
+        assert await service.is_admin(1)
+        assert not await service.is_admin(3)
+    assert memory_gcs.calls == calls_before
+
+
+@pytest.mark.asyncio
+async def test_role_changes_update_index_and_snapshot(memory_gcs):
+    cache = UserCache()
+    service = UserService(memory_gcs, cache)
+    await service.create_user(1, "Admin", role=UserRole.ADMIN)
+    await service.create_user(2, "Worker")
+    
+    assert await service.update_user_role(2, UserRole.ADMIN)
+    assert await UserService(memory_gcs, cache).is_admin(2)
+    assert [u.telegram_id for u in await service.list_admins()] == [1, 2]
+    
+    assert await service.deactivate_user(1)
+    assert not await service.is_admin(1)
+    stored = await memory_gcs.read_json("index/users/roles.json")
+    assert stored["admins"] == [1, 2] and stored["inactive"] == [1]
+    
+    # Unrelated profile writes leave the index alone
+    writes = memory_gcs.calls["write_json"]
+    await service.get_or_create_user(2, "Worker Two")
+    assert memory_gcs.calls["write_json"] == writes + 1
+
+
+@pytest.mark.asyncio
+async def test_role_snapshot_revalidates_after_ttl(memory_gcs):
+    """Changes made by another instance show up once the snapshot expires"""
+    other = UserService(memory_gcs, UserCache())
+    await other.create_user(1, "Admin", role=UserRole.ADMIN)
+    
+    service = UserService(memory_gcs, UserCache(ttl_seconds=0))
+    assert await service.is_admin(1)
+    snapshot = service.cache.roles
+    assert await service.is_admin(1)
+    assert service.cache.roles.admins is snapshot.admins
+    
+    await other.update_user_role(1, UserRole.USER)
+    assert not await service.is_admin(1)
+
+
+@pytest.mark.asyncio
+async def test_role_change_on_instance_with_stale_snapshot_reaches_index(memory_gcs):
+    """A demotion is recorded even when the local snapshot still shows the old role"""
+    first = UserService(memory_gcs, UserCache())
+    await first.create_user(2, "Worker")
+    second = UserService(memory_gcs, UserCache())
+    assert not await second.is_admin(2)
+    
+    assert await first.update_user_role(2, UserRole.ADMIN)
+    # second's cached snapshot still says "not admin", which is what it demotes to
+    assert await second.update_user_role(2, UserRole.USER)
+    
+    assert (await memory_gcs.read_json("index/users/roles.json"))["admins"] == []
+    assert not await UserService(memory_gcs, UserCache()).is_admin(2)
+
+
+@pytest.mark.asyncio
+async def test_stale_cached_user_does_not_undo_other_instance_writes(memory_gcs, monkeypatch):
+    """Saves apply only the changed fields on top of the stored document"""
+    first = UserService(memory_gcs, UserCache())
+    second = UserService(memory_gcs, UserCache())
+    await first.create_user(3, "Worker", role=UserRole.ADMIN)
+    await second.get_or_create_user(3, "Worker")
+    
+    assert await first.update_user_role(3, UserRole.USER)
+    assert await first.deactivate_user(3)
+    
+    # second still caches an active admin; its last-seen flush must not bring it back
+    monkeypatch.setattr(settings, "USER_LAST_SEEN_FLUSH_SEC", 0)
+    user = await second.get_or_create_user(3, "Worker")
+    stored = await memory_gcs.read_json("users/3.json")
+    assert stored["role"] == "user" and stored["active"] is False
+    assert stored["lastSeenAt"] == user.to_dict()["lastSeenAt"]
+    assert user.role == UserRole.USER and not user.active
+    
+    # Unblocking from a stale "active" copy still writes the document
+    assert await first.activate_user(3)
+    assert await second.deactivate_user(3)
+    assert (await memory_gcs.read_json("users/3.json"))["active"] is False
+
+
+@pytest.mark.asyncio
+async def test_roster_lists_users_with_one_read_per_shard(memory_gcs):
+    """After the roster is built, listing is one GET per shard and sees later changes"""
+    for telegram_id, name in [(1, "Ann"), (2, "Ben"), (3, "Cid")]:
+        await UserService(memory_gcs, UserCache()).create_user(telegram_id, name)
+    
+    service = UserService(memory_gcs, UserCache())
+    assert {u.name for u in await service.list_all_users()} == {"Ann", "Ben", "Cid"}
+    
+    await service.get_or_create_user(2, "Benjamin")
+    await service.create_user(4, "Dee")
+    
+    reads = memory_gcs.calls["read_json"]
+    users = await UserService(memory_gcs, UserCache()).list_all_users()
+    assert memory_gcs.calls["read_json"] == reads + settings.USER_ROSTER_SHARDS
+    assert users[0].name == "Dee"
+    assert {u.name for u in users} == {"Ann", "Benjamin", "Cid", "Dee"}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_user_indexes_recovers_from_user_documents(memory_gcs, monkeypatch):
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(1, "Admin", role=UserRole.ADMIN)
+    await service.list_all_users()
+    
+    # A user document written behind the service's back, and a new shard count
+    await memory_gcs.write_json("users/2.json", {"telegramId": 2, "name": "Stray", "active": False})
+    monkeypatch.setattr(settings, "USER_ROSTER_SHARDS", 2)
+    
+    result = await service.rebuild_user_indexes()
+    assert result == {"users": 2, "roster": True, "roles": True, "usernames": True}
+    assert {u.telegram_id for u in await service.list_all_users()} == {1, 2}
+    stored = await memory_gcs.read_json("index/users/roles.json")
+    assert stored["admins"] == [1] and stored["inactive"] == [2]
+
+
+@pytest.mark.asyncio
+async def test_stream_users_csv_filters_and_escapes(memory_gcs):
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(1, 'Ann "The Boss", Sr.', role=UserRole.ADMIN)
+    await service.create_user(2, "Ben")
+    await service.deactivate_user(2)
+    
+    text = "".join([chunk async for chunk in service.stream_users_csv(active=True)])
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0][0] == "telegramId"
+    assert [row[:2] for row in rows[1:]] == [["1", 'Ann "The Boss", Sr.']]
+    
+    text = "".join([chunk async for chunk in service.stream_users_csv(role=UserRole.USER)])
+    assert [row[0] for row in csv.reader(io.StringIO(text))][1:] == ["2"]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_user_is_not_rewritten(memory_gcs):
+    """Re-activating an active user or resending its role writes nothing"""
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(5, "Eve")
+    await service.list_all_users()
+    writes = memory_gcs.calls["write_json"]
+    
+    assert await service.activate_user(5)
+    assert await service.update_user_role(5, UserRole.USER)
+    assert memory_gcs.calls["write_json"] == writes
+    
+    # A real change writes the user and its roster shard
+    user = await service.get_user(5)
+    user.name = "Eve Adams"
+    assert user.changed_fields() == {"name"}
+    assert await service.update_user(user)
+    assert memory_gcs.calls["write_json"] == writes + 2
+
+
+@pytest.mark.asyncio
+async def test_last_seen_flushes_reach_the_roster_once_a_day(memory_gcs):
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(6, "Finn")
+    await service.list_all_users()
+    
+    user = await service.get_user(6)
+    user.last_seen_at = datetime(2099, 3, 2, 8, 0, tzinfo=timezone.utc)
+    assert await service.update_user(user)
+    writes = memory_gcs.calls["write_json"]
+    
+    # A later flush the same day writes only the user document
+    user.last_seen_at = datetime(2099, 3, 2, 17, 30, tzinfo=timezone.utc)
+    assert await service.update_user(user)
+    assert memory_gcs.calls["write_json"] == writes + 1
+    assert (await memory_gcs.read_json("users/6.json"))["lastSeenAt"] == "2099-03-02T17:30:00+00:00"
+    
+    assert (await service.roster.get([6]))[6].last_seen_at == datetime(2099, 3, 2, tzinfo=timezone.utc)
+    
+    user.last_seen_at = datetime(2099, 3, 3, 9, 0, tzinfo=timezone.utc)
+    assert await service.update_user(user)
+    assert memory_gcs.calls["write_json"] == writes + 3
+
+
+@pytest.mark.asyncio
+async def test_get_users_batches_cache_roster_and_documents(memory_gcs):
+    """Cache hits cost nothing, other known users one roster read, strays a document read"""
+    writer = UserService(memory_gcs, UserCache())
+    for telegram_id in range(1, 9):
+        await writer.create_user(telegram_id, f"Worker {telegram_id}")
+    await writer.list_all_users()
+    await memory_gcs.write_json("users/9.json", {"telegramId": 9, "name": "Not in roster"})
+    
+    service = UserService(memory_gcs, UserCache())
+    await service.get_user(1)
+    reads = memory_gcs.calls["read_json"]
+    
+    found, missing = await service.get_users([1, 2, 3, 4, 5, 6, 7, 8, 9, 404, 2])
+    
+    assert sorted(found) == list(range(1, 10))
+    assert found[9].name == "Not in roster"
+    assert missing == [404]
+    # One read per roster shard holding 2-8, plus users/9.json and users/404.json
+    shards = {telegram_id % settings.USER_ROSTER_SHARDS for telegram_id in range(2, 9)}
+    assert memory_gcs.calls["read_json"] == reads + len(shards) + 2
+    
+    # Roster entries are not cached, so get_user still reads the document
+    assert service.cache.get(2) is None
+
+
+@pytest.mark.asyncio
+async def test_username_index_follows_renames(memory_gcs):
+    service = UserService(memory_gcs, UserCache())
+    await service.get_or_create_user(1, "Ann Smith", "annie")
+    assert (await service.find_by_username("@Annie")).telegram_id == 1
+    
+    await service.get_or_create_user(1, "Ann Smith", "asmith")
+    assert await memory_gcs.read_json("index/users/username/annie.json") is None
+    assert await service.find_by_username("annie") is None
+    
+    reads = memory_gcs.calls["read_json"]
+    assert (await UserService(memory_gcs, service.cache).find_by_username("@asmith")).telegram_id == 1
+    assert memory_gcs.calls["read_json"] == reads + 1
+
+
+@pytest.mark.asyncio
+async def test_find_by_username_repairs_missing_entry(memory_gcs):
+    """Users stored before the index existed are found via the roster"""
+    await memory_gcs.write_json("users/3.json", {"telegramId": 3, "name": "Old Timer", "username": "oldie"})
+    service = UserService(memory_gcs, UserCache())
+    
+    assert (await service.find_by_username("@oldie")).telegram_id == 3
+    assert await memory_gcs.read_json("index/users/username/oldie.json") == {"telegramId": 3}
+
+
+@pytest.mark.asyncio
+async def test_search_users_by_name_word_and_username_prefix(memory_gcs):
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(1, "Ann Smith", "asmith")
+    await service.create_user(2, "Andrew Jones", "drew")
+    await service.create_user(3, "Bob Anders")
+    
+    assert {u.telegram_id for u in await service.search_users("an")} == {1, 2, 3}
+    assert [u.telegram_id for u in await service.search_users("smi")] == [1]
+    assert [u.telegram_id for u in await service.search_users("@dr")] == [2]
+    assert len(await service.search_users("an", limit=2)) == 2
+    
+    reads = memory_gcs.calls["read_json"]
+    await service.search_users("bob")
+    assert memory_gcs.calls["read_json"] == reads
+    
+    # A local rename drops the cached index
+    await service.get_or_create_user(3, "Robert Anders")
+    assert [u.telegram_id for u in await service.search_users("rob")] == [3]
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_import_users_from_csv_reports_each_row(memory_gcs):
+    service = UserService(memory_gcs, UserCache())
+    await service.create_user(5, "Already Here")
+    await service.list_all_users()
+    roster_writes = memory_gcs.calls["write_json"]
+    
+    body = (
+        "\ufefftelegramId,name,username,role,active\r\n"
+        "1,Ann Smith,@asmith,admin,true\n"
+        "2,Zoë,,user,false\n"
+        "5,Someone Else,,user,\n"
+        "1,Ann Again,,user,\n"
+        "x,Bad Id,,user,\n"
+        "3,Carol,,owner,\n"
+    ).encode()
+    # Split inside the BOM, mid-line and inside a multi-byte character
+    cut = body.index("ë".encode()) + 1
+    lines = iter_lines(_chunks(body[:1], body[1:40], body[40:cut], body[cut:]))
+    result = await service.import_users(lines, "csv")
+    
+    assert [row["status"] for row in result["rows"]] == ["created", "created", "exists", "duplicate", "invalid", "invalid"]
+    assert result["counts"] == {"created": 2, "exists": 1, "duplicate": 1, "invalid": 2}
+    assert result["rows"][5]["error"] == "invalid role 'owner'"
+    
+    assert (await service.get_user(2)).name == "Zoë"
+    assert (await service.get_user(5)).name == "Already Here"
+    assert {u.telegram_id for u in await UserService(memory_gcs, UserCache()).list_all_users()} == {1, 2, 5}
+    assert await service.is_admin(1)
+    assert (await service.find_by_username("asmith")).telegram_id == 1
+    # One write per roster shard and one role index write for the whole batch, plus the username entry
+    shards = {telegram_id % settings.USER_ROSTER_SHARDS for telegram_id in (1, 2)}
+    assert memory_gcs.calls["write_json"] == roster_writes + len(shards) + 2
+
+
+@pytest.mark.asyncio
+async def test_import_users_from_jsonl(memory_gcs, monkeypatch):
+    service = UserService(memory_gcs, UserCache())
+    body = b'{"telegram_id": 7, "name": "Dana"}\nnot json\n[1]\n\n{"id": 8, "name": ""}\n'
+    result = await service.import_users(iter_lines(_chunks(body)), "jsonl")
+    
+    assert [(row["row"], row["status"], row["error"]) for row in result["rows"]] == [
+        (1, "created", None),
+        (2, "invalid", "invalid JSON"),
+        (3, "invalid", "expected a JSON object"),
+        (4, "invalid", "name is required"),
+    ]
+    assert (await service.get_user(7)).role == UserRole.USER
+    
+    # Over the limit nothing is written, not even the rows before it
+    monkeypatch.setattr(settings, "USER_IMPORT_MAX_ROWS", 2)
+    body = b'{"id": 20, "name": "Eve"}\n{"id": 21, "name": "Finn"}\n{"id": 22, "name": "Gus"}\n'
+    with pytest.raises(ImportTooLarge):
+        await service.import_users(iter_lines(_chunks(body)), "jsonl")
+    assert await memory_gcs.read_json("users/20.json") is None